@@ -13,6 +13,7 @@ setup(name = 'txsc',
     author_email = 'kefkius@maza.club',
     url = 'https://github.com/kefkius/txsc',
     packages = find_packages(),
+    package_data = {'txsc.ir': ['*.json', '*.rules']},
     install_requires = requirements,
     entry_points = {
         'console_scripts': [
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Measures how long it takes to import txsc modules and compile a script.
+
+Each measurement is made in a fresh interpreter, since imports are only
+slow the first time. The modules that were loaded are listed so that
+heavy dependencies (e.g. python-bitcoinlib) can be spotted.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Script that runs in each child interpreter.
+child_script = r'''
+import json, logging, sys, time
+logging.getLogger('txsc').addHandler(logging.NullHandler())
+start = time.time()
+exec(sys.argv[1])
+elapsed = time.time() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(m for m in sys.modules if sys.modules[m] is not None)}))
+'''
+
+benchmarks = [
+    ('import formats', 'from txsc.ir import formats'),
+    ('import script_compiler', 'from txsc import script_compiler'),
+    ('compile to asm', "from txsc.script_compiler import ScriptCompiler\n"
+                       "c = ScriptCompiler(); c.setup_options({'target_lang': 'asm', 'config_file': '-'})\n"
+                       "c.compile(['verify 2 + 5 == 7;'])"),
+    ('compile to btc', "from txsc.script_compiler import ScriptCompiler\n"
+                       "c = ScriptCompiler(); c.setup_options({'target_lang': 'btc', 'config_file': '-'})\n"
+                       "c.compile(['verify 2 + 5 == 7;'])"),
+]
+
+def measure(code):
+    """Run code in a fresh interpreter and return its results."""
+    output = subprocess.check_output([sys.executable, '-c', child_script, code])
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure txsc import times.')
+    parser.add_argument('-n', '--runs', dest='runs', metavar='RUNS', type=int, default=5, help='Number of runs per benchmark (Default: %(default)s).')
+    parser.add_argument('--modules', dest='show_modules', action='store_true', default=False, help='List the third-party modules that each benchmark loads.')
+    args = parser.parse_args()
+
+    for name, code in benchmarks:
+        results = [measure(code) for _ in range(args.runs)]
+        times = sorted(i['elapsed'] * 1000 for i in results)
+        modules = results[-1]['modules']
+        bitcoinlib = any(m == 'bitcoin' or m.startswith('bitcoin.') for m in modules)
+        print('{:<24} best {:7.2f} ms  median {:7.2f} ms  python-bitcoinlib loaded: {}'.format(
+            name, times[0], times[len(times) // 2], 'yes' if bitcoinlib else 'no'))
+        if args.show_modules:
+            third_party = sorted(set(m.split('.')[0] for m in modules if not m.startswith('txsc')))
+            print('    %s' % ', '.join(third_party))
+
+if __name__ == '__main__':
+    main()
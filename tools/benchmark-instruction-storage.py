@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Compares the storage types of linear instructions.
+
+LInstructions stores instructions in a list, and ChunkedLInstructions stores
+them in chunks. Each workload is timed for both types at increasing script
+lengths, and the first length at which chunked storage is faster (the
+crossover point) is reported.
+"""
+
+import argparse
+import random
+import time
+
+from txsc.ir.instructions import LInstructions, ChunkedLInstructions
+from txsc.ir.linear_optimizer import PeepholeOptimizer
+import txsc.ir.linear_nodes as types
+
+storage_classes = [LInstructions, ChunkedLInstructions]
+
+def random_edits(cls, length, count=2000):
+    """Replace and insert instructions at random indices, reading the instructions at each."""
+    instructions = cls([types.Add() for _ in range(length)])
+    rng = random.Random(length)
+    start = time.time()
+    for _ in range(count):
+        i = rng.randrange(len(instructions) - 2)
+        instructions[i], instructions[i + 1]
+        instructions.replace_slice(i, i + 2, [types.Sub()])
+        instructions.insert(i, types.Add())
+    return time.time() - start
+
+def peephole_optimization(cls, length):
+    """Optimize a script in which most instructions are removed."""
+    block = [types.Five(), types.Six()] + [types.Swap() for _ in range(10)] + [types.Add(), types.Verify()]
+    instructions = cls([op.__class__() for _ in range(max(1, length // len(block))) for op in block])
+    start = time.time()
+    PeepholeOptimizer().optimize(instructions)
+    return time.time() - start
+
+def iteration(cls, length, count=20):
+    """Iterate over instructions."""
+    instructions = cls([types.Add() for _ in range(length)])
+    start = time.time()
+    for _ in range(count):
+        for op in instructions:
+            pass
+    return time.time() - start
+
+workloads = [
+    ('random edits', random_edits, [1000, 10000, 100000, 1000000]),
+    ('peephole optimization', peephole_optimization, [1000, 10000, 50000]),
+    ('iteration', iteration, [1000, 10000, 100000]),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the storage types of linear instructions.')
+    parser.add_argument('-n', '--runs', dest='runs', metavar='RUNS', type=int, default=3, help='Number of runs per measurement (Default: %(default)s).')
+    parser.add_argument('--lengths', dest='lengths', metavar='LENGTH', type=int, nargs='+', help='Script lengths to measure (Default: depends on the workload).')
+    args = parser.parse_args()
+
+    for name, func, default_lengths in workloads:
+        print(name)
+        crossover = None
+        for length in args.lengths or default_lengths:
+            times = [min(func(cls, length) for _ in range(args.runs)) * 1000 for cls in storage_classes]
+            print('    {:>9} ops  {}'.format(length, '  '.join('{} {:9.2f} ms'.format(cls.__name__, t) for cls, t in zip(storage_classes, times))))
+            if crossover is None and times[1] < times[0]:
+                crossover = length
+        print('    crossover: %s' % ('%d ops' % crossover if crossover is not None else 'none'))
+
+if __name__ == '__main__':
+    main()
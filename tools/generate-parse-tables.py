@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""Generates the lexer and parser tables and the peephole matchers that txsc uses.
+
+Tables and matchers are written to the txsc cache directory. Running this at
+build or deployment time means that no compilation has to generate them.
+Peephole matchers are compiled from the rule files of every opcode set.
+"""
+
+import argparse
+import os
+
+from txsc import cache, config
+from txsc.txscript import ScriptParser
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the lexer and parser tables and the peephole matchers that txsc uses.')
+    parser.add_argument('--cache-dir', dest='cache_dir', metavar='CACHE_DIR', type=str, help='Cache directory to write tables to.')
+    args = parser.parse_args()
+
+    if args.cache_dir:
+        os.environ['TXSC_CACHE_DIR'] = args.cache_dir
+    cache_dir = cache.get_cache_dir()
+    if not cache_dir:
+        parser.exit(1, 'No writable cache directory exists.\n')
+
+    ScriptParser()
+    config.load_entry_points()
+    for name in sorted(config.get_opcode_sets()):
+        config.set_opcode_set(name)
+    config.set_opcode_set('default')
+    print('Tables written to %s' % cache_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+"""Generates the table of cheapest stack operation sequences.
+
+Every sequence of stack operations up to a given length is searched, and
+the cheapest sequence with each effect is written to the table that the
+stack superoptimizer uses (see txsc/ir/stack_superoptimizer.py).
+"""
+
+import argparse
+
+from txsc.ir import stack_superoptimizer
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the table of cheapest stack operation sequences.')
+    parser.add_argument('-n', '--max-length', dest='max_length', metavar='LENGTH', type=int, default=3, help='Maximum number of operations in a sequence (Default: %(default)s).')
+    parser.add_argument('-d', '--depth', dest='depth', metavar='DEPTH', type=int, default=6, help='Maximum number of stack items that a sequence uses (Default: %(default)s).')
+    parser.add_argument('-o', '--output', dest='output', metavar='PATH', type=str, default=stack_superoptimizer.TABLE_PATH, help='Path to write the table to (Default: %(default)s).')
+    args = parser.parse_args()
+
+    table = stack_superoptimizer.build_table(args.max_length, args.depth)
+    stack_superoptimizer.write_table(table, args.output)
+    print('%d sequences written to %s' % (len(table['sequences']), args.output))
+
+if __name__ == '__main__':
+    main()
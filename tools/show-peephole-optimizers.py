@@ -1,14 +1,21 @@
 #!/usr/bin/env python
-"""Displays the peephole optimizations performed by txsc."""
+"""Displays the peephole optimizations performed by txsc.
+
+Rules are read from the rule files that txsc loads. The stack
+superoptimizer is described by its table of sequences. The optimizations
+of other peephole optimizers are parsed from "# before -> after" comments
+in their source.
+"""
 
 import argparse
 from collections import namedtuple
 import inspect
 import json
 
-from txsc.ir import linear_optimizer
+from txsc.ir import linear_optimizer, stack_superoptimizer
+from txsc.ir.peephole_rules import DeclaredRuleSet
 
-Peephole = namedtuple('Peephole', ('before', 'after', 'function_name'))
+Peephole = namedtuple('Peephole', ('before', 'after', 'function_name', 'cost_delta'))
 
 def parse_comment(line):
     """Parse line into a (before, after) pair."""
@@ -35,6 +42,15 @@ def parse_source_lines(sourcelines):
 
     return optimizations
 
+def get_superoptimizer_peepholes(func):
+    """Describe the replacements that the stack superoptimizer makes."""
+    table = stack_superoptimizer.read_table()
+    if not table:
+        return []
+    after = 'cheapest equivalent (%d sequences of up to %d operations)' % (len(table['sequences']), table['max_length'])
+    # Sequences are only replaced if at least one opcode is saved.
+    return [Peephole('stack operations', after, func.__name__, -1)]
+
 def get_peephole_optimizations():
     """Parse the peephole optimizers and return their effects.
 
@@ -44,10 +60,20 @@ def get_peephole_optimizations():
     """
     peepholes = []
     for func in linear_optimizer.peephole_optimizers:
+        if isinstance(func, DeclaredRuleSet):
+            for rule in func.rules:
+                guards = ', '.join('%s(%s)' % (name, ', '.join('$%s' % i for i in args)) for name, args in rule.guards)
+                after = rule.after + (' if %s' % guards if guards else '')
+                peepholes.append(Peephole(rule.before, after, func.__name__, rule.cost_delta))
+            continue
+        if func is linear_optimizer.superoptimize_stack_ops:
+            peepholes.extend(get_superoptimizer_peepholes(func))
+            continue
         sourcelines, _ = inspect.getsourcelines(func)
         results = parse_source_lines(sourcelines)
         for before, after in results:
-            peepholes.append(Peephole(before, after, func.__name__))
+            cost_delta = len([i for i in after.split() if i != '_']) - len(before.split())
+            peepholes.append(Peephole(before, after, func.__name__, cost_delta))
 
     return peepholes
 
@@ -57,7 +83,7 @@ def generate_json(peepholes, verbose=False):
     objects = []
     d = {'optimizations': objects}
     for i in peepholes:
-        obj_dict = {'before': i.before, 'after': i.after}
+        obj_dict = {'before': i.before, 'after': i.after, 'cost_delta': i.cost_delta}
         if verbose:
             obj_dict['function'] = i.function_name
         objects.append(obj_dict)
@@ -65,8 +91,8 @@ def generate_json(peepholes, verbose=False):
 
 def generate_markdown(peepholes, verbose=False):
     """Generate markdown-formatted results."""
-    header =  '| Before | After |'
-    divider = '| ------ | ----- |'
+    header =  '| Before | After | Cost |'
+    divider = '| ------ | ----- | ---- |'
     if verbose:
         header +=  ' Function |'
         divider += ' -------- |'
@@ -74,7 +100,7 @@ def generate_markdown(peepholes, verbose=False):
     s = [header, divider]
 
     for i in peepholes:
-        line = '| %s | %s |' % (i.before, i.after)
+        line = '| %s | %s | %+d |' % (i.before, i.after, i.cost_delta)
         if verbose:
             line += ' %s |' % i.function_name
         s.append(line)
@@ -91,13 +117,13 @@ def generate_plain(peepholes, verbose=False):
         if len(i.after) > longest_after:
             longest_after = len(i.after)
 
-    format_str = '{:%d} -> {:%d}' % (longest_before, longest_after)
+    format_str = '{:%d} -> {:%d} ({:+d})' % (longest_before, longest_after)
     if verbose:
         format_str += ' ({})'
 
     s = []
     for i in peepholes:
-        format_args = [i.before, i.after]
+        format_args = [i.before, i.after, i.cost_delta]
         if verbose:
             format_args.append(i.function_name)
         line = format_str.format(*format_args)
@@ -1,2 +1 @@
-from asm_parser import ASMParser
 from asm_language import ASMLanguage
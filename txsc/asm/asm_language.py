@@ -3,11 +3,9 @@ import ast
 import hexs
 
 from txsc.transformer import SourceVisitor, TargetVisitor
-from txsc.ir import formats
-import txsc.ir.linear_nodes as types
 from txsc.language import Language
+from txsc.asm import asm_tokenizer
 
-from txsc.asm import ASMParser
 from txsc.btcscript import BtcScriptTargetVisitor
 
 def get_lang():
@@ -24,32 +22,16 @@ def format_hex(s):
     return '0x' + hexs.format_hex(s)
 
 class ASMSourceVisitor(SourceVisitor):
-    """Transforms ASM into the linear representation."""
+    """Transforms ASM into the linear representation.
+
+    Source may be a string, a list of lines, or a file object.
+    """
 
     def transform(self, source):
-        parser = ASMParser()
-        if isinstance(source, list):
-            source = '\n'.join(source)
-        parsed = parser.parse_source(source)
-
-        if parsed is None:
-            print('\nFailed to parse.\n')
-        assert isinstance(parsed, list)
-        map(self.process_value, parsed)
+        for node in asm_tokenizer.tokenize(source):
+            self.add_instruction(node)
         return self.instructions
 
-    def process_value(self, value):
-        # Encode integer.
-        if isinstance(value, (int, long)):
-            push = formats.int_to_bytearray(value)
-            self.add_instruction(types.Push(data=push))
-        else:
-            try:
-                opcode = types.small_int_opcode(int(value))()
-            except (TypeError, ValueError):
-                opcode = types.opcode_by_name('OP_%s' % value)()
-            self.add_instruction(opcode)
-
 class ASMTargetVisitor(BtcScriptTargetVisitor):
     """Transforms the linear representation into ASM."""
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,79 @@
+"""Streaming tokenizer for ASM.
+
+ASM is a sequence of whitespace-separated words. A data push is a pair
+of hex words (the length of the data, then the data). Any other word is
+an opcode name without its "OP_" prefix, or a small integer.
+
+The tokenizer reads from a string, an iterable of lines, or a file object,
+and yields linear nodes one at a time, so input does not have to be
+held in memory all at once.
+"""
+import binascii
+
+import hexs
+
+import txsc.ir.linear_nodes as types
+
+# Number of characters to read at a time from file objects.
+CHUNK_SIZE = 1 << 16
+
+def iter_file_words(f):
+    """Iterate over the words in file object f."""
+    partial = ''
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+        chunk = partial + chunk
+        words = chunk.split()
+        # The last word may continue in the next chunk.
+        partial = words.pop() if words and not chunk[-1].isspace() else ''
+        for word in words:
+            yield word
+    if partial:
+        yield partial
+
+def iter_words(source):
+    """Iterate over the words in source.
+
+    source may be a string, an iterable of lines, or a file object.
+    """
+    if isinstance(source, basestring):
+        source = [source]
+    elif hasattr(source, 'read'):
+        for word in iter_file_words(source):
+            yield word
+        return
+    for line in source:
+        for word in line.split():
+            yield word
+
+def decode_push(length_word, data_word):
+    """Decode the data of a push from its length and data words."""
+    try:
+        length = int(length_word, 16)
+        data = binascii.unhexlify(hexs.format_hex(data_word))
+    except (TypeError, ValueError):
+        raise SyntaxError('Syntax error: Invalid push: %s %s' % (length_word, data_word))
+    if length != len(data):
+        raise SyntaxError('Syntax error: Push of %d bytes has %d bytes of data: %s' % (length, len(data), data_word))
+    return data
+
+def decode_opcode(word):
+    """Decode an opcode or small integer word."""
+    if word.isdigit():
+        cls = types.small_int_opcode(int(word))
+    else:
+        cls = types.opcode_by_name(word if word.startswith('OP_') else 'OP_%s' % word)
+    if cls is None:
+        raise SyntaxError('Syntax error: Unknown opcode: %s' % word)
+    return cls()
+
+def tokenize(source):
+    """Iterate over the linear nodes in ASM source."""
+    words = iter_words(source)
+    for word in words:
+        if word.startswith('0x'):
+            data_word = next(words, None)
+            if data_word is None or not data_word.startswith('0x'):
+                raise SyntaxError('Syntax error: Push is missing its data: %s' % word)
+            yield types.Push(data=decode_push(word, data_word))
+        else:
+            yield decode_opcode(word)
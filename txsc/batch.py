@@ -0,0 +1,217 @@
+"""Batch compilation.
+
+Batch mode compiles many scripts in one process, so that the interpreter
+and the compiler are only set up once. Each job produces one JSON object
+on its own line (JSON Lines).
+
+A job is a JSON object with either a "source" (a string or a list of lines)
+or a "file" (a path to a source file). Any other keys are compilation options
+(e.g. "source_lang", "target_lang", "opcode_set") that override the batch's
+defaults for that job. An optional "id" is included in the job's result.
+
+A result is a JSON object with the job's "id" and "success". Successful jobs
+have an "output"; failed jobs have an "error" with a "type" and a "message"
+(and a "line" if the error occurred on a known line).
+"""
+import glob
+import json
+import multiprocessing
+import os
+import sys
+
+from txsc.ir import IRError
+from txsc.script_compiler import ScriptCompiler
+from txsc import config, parsing
+
+# Number of jobs that are sent to a worker process at a time.
+CHUNK_SIZE = 16
+
+# Command-line options that apply to a batch, rather than to its jobs.
+batch_options = ('source', 'batch', 'jobs', 'client', 'list_langs', 'list_opcode_sets', 'output_file')
+
+class BatchError(Exception):
+    """Exception raised when a job is invalid."""
+    pass
+
+def to_str(value):
+    """Convert unicode strings in a decoded JSON value to str."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, list):
+        return [to_str(i) for i in value]
+    elif isinstance(value, dict):
+        return {to_str(k): to_str(v) for k, v in value.items()}
+    return value
+
+def expand_paths(patterns):
+    """Iterate over the files that patterns refer to.
+
+    Each pattern may be a path to a file, a directory (whose files are used),
+    or a glob pattern.
+    """
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    child = os.path.join(path, name)
+                    if os.path.isfile(child):
+                        yield child
+            else:
+                yield path
+
+def iter_file_jobs(patterns):
+    """Iterate over jobs for the source files that patterns refer to."""
+    for path in expand_paths(patterns):
+        yield {'id': path, 'file': path}
+
+def iter_json_jobs(f):
+    """Iterate over the JSON-encoded jobs in file object f.
+
+    Lines that are not valid JSON are yielded as-is, so that they can be
+    reported as failed jobs.
+    """
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError:
+            yield line
+        else:
+            yield to_str(job)
+
+def format_error(e):
+    """Get a JSON-serializable description of exception e."""
+    error = {'type': e.__class__.__name__, 'message': str(e)}
+    # IRErrors raised by the structural visitor have a message and a line number.
+    if isinstance(e, IRError) and len(e.args) == 2 and isinstance(e.args[1], int):
+        error['message'] = e.args[0] or ''
+        error['line'] = e.args[1]
+    return error
+
+class BatchCompiler(object):
+    """Compiles batches of jobs with one ScriptCompiler.
+
+    defaults is a dict of compilation options that jobs may override.
+    """
+    def __init__(self, compiler, defaults=None):
+        self.compiler = compiler
+        self.defaults = dict(defaults or {})
+        for key in batch_options:
+            self.defaults.pop(key, None)
+
+    def get_source(self, job):
+        """Get the source lines of job."""
+        if 'source' in job:
+            src = job['source']
+            if isinstance(src, basestring):
+                src = [src]
+            if not isinstance(src, list) or not all(isinstance(i, basestring) for i in src):
+                raise BatchError('Source must be a string or a list of strings.')
+            return src
+        elif 'file' in job:
+            try:
+                with open(job['file'], 'r') as f:
+                    return f.readlines()
+            except IOError as e:
+                raise BatchError('Could not read "%s": %s' % (job['file'], e.strerror))
+        raise BatchError('Job has no source or file.')
+
+    def get_options(self, job):
+        """Get the compilation options of job."""
+        options = dict(self.defaults)
+        options.update((k, v) for k, v in job.items() if k not in ('id', 'source', 'file') + batch_options)
+        # Automatically detect source language from file extension.
+        if 'file' in job and 'source_lang' not in job:
+            names = job['file'].split('.')
+            if len(names) > 1:
+                if names[-1] not in self.compiler.input_languages:
+                    self.compiler.load_plugins()
+                if names[-1] in self.compiler.input_languages:
+                    options['source_lang'] = names[-1]
+
+        for key, attr in [('source_lang', 'input_languages'), ('target_lang', 'output_languages')]:
+            if key in options and options[key] not in getattr(self.compiler, attr):
+                self.compiler.load_plugins()
+                if options[key] not in getattr(self.compiler, attr):
+                    raise BatchError('Invalid choice for %s: "%s"' % (key, options[key]))
+        if 'opcode_set' in options and not config.has_opcode_set(options['opcode_set']):
+            raise BatchError('Invalid choice for opcode_set: "%s"' % options['opcode_set'])
+        return options
+
+    def compile_job(self, job):
+        """Compile job and return its result."""
+        result = {'id': job.get('id') if isinstance(job, dict) else None}
+        try:
+            if not isinstance(job, dict):
+                raise BatchError('Invalid job: %s' % job.strip())
+            src = self.get_source(job)
+            options = self.get_options(job)
+            # Anything that the compiler prints must not end up in the results.
+            stdout = sys.stdout
+            sys.stdout = sys.stderr
+            try:
+                # The compiler may also be used for other things between jobs.
+                self.compiler.testing_mode = True
+                self.compiler.setup_options(options)
+                self.compiler.compile(src)
+                output = self.compiler.output()
+            finally:
+                sys.stdout = stdout
+        except Exception as e:
+            result['success'] = False
+            result['error'] = format_error(e)
+        else:
+            result['success'] = True
+            result['output'] = output
+        return result
+
+    def iter_results(self, jobs, processes=1, chunksize=CHUNK_SIZE):
+        """Compile jobs and iterate over their results in the order of jobs.
+
+        If processes is greater than 1, jobs are compiled in that many
+        worker processes, chunksize jobs at a time. Daemonic processes
+        (e.g. server workers) cannot start processes, so they compile jobs themselves.
+        """
+        if processes <= 1 or multiprocessing.current_process().daemon:
+            for job in jobs:
+                yield self.compile_job(job)
+            return
+
+        # Workers that are forked after this share the parsers that it creates.
+        parsing.preload_parsers()
+        pool = multiprocessing.Pool(processes, init_worker, (self.defaults,))
+        try:
+            for result in pool.imap(compile_job_in_worker, jobs, chunksize):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def run(self, jobs, output, processes=1):
+        """Compile jobs and write their results to file object output.
+
+        Returns the number of jobs that failed.
+        """
+        failures = 0
+        for result in self.iter_results(jobs, processes):
+            if not result['success']:
+                failures += 1
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+        return failures
+
+# BatchCompiler of the current worker process.
+worker_batch_compiler = None
+
+def init_worker(defaults):
+    """Prepare a worker process to compile jobs."""
+    global worker_batch_compiler
+    worker_batch_compiler = BatchCompiler(ScriptCompiler(), defaults)
+    parsing.preload_parsers()
+
+def compile_job_in_worker(job):
+    """Compile job in a worker process."""
+    return worker_batch_compiler.compile_job(job)
@@ -1,15 +1,115 @@
-"""Raw script language.
-
-Uses python-bitcoinlib internally.
-"""
+"""Raw script language."""
+import binascii
+import struct
 
 import hexs
-from bitcoin.core import b2x, lx, x, script
 
 from txsc.transformer import SourceVisitor, TargetVisitor
 import txsc.ir.linear_nodes as types
 from txsc.language import Language
 
+# Opcode values by name.
+OPCODES_BY_NAME = {
+    'OP_0': 0x00, 'OP_PUSHDATA1': 0x4c, 'OP_PUSHDATA2': 0x4d, 'OP_PUSHDATA4': 0x4e,
+    'OP_1NEGATE': 0x4f, 'OP_RESERVED': 0x50, 'OP_1': 0x51, 'OP_2': 0x52, 'OP_3': 0x53,
+    'OP_4': 0x54, 'OP_5': 0x55, 'OP_6': 0x56, 'OP_7': 0x57, 'OP_8': 0x58, 'OP_9': 0x59,
+    'OP_10': 0x5a, 'OP_11': 0x5b, 'OP_12': 0x5c, 'OP_13': 0x5d, 'OP_14': 0x5e, 'OP_15': 0x5f,
+    'OP_16': 0x60, 'OP_NOP': 0x61, 'OP_VER': 0x62, 'OP_IF': 0x63, 'OP_NOTIF': 0x64,
+    'OP_VERIF': 0x65, 'OP_VERNOTIF': 0x66, 'OP_ELSE': 0x67, 'OP_ENDIF': 0x68, 'OP_VERIFY': 0x69,
+    'OP_RETURN': 0x6a, 'OP_TOALTSTACK': 0x6b, 'OP_FROMALTSTACK': 0x6c, 'OP_2DROP': 0x6d,
+    'OP_2DUP': 0x6e, 'OP_3DUP': 0x6f, 'OP_2OVER': 0x70, 'OP_2ROT': 0x71, 'OP_2SWAP': 0x72,
+    'OP_IFDUP': 0x73, 'OP_DEPTH': 0x74, 'OP_DROP': 0x75, 'OP_DUP': 0x76, 'OP_NIP': 0x77,
+    'OP_OVER': 0x78, 'OP_PICK': 0x79, 'OP_ROLL': 0x7a, 'OP_ROT': 0x7b, 'OP_SWAP': 0x7c,
+    'OP_TUCK': 0x7d, 'OP_CAT': 0x7e, 'OP_SUBSTR': 0x7f, 'OP_LEFT': 0x80, 'OP_RIGHT': 0x81,
+    'OP_SIZE': 0x82, 'OP_INVERT': 0x83, 'OP_AND': 0x84, 'OP_OR': 0x85, 'OP_XOR': 0x86,
+    'OP_EQUAL': 0x87, 'OP_EQUALVERIFY': 0x88, 'OP_RESERVED1': 0x89, 'OP_RESERVED2': 0x8a,
+    'OP_1ADD': 0x8b, 'OP_1SUB': 0x8c, 'OP_2MUL': 0x8d, 'OP_2DIV': 0x8e, 'OP_NEGATE': 0x8f,
+    'OP_ABS': 0x90, 'OP_NOT': 0x91, 'OP_0NOTEQUAL': 0x92, 'OP_ADD': 0x93, 'OP_SUB': 0x94,
+    'OP_MUL': 0x95, 'OP_DIV': 0x96, 'OP_MOD': 0x97, 'OP_LSHIFT': 0x98, 'OP_RSHIFT': 0x99,
+    'OP_BOOLAND': 0x9a, 'OP_BOOLOR': 0x9b, 'OP_NUMEQUAL': 0x9c, 'OP_NUMEQUALVERIFY': 0x9d,
+    'OP_NUMNOTEQUAL': 0x9e, 'OP_LESSTHAN': 0x9f, 'OP_GREATERTHAN': 0xa0,
+    'OP_LESSTHANOREQUAL': 0xa1, 'OP_GREATERTHANOREQUAL': 0xa2, 'OP_MIN': 0xa3, 'OP_MAX': 0xa4,
+    'OP_WITHIN': 0xa5, 'OP_RIPEMD160': 0xa6, 'OP_SHA1': 0xa7, 'OP_SHA256': 0xa8,
+    'OP_HASH160': 0xa9, 'OP_HASH256': 0xaa, 'OP_CODESEPARATOR': 0xab, 'OP_CHECKSIG': 0xac,
+    'OP_CHECKSIGVERIFY': 0xad, 'OP_CHECKMULTISIG': 0xae, 'OP_CHECKMULTISIGVERIFY': 0xaf,
+    'OP_NOP1': 0xb0, 'OP_CHECKLOCKTIMEVERIFY': 0xb1, 'OP_NOP2': 0xb1, 'OP_NOP3': 0xb2,
+    'OP_NOP4': 0xb3, 'OP_NOP5': 0xb4, 'OP_NOP6': 0xb5, 'OP_NOP7': 0xb6, 'OP_NOP8': 0xb7,
+    'OP_NOP9': 0xb8, 'OP_NOP10': 0xb9, 'OP_SMALLINTEGER': 0xfa, 'OP_PUBKEYS': 0xfb,
+    'OP_PUBKEYHASH': 0xfd, 'OP_PUBKEY': 0xfe, 'OP_FALSE': 0x00, 'OP_TRUE': 0x51,
+}
+# Names that share a value with another name. These are only used for
+# decoding if the opcode set lacks the other name.
+OPCODE_ALIASES = ('OP_FALSE', 'OP_TRUE', 'OP_NOP2')
+
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_PUSHDATA4 = 0x4e
+# {opcode: (struct format, size), ...} of data length fields.
+PUSHDATA_LENGTHS = {OP_PUSHDATA1: ('<B', 1), OP_PUSHDATA2: ('<H', 2), OP_PUSHDATA4: ('<I', 4)}
+
+# (opcode classes, [class for each opcode value, ...]).
+_opcode_table = (None, None)
+
+def encode_pushdata(data):
+    """Encode a data push."""
+    length = len(data)
+    if length < 0x4c:
+        return chr(length) + data
+    elif length <= 0xff:
+        return b'\x4c' + chr(length) + data
+    elif length <= 0xffff:
+        return b'\x4d' + struct.pack(b'<H', length) + data
+    elif length <= 0xffffffff:
+        return b'\x4e' + struct.pack(b'<I', length) + data
+    raise ValueError('Data too long to encode in a push operation')
+
+def iter_script(data):
+    """Iterate over the operations in the raw script data.
+
+    Yields (opcode, payload) tuples. For data pushes, payload is a memoryview
+    slice of data. For other operations, it is None.
+    """
+    view = memoryview(data)
+    length = len(view)
+    i = 0
+    while i < length:
+        start = i
+        opcode = ord(view[i])
+        i += 1
+        if opcode > OP_PUSHDATA4:
+            yield opcode, None
+            continue
+
+        if opcode < OP_PUSHDATA1:
+            size = opcode
+        else:
+            fmt, width = PUSHDATA_LENGTHS[opcode]
+            if i + width > length:
+                raise SyntaxError('Syntax error: Push at byte %d is missing its data length' % start)
+            size = struct.unpack_from(fmt, view, i)[0]
+            i += width
+        if i + size > length:
+            raise SyntaxError('Syntax error: Push at byte %d is truncated' % start)
+        yield opcode, view[i:i + size]
+        i += size
+
+def get_opcode_table():
+    """Get the opcode class for each opcode value in the current opcode set.
+
+    The table is rebuilt whenever the opcode set changes.
+    """
+    global _opcode_table
+    opcode_classes, table = _opcode_table
+    if opcode_classes is not types.opcode_classes:
+        table = [None] * 256
+        names = sorted(OPCODES_BY_NAME.keys(), key=lambda name: name in OPCODE_ALIASES)
+        for name in names:
+            value = OPCODES_BY_NAME[name]
+            if table[value] is None:
+                table[value] = types.opcode_by_name(name)
+        _opcode_table = (types.opcode_classes, table)
+    return table
+
 def get_lang():
     return BtcScriptLanguage()
 
@@ -18,23 +118,25 @@ class BtcScriptSourceVisitor(SourceVisitor):
     def transform(self, source):
         if isinstance(source, list):
             source = ''.join(source)
+        source = ''.join(source.split())
         if source.startswith('0x'):
             source = source[2:]
-
-        src = script.CScript(x(source))
-        iterator = iter(src)
-        for value in iterator:
-            op = None
-            s = str(value)
-            if s.startswith('OP_'):
-                op = types.opcode_by_name(s)()
-            elif isinstance(value, int):
-                op = types.small_int_opcode(value)()
+        try:
+            data = binascii.unhexlify(source)
+        except TypeError:
+            raise SyntaxError('Syntax error: Script is not valid hex')
+
+        table = get_opcode_table()
+        for opcode, payload in iter_script(data):
+            # OP_0 is decoded as a small integer rather than an empty push.
+            if payload is not None and opcode != 0:
+                op = types.Push(data=payload.tobytes())
             else:
-                op = types.Push(data=value)
-
-            if op is not None:
-                self.add_instruction(op)
+                cls = table[opcode]
+                if cls is None:
+                    raise SyntaxError('Syntax error: Unknown opcode: 0x%02x' % opcode)
+                op = cls()
+            self.add_instruction(op)
 
         return self.instructions
 
@@ -59,20 +161,18 @@ class BtcScriptTargetVisitor(TargetVisitor):
             if isinstance(result, list):
                 result = ''.join(result).replace('0x','')
             s.append(result)
-        s = ''.join(s)
-        data = x(s)
+        data = binascii.unhexlify(''.join(s))
         if self.little_endian:
-            data = lx(s)
+            data = data[::-1]
         return self.visit(types.Push(data=data))
 
     def visit_Push(self, node):
         # Switch the endianness of the data.
         data = node.data[::-1]
-        value = script.CScriptOp.encode_op_pushdata(data)
-        return b2x(value)
+        return binascii.hexlify(encode_pushdata(data))
 
     def generic_visit_OpCode(self, node):
-        value = int(script.OPCODES_BY_NAME[node.name])
+        value = OPCODES_BY_NAME[node.name]
         return hexs.hexs(value)
 
     def generic_visit_SmallIntOpCode(self, node):
@@ -0,0 +1,133 @@
+"""On-disk cache for generated data.
+
+The cache directory is $TXSC_CACHE_DIR if it is set. Otherwise it is located
+in $XDG_CACHE_HOME (or $HOME/.cache). If neither location is writable, a
+directory in the system's temporary directory is used.
+
+Some cache entries are Python modules, which are loaded with load_source().
+The cache directory is created with mode 0700, and a directory that another
+user owns or can write to is never used. Modules are only loaded from files
+that only the current user can write to.
+
+Cache entries are versioned by the Python version, since some of them
+(e.g. pickled tables) are not portable between interpreters.
+"""
+import hashlib
+import imp
+import os
+import stat
+import sys
+import tempfile
+
+# Directory that cache entries are stored in. '' means that no writable directory exists.
+_cache_dir = None
+
+def get_version_tag():
+    """Get the name of the versioned subdirectory of the cache."""
+    return 'py%d%d' % sys.version_info[:2]
+
+def _is_private(path, is_type):
+    """Get whether path is of the type that is_type checks for and only the current user can write to it."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if not is_type(st.st_mode):
+        return False
+    if hasattr(os, 'getuid'):
+        if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            return False
+    return os.access(path, os.W_OK)
+
+def _make_private_dir(path):
+    """Create path if necessary and return whether it is a directory that only the current user can write to."""
+    try:
+        if not os.path.isdir(path):
+            os.makedirs(path, 0o700)
+        # Directories that the current user owns are made private.
+        st = os.lstat(path)
+        if (stat.S_ISDIR(st.st_mode) and hasattr(os, 'getuid') and st.st_uid == os.getuid()
+                and st.st_mode & 0o077):
+            os.chmod(path, 0o700)
+    except OSError:
+        return False
+    return _is_private(path, stat.S_ISDIR)
+
+def get_cache_dir():
+    """Get the cache directory, or None if no writable directory exists."""
+    global _cache_dir
+    if _cache_dir is None:
+        roots = []
+        if os.environ.get('TXSC_CACHE_DIR'):
+            roots.append(os.environ['TXSC_CACHE_DIR'])
+        else:
+            base = os.environ.get('XDG_CACHE_HOME')
+            if not base and os.environ.get('HOME'):
+                base = os.path.join(os.environ['HOME'], '.cache')
+            if base:
+                roots.append(os.path.join(base, 'txsc'))
+        user = getattr(os, 'getuid', lambda: 'user')()
+        roots.append(os.path.join(tempfile.gettempdir(), 'txsc-cache-%s' % user))
+
+        _cache_dir = ''
+        for root in roots:
+            path = os.path.join(root, get_version_tag())
+            if _make_private_dir(root) and _make_private_dir(path):
+                _cache_dir = path
+                break
+    return _cache_dir or None
+
+def set_cache_dir(path):
+    """Set the cache directory.
+
+    If path is None, the cache directory will be determined again
+    the next time it is needed.
+    """
+    global _cache_dir
+    _cache_dir = path
+
+def get_cache_path(filename):
+    """Get the path of filename in the cache directory, or None if there is no cache directory."""
+    cache_dir = get_cache_dir()
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, filename)
+
+def make_private(path):
+    """Make the file at path readable and writable by the current user only."""
+    try:
+        os.chmod(path, 0o600)
+    except OSError:
+        pass
+
+def is_trusted(path):
+    """Get whether only the current user can write to the file at path and the directory that contains it."""
+    return _is_private(os.path.dirname(path), stat.S_ISDIR) and _is_private(path, stat.S_ISREG)
+
+def load_source(name, path):
+    """Load the module in the file at path.
+
+    Returns None if the file does not exist, or if another user could have written to it.
+    """
+    if not os.path.exists(path) or not is_trusted(path):
+        return None
+    return imp.load_source(name, path)
+
+def get_source_file(module):
+    """Get the path of the file that module was loaded from, preferring its source."""
+    path = getattr(module, '__file__', '') or ''
+    if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+        path = path[:-1]
+    return path
+
+def digest(values, paths=()):
+    """Get a hex digest of values and the contents of the files in paths."""
+    h = hashlib.sha1()
+    for value in values:
+        h.update(str(value).encode('utf-8'))
+        h.update(b'\0')
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+        h.update(b'\0')
+    return h.hexdigest()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import argparse
+import multiprocessing
 import os
 import sys
 import logging
@@ -20,11 +21,7 @@ if is_local:
         path = path[:-1]
     sys.path.insert(0, path)
 
-from txsc.script_compiler import DirectiveError, ScriptCompiler, OptimizationLevel, Verbosity
-from txsc import config
-
-# Will not reload the entry points if they've already been loaded.
-config.load_entry_points()
+# The compiler is imported when it is needed, so that client mode (see txsc.server) starts quickly.
 
 
 # http://stackoverflow.com/questions/6076690/verbose-level-with-argparse-and-multiple-v-options
@@ -66,23 +63,24 @@ class LogAction(argparse.Action):
         values = values.upper()
         setattr(args, self.dest, values)
 
-source_choices = []
-target_choices = []
-opcode_set_choices = []
-
-def create_arg_parser():
-    argparser = argparse.ArgumentParser(description='Transaction script compiler.')
+def create_arg_parser(prog=None):
+    from txsc.script_compiler import OptimizationLevel, Verbosity
+    argparser = argparse.ArgumentParser(prog=prog, description='Transaction script compiler.')
     argparser.add_argument('source', metavar='SOURCE', nargs='?', type=str, help='Source to compile.')
     argparser.add_argument('--list-langs', dest='list_langs', action='store_true', default=False, help='List available languages and exit.')
     argparser.add_argument('--list-opcode-sets', dest='list_opcode_sets', action='store_true', default=False, help='List available opcode sets and exit.')
+    argparser.add_argument('--batch', dest='batch', metavar='PATH', nargs='*', help='Compile many sources and output one JSON result per line. '
+                           'PATHs may be files, directories, or glob patterns. If no PATH (or "-") is given, JSON jobs are read from stdin.')
+    argparser.add_argument('-j', '--jobs', dest='jobs', metavar='N', type=int, default=1, help='Number of processes to compile a batch with (Default: %(default)s; 0 for one per CPU).')
+    argparser.add_argument('--client', dest='client', action='store_true', default=False, help='Compile with a running server (see "%(prog)s serve --help").')
     argparser.add_argument('-c', '--config', dest='config_file', metavar='CONFIG_FILE', type=str, help='Configuration file.')
     argparser.add_argument('-o', '--output', dest='output_file', metavar='OUTPUT_FILE', type=str, help='Output to a file.')
     argparser.add_argument('-O', '--optimize', nargs='?', action=OAction, dest='optimization', metavar='OPTIMIZATION_LEVEL', default=OptimizationLevel.max_optimization, help='Optimization level (Max: %d).' % OptimizationLevel.max_optimization)
 
-    argparser.add_argument('-s', '--source', metavar='SOURCE_LANGUAGE', dest='source_lang', choices=source_choices, default='txscript', help='Source language (Choices: %(choices)s).')
-    argparser.add_argument('-t', '--target', metavar='TARGET_LANGUAGE', dest='target_lang', choices=target_choices, default='btc', help='Target language (Choices: %(choices)s).')
-    argparser.add_argument('--opcode-set', metavar='OPCODE_SET', dest='opcode_set', choices=opcode_set_choices,
-                           default='default', help='Opcode set (Choices: %(choices)s).')
+    argparser.add_argument('-s', '--source', metavar='SOURCE_LANGUAGE', dest='source_lang', default='txscript', help='Source language (See --list-langs).')
+    argparser.add_argument('-t', '--target', metavar='TARGET_LANGUAGE', dest='target_lang', default='btc', help='Target language (See --list-langs).')
+    argparser.add_argument('--opcode-set', metavar='OPCODE_SET', dest='opcode_set',
+                           default='default', help='Opcode set (See --list-opcode-sets).')
 
     argparser.add_argument('--log', nargs='?', action=LogAction, dest='log_level', default='WARNING', help='Minimum logging level (Default: %(default)s).')
     argparser.add_argument('-v', '--verbose', nargs='?', action=VAction, dest='verbosity', default=0, help='Verbosity level (Max: %d).' % Verbosity.max_verbosity)
@@ -95,21 +93,48 @@ def create_arg_parser():
 
     return argparser
 
+def check_choice(argparser, option, value, choices):
+    """Exit with a usage error if value is not in choices."""
+    if value not in choices:
+        argparser.error('argument %s: invalid choice: %r (choose from %s)' % (option, value, ', '.join(map(repr, sorted(choices)))))
+
+def get_batch_paths(args):
+    """Get the paths of the batch that parsed arguments args specify."""
+    paths = list(args.batch)
+    if args.source is not None:
+        paths.append(args.source)
+    return paths
+
+def batch_reads_stdin(args):
+    """Get whether the batch that parsed arguments args specify is read from stdin."""
+    if args.batch is None:
+        return False
+    paths = get_batch_paths(args)
+    return not paths or paths == ['-']
+
 def main():
-    global source_choices, target_choices, opcode_set_choices
+    argv = sys.argv[1:]
+    if argv[:1] == ['serve']:
+        from txsc import server
+        sys.exit(server.serve_main(argv[1:]))
+    elif '--client' in argv:
+        from txsc import server
+        sys.exit(server.run_client([i for i in argv if i != '--client']))
+
+    from txsc.script_compiler import ScriptCompiler, log_format
     logger = logging.getLogger('txsc')
     ch = logging.StreamHandler()
-    ch.setFormatter(logging.Formatter('%(levelname)s [%(name)s] %(message)s'))
+    ch.setFormatter(logging.Formatter(log_format))
     logger.addHandler(ch)
 
+    run(ScriptCompiler(), argv)
 
-    compiler = ScriptCompiler()
-    source_choices = sorted(compiler.input_languages.keys())
-    target_choices = sorted(compiler.output_languages.keys())
-    opcode_set_choices = sorted(config.get_opcode_sets().keys())
-
-    argparser = create_arg_parser()
-    args = argparser.parse_args()
+def run(compiler, argv, prog=None):
+    """Run the command-line interface with compiler and arguments argv."""
+    from txsc.script_compiler import DirectiveError
+    from txsc import batch, config
+    argparser = create_arg_parser(prog)
+    args = argparser.parse_args(argv)
 
     def list_languages():
         """List available languages."""
@@ -129,6 +154,27 @@ def main():
         print(s)
 
 
+    # Plugins are only needed for listing or for choices that are not built-in.
+    if args.list_langs or args.list_opcode_sets:
+        compiler.load_plugins()
+
+    def compile_batch():
+        """Compile a batch of jobs."""
+        if batch_reads_stdin(args):
+            jobs = batch.iter_json_jobs(sys.stdin)
+        else:
+            jobs = batch.iter_file_jobs(get_batch_paths(args))
+
+        processes = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+        batch_compiler = batch.BatchCompiler(compiler, vars(args))
+        if args.output_file:
+            with open(args.output_file, 'w') as f:
+                failures = batch_compiler.run(jobs, f, processes)
+        else:
+            failures = batch_compiler.run(jobs, sys.stdout, processes)
+        return 1 if failures else 0
+
+
     # Determine whether source is needed.
     if args.list_langs:
         list_languages()
@@ -136,6 +182,8 @@ def main():
     elif args.list_opcode_sets:
         list_opcode_sets()
         argparser.exit(0)
+    elif args.batch is not None:
+        sys.exit(compile_batch())
     elif args.source is None:
         argparser.print_usage()
         argparser.exit(1)
@@ -147,8 +195,18 @@ def main():
             src = f.readlines()
         # Automatically detect source language from file extension.
         names = s.split('.')
-        if len(names) > 1 and names[-1] in source_choices:
-            args.source_lang = names[-1]
+        if len(names) > 1:
+            if names[-1] not in compiler.input_languages:
+                compiler.load_plugins()
+            if names[-1] in compiler.input_languages:
+                args.source_lang = names[-1]
+
+    if args.source_lang not in compiler.input_languages or args.target_lang not in compiler.output_languages:
+        compiler.load_plugins()
+    check_choice(argparser, '-s/--source', args.source_lang, compiler.input_languages.keys())
+    check_choice(argparser, '-t/--target', args.target_lang, compiler.output_languages.keys())
+    if not config.has_opcode_set(args.opcode_set):
+        check_choice(argparser, '--opcode-set', args.opcode_set, config.get_opcode_sets().keys())
 
     compiler.setup_options(args)
     try:
@@ -5,17 +5,28 @@ Handles configuration values and entry points.
 Entry points have the following requirements:
 
     - txsc.language: Must return an instance of a txsc.language.Language subclass.
-    - txsc.opcodes: Must return a 2-tuple of the form (name, opcodes), where:
+    - txsc.opcodes: Must return a 2-tuple of the form (name, opcodes), or a 3-tuple
+      of the form (name, opcodes, rule_files), where:
         - name (str): The name of the opcode set.
         - opcodes (dict): A dict of {opcode_name: opcode_class}.
+        - rule_files (list): Paths of peephole rule files (see txsc.ir.peephole_rules)
+          whose rules apply when the opcode set is used, after the built-in rules.
 
         Opcode classes must be subclasses of txsc.ir.linear_nodes.OpCode. They
         may optionally have an attribute, "func", which is a txsc.txscript.script_transformer.OpFunc
         instance. If this attribute is present, the OpFunc name will be available as a built-in function.
+        Opcode classes are not interned unless they set "interned" to True, in which
+        case every instance of the class is the same node, which cannot be created
+        with arguments or hold metadata (see txsc.ir.linear_nodes).
+    - txsc.linear_optimizers: Must return a txsc.ir.linear_optimizer.LinearOptimizer subclass.
+
+Entry points are loaded lazily: only when a language, opcode set, or linear
+optimizer that is not built-in is requested (see txsc.entry_points).
 """
 
 import os
-from pkg_resources import iter_entry_points
+
+from txsc.entry_points import iter_entry_points
 
 
 # Default languages.
@@ -26,6 +37,7 @@ from txsc.btcscript import BtcScriptLanguage
 
 # Default opcodes.
 from txsc.ir import linear_nodes, linear_optimizer
+from txsc.ir.peephole_rules import load_rule_file
 
 # Default builtin functions.
 from txsc.txscript import script_transformer
@@ -40,6 +52,11 @@ def has_loaded():
 # Configurable collections.
 languages = [ASMLanguage, BtcScriptLanguage, TxScriptLanguage]
 opcode_sets = {'default': linear_nodes.get_opcodes()}
+# Peephole rule files of opcode sets. {opcode_set_name: [path, ...], ...}
+opcode_set_rule_files = {}
+# Peephole rule tables of opcode sets, built when an opcode set is first used.
+# {opcode_set_name: (rule_sets, PeepholeMatcher), ...}
+peephole_matchers = {}
 linear_optimizers = {'default': linear_optimizer.LinearOptimizer}
 
 
@@ -73,7 +90,7 @@ def load_opcode_sets():
     for entry_point in iter_entry_points(group='txsc.opcodes'):
         ops_maker = entry_point.load()
         ops = ops_maker()
-        if not isinstance(ops, tuple) or len(ops) != 2:
+        if not isinstance(ops, tuple) or len(ops) not in (2, 3):
             continue
         # The name "default" is taken.
         if ops[0] == 'default' or ops[0] in opcode_sets.keys():
@@ -82,20 +99,41 @@ def load_opcode_sets():
         if not all(issubclass(cls, linear_nodes.OpCode) for cls in ops[1].values()):
             continue
         opcode_sets[ops[0]] = dict(ops[1])
+        if len(ops) == 3:
+            opcode_set_rule_files[ops[0]] = list(ops[2])
 
 def get_opcode_sets():
     """Return supported opcode sets."""
     return dict(opcode_sets)
 
+def has_opcode_set(name):
+    """Return whether the opcode set name exists.
+
+    Entry points are loaded if name is not a built-in opcode set.
+    """
+    if name not in opcode_sets:
+        load_entry_points()
+    return name in opcode_sets
+
 def set_opcode_set(name):
     """Set the desired set of opcodes.
 
     This is a wrapper around txsc.linear_nodes.set_opcodes().
     """
+    has_opcode_set(name)
     linear_nodes.reset_opcodes()
     d = opcode_sets[name]
     linear_nodes.set_opcodes(d)
 
+    # Use the opcode set's peephole rules. They are rebuilt if rule sets have been added.
+    rule_sets = tuple(linear_optimizer.peephole_rule_sets)
+    for path in opcode_set_rule_files.get(name, []):
+        rule_sets += tuple(load_rule_file(path))
+    cached = peephole_matchers.get(name)
+    if cached is None or cached[0] != rule_sets:
+        cached = peephole_matchers[name] = (rule_sets, linear_optimizer.build_peephole_matcher(rule_sets))
+    linear_optimizer.set_peephole_matcher(cached[1])
+
     # Set the builtin opcode functions if any are present.
     op_funcs = []
     for cls in d.values():
@@ -118,7 +156,7 @@ def load_linear_optimizers():
         # The name "default" is taken.
         if cls.name == 'default':
             continue
-        linear_optimizers[name] = cls
+        linear_optimizers[cls.name] = cls
 
 def get_linear_optimizers():
     """Return supported linear optimizers."""
@@ -129,6 +167,8 @@ def set_linear_optimizer(name):
 
     This is a wrapper arround txsc.linear_optimizer.set_linear_optimizer_cls().
     """
+    if name not in linear_optimizers:
+        load_entry_points()
     cls = linear_optimizers.get(name, linear_optimizer.LinearOptimizer)
     linear_optimizer.set_linear_optimizer_cls(cls)
 
@@ -0,0 +1,149 @@
+"""Discovery of entry points provided by installed distributions.
+
+Discovered entry points are stored in an index in the txsc cache directory
+(see txsc.cache). The index is invalidated whenever the installed distributions
+change, so distribution metadata only has to be scanned after packages are
+installed, upgraded or removed.
+"""
+import importlib
+import json
+import os
+import sys
+
+from txsc import cache
+
+# Entry point groups that txsc uses.
+groups = ('txsc.language', 'txsc.opcodes', 'txsc.linear_optimizers')
+
+INDEX_FILENAME = 'entry_points.json'
+
+# {group: [EntryPoint(), ...], ...}
+_entry_points = None
+
+class EntryPoint(object):
+    """An entry point.
+
+    Attributes:
+        - name (str): The entry point's name.
+        - value (str): The object that the entry point refers to, in the form "module:attr".
+
+    """
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return 'EntryPoint(%r, %r)' % (self.name, self.value)
+
+    def load(self):
+        """Import and return the object that this entry point refers to."""
+        module_name, _, attrs = self.value.partition(':')
+        obj = importlib.import_module(module_name.strip())
+        for attr in filter(None, attrs.strip().split('.')):
+            obj = getattr(obj, attr)
+        return obj
+
+def iter_metadata_paths():
+    """Iterate over the paths of distribution metadata on sys.path."""
+    for directory in sys.path:
+        directory = directory or os.getcwd()
+        if directory.endswith('.egg'):
+            yield directory
+            continue
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            continue
+        for name in names:
+            if name.endswith(('.dist-info', '.egg-info', '.egg-link', '.egg')):
+                yield os.path.join(directory, name)
+
+def get_fingerprint():
+    """Get a digest that changes whenever the installed distributions change."""
+    values = [sys.version]
+    for path in iter_metadata_paths():
+        for filename in [path, os.path.join(path, 'entry_points.txt')]:
+            try:
+                values.append('%s %s' % (filename, os.stat(filename).st_mtime))
+            except OSError:
+                pass
+    return cache.digest(values)
+
+def scan_entry_points():
+    """Scan distribution metadata for the entry points in groups.
+
+    Returns:
+        A dict of {group: [(name, value), ...], ...}.
+
+    """
+    found = dict((group, []) for group in groups)
+    try:
+        try:
+            from importlib import metadata
+        except ImportError:
+            import importlib_metadata as metadata
+    except ImportError:
+        metadata = None
+
+    if metadata is not None:
+        all_entry_points = metadata.entry_points()
+        for group in groups:
+            if hasattr(all_entry_points, 'select'):
+                items = all_entry_points.select(group=group)
+            else:
+                items = all_entry_points.get(group, [])
+            found[group] = [(i.name, i.value) for i in items]
+    else:
+        import pkg_resources
+        for group in groups:
+            for i in pkg_resources.iter_entry_points(group=group):
+                value = i.module_name
+                if i.attrs:
+                    value += ':' + '.'.join(i.attrs)
+                found[group].append((i.name, value))
+    return found
+
+def load_index(path, fingerprint):
+    """Load the index at path if it matches fingerprint."""
+    try:
+        with open(path, 'r') as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get('fingerprint') != fingerprint:
+        return None
+    return index.get('groups')
+
+def save_index(path, fingerprint, found):
+    """Save found to the index at path."""
+    tmppath = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmppath, 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'groups': found}, f)
+        os.rename(tmppath, path)
+    except (IOError, OSError):
+        pass
+
+def get_entry_points():
+    """Get the entry points in groups, using the index if it is up to date.
+
+    Returns:
+        A dict of {group: [EntryPoint(), ...], ...}.
+
+    """
+    global _entry_points
+    if _entry_points is None:
+        fingerprint = get_fingerprint()
+        path = cache.get_cache_path(INDEX_FILENAME)
+        found = load_index(path, fingerprint) if path else None
+        if found is None:
+            found = scan_entry_points()
+            if path:
+                save_index(path, fingerprint, found)
+        _entry_points = dict((group, [EntryPoint(name, value) for name, value in found.get(group, [])]) for group in groups)
+    return _entry_points
+
+def iter_entry_points(group):
+    """Iterate over the entry points in group."""
+    for entry_point in get_entry_points().get(group, []):
+        yield entry_point
@@ -0,0 +1,114 @@
+"""Sequence that is stored as a list of chunks.
+
+Inserting into or deleting from the middle of a list moves every item after
+the change. A ChunkedList only moves the items of the chunks that change,
+so the cost of an edit depends on the chunk size rather than on the length
+of the sequence. In exchange, every indexed read has to find its chunk.
+
+Chunk start offsets are computed lazily: an edit only invalidates the
+offsets of the chunks after it, and they are recomputed as far as
+they are needed by the next lookup.
+"""
+from bisect import bisect_right
+import itertools
+
+from txsc.ir.sequences import SpliceSequence
+
+class ChunkedList(SpliceSequence):
+    """A mutable sequence stored in chunks of at most CHUNK_SIZE items."""
+    CHUNK_SIZE = 512
+    def __init__(self, iterable=()):
+        self.set_items(list(iterable))
+
+    def set_items(self, items):
+        """Replace the contents of this sequence with the list items."""
+        size = self.CHUNK_SIZE
+        self.chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        self.length = len(items)
+        # Start offsets of chunks. Only the first valid_offsets are up to date.
+        self.offsets = [0] * len(self.chunks)
+        self.valid_offsets = 0
+
+    def locate(self, idx):
+        """Get the (chunk_index, chunk_offset) of the chunk that contains index idx.
+
+        If idx is the length of the sequence, the last chunk is returned.
+        """
+        chunks, offsets = self.chunks, self.offsets
+        valid = self.valid_offsets
+        if valid:
+            last = valid - 1
+            end = offsets[last] + len(chunks[last])
+        else:
+            last, end = -1, 0
+        # Compute offsets until the one for the chunk that contains idx is known.
+        while end <= idx and last < len(chunks) - 1:
+            last += 1
+            offsets[last] = end
+            end += len(chunks[last])
+        self.valid_offsets = last + 1
+        if end <= idx:
+            return (last, offsets[last]) if last >= 0 else (0, 0)
+        chunk_idx = bisect_right(offsets, idx, 0, last + 1) - 1
+        return (chunk_idx, offsets[chunk_idx])
+
+    def get_slice(self, start, end):
+        """Get a list of the items from [start : end]."""
+        if start >= end:
+            return []
+        chunk_idx, offset = self.locate(start)
+        result = self.chunks[chunk_idx][start - offset:end - offset]
+        offset += len(self.chunks[chunk_idx])
+        while offset < end:
+            chunk_idx += 1
+            chunk = self.chunks[chunk_idx]
+            result.extend(chunk[:end - offset])
+            offset += len(chunk)
+        return result
+
+    def set_slice(self, start, end, values):
+        """Replace the items from [start : end] with the list values."""
+        if not self.chunks:
+            self.set_items(values)
+            return
+        first, first_offset = self.locate(start)
+        last, last_offset = self.locate(end - 1) if end > start else (first, first_offset)
+        chunk = self.chunks[first]
+        # Edit the chunk in place if the edit is within it and leaves it a reasonable size.
+        if first == last and 0 < len(chunk) + len(values) - (end - start) <= 2 * self.CHUNK_SIZE:
+            chunk[start - first_offset:end - first_offset] = values
+            self.valid_offsets = min(self.valid_offsets, first + 1)
+            self.length += len(values) - (end - start)
+            return
+
+        items = self.chunks[first][:start - first_offset] + values + self.chunks[last][end - last_offset:]
+        # Absorb the next chunk so that small chunks do not accumulate.
+        if len(items) < self.CHUNK_SIZE // 2 and last + 1 < len(self.chunks):
+            last += 1
+            items.extend(self.chunks[last])
+
+        size = self.CHUNK_SIZE
+        new_chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        self.chunks[first:last + 1] = new_chunks
+        self.offsets[first:last + 1] = [0] * len(new_chunks)
+        self.valid_offsets = min(self.valid_offsets, first)
+        self.length += len(values) - (end - start)
+
+    def get_item(self, idx):
+        chunk_idx, offset = self.locate(idx)
+        return self.chunks[chunk_idx][idx - offset]
+
+    def set_item(self, idx, value):
+        chunk_idx, offset = self.locate(idx)
+        self.chunks[chunk_idx][idx - offset] = value
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.chunks)
+
+    def __reversed__(self):
+        for chunk in reversed(self.chunks):
+            for item in reversed(chunk):
+                yield item
@@ -0,0 +1,159 @@
+"""Index of the stack deltas of linear instructions.
+
+The number of items on the stack before an instruction is the sum of the
+deltas of the instructions before it. A DeltaIndex answers such sums in
+O(log n + BLOCK_SIZE) time, and is updated as instructions are edited
+rather than summing the deltas of the whole script on every query.
+
+Deltas are stored in blocks. Fenwick trees (binary indexed trees) over the
+block lengths and block sums find the block that contains an index, and
+the sum of the blocks before it. An edit within a block updates the trees
+in O(log n) time; an edit that splits or merges blocks rebuilds them,
+which takes time linear in the number of blocks.
+
+Some deltas cannot be known before execution (e.g. that of OP_IFDUP when
+its argument is not a constant). They are stored as None, and sums over
+ranges that include them are None, so that callers must handle them.
+"""
+
+class FenwickTree(object):
+    """Binary indexed tree of numbers, for prefix sums of values that change."""
+    def __init__(self, values=()):
+        tree = [0] + list(values)
+        # Build the tree in linear time by adding each node to its parent.
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, idx, amount):
+        """Add amount to the value at idx."""
+        tree = self.tree
+        i = idx + 1
+        while i < len(tree):
+            tree[i] += amount
+            i += i & -i
+
+    def prefix_sum(self, count):
+        """Get the sum of the first count values."""
+        tree = self.tree
+        total = 0
+        i = count
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def search(self, value):
+        """Get the largest count of leading values whose sum is at most value.
+
+        Values must not be negative.
+        """
+        tree = self.tree
+        pos = 0
+        step = 1
+        while step * 2 < len(tree):
+            step *= 2
+        while step:
+            i = pos + step
+            if i < len(tree) and tree[i] <= value:
+                pos = i
+                value -= tree[i]
+            step //= 2
+        return pos
+
+class DeltaIndex(object):
+    """Prefix sums of a sequence of deltas, some of which may be unknown (None)."""
+    BLOCK_SIZE = 64
+    def __init__(self, deltas=()):
+        self.set_deltas(list(deltas))
+
+    def set_deltas(self, deltas):
+        """Replace every delta with those in the list deltas."""
+        size = self.BLOCK_SIZE
+        self.build([deltas[i:i + size] for i in range(0, len(deltas), size)])
+
+    def build(self, blocks):
+        """Build the index from a list of non-empty blocks of deltas."""
+        self.blocks = blocks
+        self.length = sum(len(block) for block in blocks)
+        self.lengths = FenwickTree(len(block) for block in blocks)
+        self.sums = FenwickTree(self.block_sum(block) for block in blocks)
+        self.unknowns = FenwickTree(block.count(None) for block in blocks)
+
+    @staticmethod
+    def block_sum(deltas):
+        """Get the sum of the known deltas in a list of deltas."""
+        return sum(delta for delta in deltas if delta is not None)
+
+    def __len__(self):
+        return self.length
+
+    def locate(self, idx):
+        """Get the (block_index, block_offset) of the block that contains idx (0 <= idx < len(self))."""
+        block_idx = self.lengths.search(idx)
+        return block_idx, self.lengths.prefix_sum(block_idx)
+
+    def __getitem__(self, idx):
+        block_idx, offset = self.locate(idx)
+        return self.blocks[block_idx][idx - offset]
+
+    def prefix(self, count):
+        """Get the (sum, unknowns) of the known deltas and unknown deltas among the first count deltas."""
+        count = max(0, min(count, self.length))
+        if count == self.length:
+            return self.sums.prefix_sum(len(self.blocks)), self.unknowns.prefix_sum(len(self.blocks))
+        block_idx, offset = self.locate(count)
+        part = self.blocks[block_idx][:count - offset]
+        return (self.sums.prefix_sum(block_idx) + self.block_sum(part),
+                self.unknowns.prefix_sum(block_idx) + part.count(None))
+
+    def sum(self, start, end):
+        """Get the sum of the deltas from [start : end], or None if any of them is unknown.
+
+        Indices are clamped to the sequence as in slicing.
+        """
+        if end <= start:
+            return 0
+        end_sum, end_unknowns = self.prefix(end)
+        start_sum, start_unknowns = self.prefix(start)
+        if end_unknowns != start_unknowns:
+            return None
+        return end_sum - start_sum
+
+    def __setitem__(self, idx, delta):
+        block_idx, offset = self.locate(idx)
+        block = self.blocks[block_idx]
+        old = block[idx - offset]
+        if old == delta:
+            return
+        block[idx - offset] = delta
+        self.sums.add(block_idx, (delta or 0) - (old or 0))
+        self.unknowns.add(block_idx, (delta is None) - (old is None))
+
+    def replace(self, start, end, deltas):
+        """Replace the deltas from [start : end] with the list deltas."""
+        if not self.blocks:
+            return self.set_deltas(deltas)
+        first, first_offset = self.locate(min(start, self.length - 1))
+        last, last_offset = self.locate(end - 1) if end > start else (first, first_offset)
+        block = self.blocks[first]
+        new_length = len(block) + len(deltas) - (end - start)
+        # Edit the block in place if the edit is within it and leaves it a reasonable size.
+        if first == last and 0 < new_length <= 2 * self.BLOCK_SIZE:
+            old = block[start - first_offset:end - first_offset]
+            block[start - first_offset:end - first_offset] = deltas
+            self.length += len(deltas) - (end - start)
+            self.lengths.add(first, len(deltas) - len(old))
+            self.sums.add(first, self.block_sum(deltas) - self.block_sum(old))
+            self.unknowns.add(first, deltas.count(None) - old.count(None))
+            return
+
+        items = self.blocks[first][:start - first_offset] + deltas + self.blocks[last][end - last_offset:]
+        size = self.BLOCK_SIZE
+        new_blocks = [items[i:i + size] for i in range(0, len(items), size)]
+        self.build(self.blocks[:first] + new_blocks + self.blocks[last + 1:])
@@ -1,12 +1,17 @@
-"""Utility functions to convert values between formats."""
+"""Utility functions to convert values between formats.
+
+Integers are encoded the way that Bitcoin script encodes numbers
+(little-endian sign-magnitude), except that byte arrays here are big-endian.
+python-bitcoinlib is only imported by the functions that need it.
+"""
 import binascii
 
 import hexs
 
-from bitcoin import base58
-from bitcoin.core import _bignum
-from bitcoin.core.script import CScriptOp
-from bitcoin.core.scripteval import _CastToBool
+# Small integer opcodes: OP_0 and OP_1 through OP_16.
+OP_0 = 0x00
+OP_1 = 0x51
+OP_16 = 0x60
 
 def hex_to_list(s):
     """Create a list of the bytes in s."""
@@ -15,12 +20,18 @@ def hex_to_list(s):
 
 def int_to_bytearray(value, as_opcode=True):
     """Encode an integer as a byte array or opcode value."""
-    if as_opcode:
-        try:
-            value = int(CScriptOp.encode_op_n(value))
-        except ValueError:
-            pass
-    return _bignum.bn2vch(value)[::-1]
+    if as_opcode and 0 <= value <= 16:
+        value = OP_1 + value - 1 if value else OP_0
+    if value == 0:
+        return b''
+    negative = value < 0
+    data = bytearray(binascii.unhexlify(hexs.format_hex('%x' % abs(value))))
+    # The most significant bit is the sign bit.
+    if data[0] & 0x80:
+        data.insert(0, 0)
+    if negative:
+        data[0] |= 0x80
+    return bytes(data)
 
 def int_to_hex(value):
     """Encode an integer as a hex string.
@@ -42,13 +53,17 @@ def bytearray_to_int(data, decode_small_int=True):
     If decode_small_int is True, a small integer will
     be returned if data is a small int opcode.
     """
-    num = _bignum.vch2bn(data[::-1])
+    data = bytearray(data)
+    if not data:
+        return 0
+    negative = data[0] & 0x80
+    data[0] &= 0x7f
+    num = int(binascii.hexlify(data), 16)
+    if negative:
+        num = -num
     # Decode num if it's a small integer.
-    if decode_small_int:
-        try:
-            return CScriptOp(num).decode_op_n()
-        except Exception:
-            pass
+    if decode_small_int and OP_1 <= num <= OP_16:
+        return num - OP_1 + 1
     return num
 
 def hex_to_int(data):
@@ -56,10 +71,19 @@ def hex_to_int(data):
     return bytearray_to_int(hex_to_bytearray(data))
 
 def bytearray_to_bool(data):
-    return _CastToBool(data)
+    """Decode a byte array into a boolean.
+
+    Negative zero is false.
+    """
+    data = bytearray(data)
+    for i, byte in enumerate(data):
+        if byte != 0:
+            return not (i == len(data) - 1 and byte == 0x80)
+    return False
 
 def address_to_bytearray(s):
     """Decode a base58 address into a bytearray."""
+    from bitcoin import base58
     return base58.CBase58Data(s).to_bytes()
 
 max_int_32 = (1 << 31) - 1
@@ -1,11 +1,11 @@
 import ast
 import copy
-
-from bitcoin.core import _bignum
-from bitcoin.core.script import CScriptOp
-from bitcoin.core.scripteval import _CastToBool
+import re
 
 from txsc.ir import linear_nodes
+from txsc.ir.chunked_list import ChunkedList
+from txsc.ir.packed_list import PackedList
+from txsc.ir.sequences import slice_bounds
 from txsc.ir import structural_nodes
 from txsc.ir import formats
 from txsc.symbols import SymbolType
@@ -20,6 +20,21 @@ def get_instructions_class(instructions_type):
     elif instructions_type == STRUCTURAL:
         return SInstructions
 
+def distinct_nodes(nodes):
+    """Get nodes, with a shallow copy in place of any node that occurs more than once.
+
+    Visitors store metadata (e.g. a node's index) on linear nodes that are
+    not interned, so such a node must not occur more than once in instructions.
+    """
+    seen = set()
+    result = []
+    for node in nodes:
+        if not node.interned:
+            if id(node) in seen:
+                node = copy.copy(node)
+            seen.add(id(node))
+        result.append(node)
+    return result
 
 def format_structural_op(op):
     """Format an op for human-readability."""
@@ -82,9 +97,24 @@ class Instructions(object):
     """Base model for instructions."""
     pass
 
-class LInstructions(Instructions, list):
-    """Model for linear instructions."""
+class BaseLInstructions(Instructions):
+    """Model for linear instructions.
+
+    Subclasses combine this with a mutable sequence type that stores the instructions,
+    and that replaces slices with set_slice(start, end, values) (see txsc.ir.sequences).
+
+    Changes to instructions are tracked, so that visitors can tell whether
+    (and where) instructions changed without comparing them:
+        - modifications is incremented whenever instructions change.
+        - dirty is the (start, end) range of indices that changed since
+          mark_clean() was last called, or None if nothing changed.
+        - listeners are called with (start, end, length) whenever instructions
+          from [start : end] are replaced by length instructions.
+    """
     ir_type = LINEAR
+    modifications = 0
+    dirty = None
+    listeners = ()
     @staticmethod
     def instruction_to_int(op):
         """Get the integer value that op (a nullary opcode) pushes."""
@@ -93,24 +123,116 @@ class LInstructions(Instructions, list):
         elif isinstance(op, linear_nodes.Push):
             return formats.bytearray_to_int(op.data)
 
-
-    def __init__(self, *args):
-        # Perform a deep copy if an LInstructions instance is passed.
-        if len(args) == 1 and isinstance(args[0], LInstructions):
-            return super(LInstructions, self).__init__(copy.deepcopy(args[0]))
-        return super(LInstructions, self).__init__(*args)
-
     def __str__(self):
         return str(map(str, self))
 
+    def mark_changed(self, start, end, length):
+        """Record that instructions from [start : end] were replaced by length instructions."""
+        if start == end and not length:
+            return
+        self.modifications += 1
+        for listener in self.listeners:
+            listener(start, end, length)
+        new_end = start + length
+        if self.dirty is not None:
+            def shift(idx):
+                if idx <= start:
+                    return idx
+                return new_end if idx < end else idx + new_end - end
+            start, new_end = min(shift(self.dirty[0]), start), max(shift(self.dirty[1]), new_end)
+        self.dirty = (start, new_end)
+
+    def add_listener(self, listener):
+        """Call listener(start, end, length) whenever instructions change."""
+        self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener):
+        """Stop calling listener when instructions change."""
+        self.listeners = tuple(i for i in self.listeners if i != listener)
+
+    def mark_clean(self):
+        """Forget the range of instructions that changed."""
+        self.dirty = None
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError('Extended slices of instructions cannot be assigned to')
+            start, end, _ = key.indices(len(self))
+            return self.__setslice__(start, end, value)
+        idx = key + len(self) if key < 0 else key
+        super(BaseLInstructions, self).__setitem__(key, value)
+        self.mark_changed(idx, idx + 1, 1)
+
+    def __setslice__(self, i, j, values):
+        start, end = slice_bounds(i, j, len(self))
+        values = list(values)
+        self.set_slice(start, end, values)
+        self.mark_changed(start, end, len(values))
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError('Extended slices of instructions cannot be deleted')
+            start, end, _ = key.indices(len(self))
+            return self.__delslice__(start, end)
+        idx = key + len(self) if key < 0 else key
+        super(BaseLInstructions, self).__delitem__(key)
+        self.mark_changed(idx, idx + 1, 0)
+
+    def __delslice__(self, i, j):
+        start, end = slice_bounds(i, j, len(self))
+        self.set_slice(start, end, [])
+        self.mark_changed(start, end, 0)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def append(self, value):
+        super(BaseLInstructions, self).append(value)
+        self.mark_changed(len(self) - 1, len(self) - 1, 1)
+
+    def extend(self, values):
+        start = len(self)
+        super(BaseLInstructions, self).extend(values)
+        self.mark_changed(start, start, len(self) - start)
+
+    def insert(self, index, value):
+        if index < 0:
+            index += len(self)
+        start, _ = slice_bounds(index, index, len(self))
+        super(BaseLInstructions, self).insert(start, value)
+        self.mark_changed(start, start, 1)
+
+    def pop(self, index=-1):
+        idx = index + len(self) if index < 0 else index
+        value = super(BaseLInstructions, self).pop(index)
+        self.mark_changed(idx, idx + 1, 0)
+        return value
+
+    def remove(self, value):
+        del self[self.index(value)]
+
+    def reverse(self):
+        super(BaseLInstructions, self).reverse()
+        self.mark_changed(0, len(self), len(self))
+
+    def sort(self, *args, **kwargs):
+        super(BaseLInstructions, self).sort(*args, **kwargs)
+        self.mark_changed(0, len(self), len(self))
+
     def copy_slice(self, start, end):
-        """Create a copy of instructions from [start : end]."""
-        return copy.deepcopy(self[start:end])
+        """Create a copy of instructions from [start : end].
+
+        Nodes are copied shallowly, so they share their (immutable) values.
+        Interned nodes are not copied.
+        """
+        return map(linear_nodes.copy_node, self[start:end])
 
     def insert_slice(self, start, values):
         """Insert a list of instructions at start."""
-        while values:
-            self.insert(start, values.pop(-1))
+        self.replace_slice(start, start, values)
 
     def replace_slice(self, start, end, values):
         """Replace instructions from [start : end] with values."""
@@ -152,11 +274,15 @@ class LInstructions(Instructions, list):
     def replace(self, start, length, callback):
         """Pass [start : length] instructions to callback and replace them with its result."""
         end = start + length
-        values = self.copy_slice(start, end)
-        self.replace_slice(start, end, callback(values))
+        self.replace_slice(start, end, distinct_nodes(callback(self[start:end])))
 
     def replace_template(self, template, callback, strict=True):
-        """Call callback with any instructions matching template."""
+        """Call callback with any instructions matching template.
+
+        callback is passed a list of the matching instructions themselves, not
+        copies of them, so it must not modify them. It returns the instructions
+        to replace them with, which may include any of the matching instructions.
+        """
         idx = 0
         while 1:
             if idx >= len(self):
@@ -176,6 +302,97 @@ class LInstructions(Instructions, list):
                 occurrences.append(i)
         return occurrences
 
+class LInstructions(BaseLInstructions, list):
+    """Linear instructions stored in a list."""
+    def __init__(self, *args):
+        # Copy the nodes if an LInstructions instance is passed, so that metadata
+        # set on the nodes of one instance does not affect the other.
+        if len(args) == 1 and isinstance(args[0], LInstructions):
+            return super(LInstructions, self).__init__(map(linear_nodes.copy_node, args[0]))
+        return super(LInstructions, self).__init__(*args)
+
+    def set_slice(self, start, end, values):
+        """Replace the instructions from [start : end] (non-negative indices) with the list values."""
+        list.__setslice__(self, start, end, values)
+
+class ChunkedLInstructions(BaseLInstructions, ChunkedList):
+    """Linear instructions stored in chunks.
+
+    Edits in the middle of long scripts are cheaper than they are for
+    LInstructions, but indexed reads are slower. Run
+    tools/benchmark-instruction-storage.py to compare them.
+    """
+    pass
+
+class PackedLInstructions(BaseLInstructions, PackedList):
+    """Linear instructions stored as an array of codes.
+
+    This uses a fraction of the memory that LInstructions uses, which
+    matters for very long scripts and for keeping many scripts in memory.
+    Nodes are created whenever instructions are read, so visitors that set
+    metadata on nodes require LInstructions. Converting between the two
+    is lossless:
+
+        packed = PackedLInstructions(instructions)
+        instructions = LInstructions(packed)
+
+    Templates are found by searching the codes with regular expressions.
+    """
+    def template_pattern(self, template, strict=True):
+        """Get a regular expression for the codes of instructions that may match template.
+
+        Matches are candidates that must be confirmed with matches_template().
+        """
+        codec = self.codec
+        parts = []
+        for item in template:
+            if not item:
+                parts.append('.')
+                continue
+            codes = codec.codes_for(lambda cls: issubclass(cls, item.__class__))
+            if not strict:
+                if isinstance(item, linear_nodes.Push):
+                    codes.append(codec.code(linear_nodes.Push))
+                elif isinstance(item, linear_nodes.Assumption):
+                    codes.append(codec.code(linear_nodes.Assumption))
+                elif item.__class__.__name__ == 'SmallIntOpCode':
+                    codes.extend(codec.codes_for(lambda cls: issubclass(cls, linear_nodes.SmallIntOpCode)))
+            parts.append('[%s]' % ''.join(re.escape(chr(i)) for i in set(codes)) if codes else '(?!)')
+        return re.compile(''.join(parts), re.DOTALL)
+
+    def search_template(self, pattern, template, start, strict=True):
+        """Get the index of the first block at or after start that matches template, or -1.
+
+        pattern is the result of template_pattern() for template.
+        """
+        match = pattern.search(self.codes, start)
+        while match:
+            if self.matches_template(template, match.start(), strict):
+                return match.start()
+            match = pattern.search(self.codes, match.start() + 1)
+        return -1
+
+    def find_template(self, template, start=0, strict=True):
+        """Get the index of the first block at or after start that matches template, or -1."""
+        return self.search_template(self.template_pattern(template, strict), template, start, strict)
+
+    def replace_template(self, template, callback, strict=True):
+        pattern = self.template_pattern(template, strict)
+        idx = self.search_template(pattern, template, 0, strict)
+        while idx != -1:
+            self.replace(idx, len(template), callback)
+            idx = self.search_template(pattern, template, idx + len(template), strict)
+
+    def find_occurrences(self, op):
+        template = [op]
+        pattern = self.template_pattern(template)
+        occurrences = []
+        idx = self.search_template(pattern, template, 0)
+        while idx != -1:
+            occurrences.append(idx)
+            idx = self.search_template(pattern, template, idx + 1)
+        return occurrences
+
 class SInstructions(Instructions):
     """Model for structural instructions."""
     ir_type = STRUCTURAL
@@ -245,8 +462,10 @@ class SInstructions(Instructions):
         return SymbolType.Expr
 
 
-    def __init__(self, script=structural_nodes.Script()):
+    def __init__(self, script=structural_nodes.Script(), has_locations=False):
         self.script = script
+        # Whether every node in script has a line number.
+        self.has_locations = has_locations
 
     def dump(self, *args):
         return self.script.dump(*args)
@@ -1,8 +1,10 @@
+import bisect
 from collections import defaultdict
 import copy
 
 from txsc.transformer import BaseTransformer
 from txsc.ir import formats, IRError
+from txsc.ir.delta_index import DeltaIndex
 from txsc.ir.instructions import LInstructions
 from txsc.ir.linear_visitor import LIROptions, BaseLinearVisitor, StackState
 import txsc.ir.linear_nodes as types
@@ -16,6 +18,9 @@ class ConditionalBranch(object):
         end (int): The index of the last op of this branch.
         nest_level (int): The level of nesting that this branch is at.
         orelse (ConditionalBranch): The corresponding conditional branch.
+        parent (ConditionalBranch): The branch that this branch is nested in.
+        children (list): The branches nested directly in this branch, in order of start.
+        delta (int): The total delta of this branch's ops, or None if it is unknown.
 
     """
     def __init__(self, is_truebranch=True, start=0, end=0, nest_level=0, orelse=None):
@@ -24,6 +29,9 @@ class ConditionalBranch(object):
         self.end = end
         self.nest_level = nest_level
         self.orelse = orelse
+        self.parent = None
+        self.children = []
+        self.delta = 0
 
     def __str__(self):
         return '%s(%s, %s)' % (self.is_truebranch, self.start, self.end)
@@ -36,8 +44,104 @@ class ConditionalBranch(object):
             return True
         return False
 
+class BranchIndex(object):
+    """Interval index of the conditional branches of a script.
+
+    Branches are arranged in a tree by nesting. Sibling branches do not
+    overlap, so the innermost branch that contains an index is found with
+    a binary search at each level of nesting. Branches are also sorted by
+    start and by end, with running totals of their deltas, so that branches
+    which start after or end before an index are counted and summed with
+    binary searches.
+    """
+    def __init__(self, branches, delta_sum):
+        # Branches in order of start.
+        self.branches = branches
+        self.starts = [branch.start for branch in branches]
+        self.roots = []
+        # Branches that the current branch may be nested in, from the outermost.
+        enclosing = []
+        for branch in branches:
+            while enclosing and not enclosing[-1].is_in_branch(branch.start):
+                enclosing.pop()
+            branch.parent = enclosing[-1] if enclosing else None
+            branch.children = []
+            (branch.parent.children if branch.parent else self.roots).append(branch)
+            enclosing.append(branch)
+        # {parent_branch: [child_start, ...], ...}, with None as the parent of top-level branches.
+        self.child_starts = dict((branch, [child.start for child in branch.children]) for branch in branches)
+        self.child_starts[None] = [branch.start for branch in self.roots]
+
+        # Running totals of the deltas of branches in order of end.
+        # Branches whose deltas are unknown are counted separately.
+        by_end = sorted(branches, key=lambda branch: branch.end)
+        self.ends = [branch.end for branch in by_end]
+        self.delta_totals = {True: [0], False: [0]}
+        self.unknown_totals = [0]
+        for branch in by_end:
+            branch.delta = delta_sum(branch.start, branch.end)
+            for is_truebranch, totals in self.delta_totals.items():
+                known = branch.delta is not None and branch.is_truebranch == is_truebranch
+                totals.append(totals[-1] + (branch.delta if known else 0))
+            self.unknown_totals.append(self.unknown_totals[-1] + (branch.delta is None))
+
+    def innermost(self, idx):
+        """Get the innermost branch that contains idx, or None."""
+        branch = None
+        children = self.roots
+        while children:
+            i = bisect.bisect_right(self.child_starts[branch], idx) - 1
+            if i < 0 or not children[i].is_in_branch(idx):
+                break
+            branch = children[i]
+            children = branch.children
+        return branch
+
+    def count_following(self, idx):
+        """Get the number of branches that start and end after idx."""
+        i = bisect.bisect_right(self.starts, idx)
+        count = len(self.branches) - i
+        # An empty branch that starts right after idx ends at idx.
+        if i < len(self.branches) and self.branches[i].end <= idx:
+            count -= 1
+        return count
+
+    def ended_before(self, idx):
+        """Get the total deltas of true branches and false branches that end before idx.
+
+        Returns a (true_delta, false_delta, unknowns) tuple, where unknowns is
+        the number of those branches whose deltas are unknown.
+        """
+        i = bisect.bisect_left(self.ends, idx)
+        return (self.delta_totals[True][i], self.delta_totals[False][i], self.unknown_totals[i])
+
+def shift_indices(indices, start, end, delta):
+    """Update a sorted list of indices after instructions from [start : end] are replaced.
+
+    Indices in [start : end] are removed, and those after it are shifted by delta.
+    """
+    lo = bisect.bisect_left(indices, start)
+    hi = bisect.bisect_left(indices, end, lo)
+    if delta or hi > lo:
+        indices[lo:] = [i + delta for i in indices[hi:]]
+
 class LinearContextualizer(BaseLinearVisitor):
-    """Populates metadata attributes of linear IR instructions."""
+    """Populates metadata attributes of linear IR instructions.
+
+    After instructions are contextualized, changes to them are tracked, so
+    contextualizing them again only examines the instructions that changed.
+    The indices of assumptions, conditionals, and instructions that hold
+    metadata are kept in sorted lists, which are shifted when instructions
+    change instead of being found by scanning the whole script.
+    The deltas of instructions are kept in a DeltaIndex, so that the
+    stack depth at an index is found without summing every delta before it.
+    """
+    # Instructions whose metadata depends on the instructions before them.
+    # They are visited again whenever an instruction before them changes.
+    metadata_classes = (types.Pick, types.Roll, types.IfDup, types.CheckMultiSig)
+    conditional_classes = (types.If, types.NotIf, types.Else, types.EndIf)
+    hash_classes = (types.Hash160, types.RipeMD160, types.Hash256, types.Sha256)
+
     def __init__(self, symbol_table, options=LIROptions()):
         super(LinearContextualizer, self).__init__(symbol_table, options)
         # {assumption_name: [occurrence_index, ...], ...}
@@ -46,8 +150,23 @@ class LinearContextualizer(BaseLinearVisitor):
         self.duplicated_assumptions = defaultdict(list)
         # [ConditionalBranch(), ...]
         self.branches = []
+        self.branch_index = BranchIndex([], None)
+        # {nest_level: ConditionalBranch(), ...} of the last branch at each level.
+        self.last_branches = {}
+        # Indices of conditional opcodes, instructions with metadata, and hash opcodes.
+        self.conditionals = []
+        self.metadata_ops = []
+        self.hash_ops = []
+        # Deltas of instructions.
+        self.deltas = DeltaIndex()
         # Current level of conditional nesting.
         self.current_nest_level = 0
+        # Index of the instruction being visited.
+        self.current_idx = -1
+        # Instructions that were last contextualized.
+        self.instructions = None
+        # (start, end) ranges of instructions that changed since they were contextualized.
+        self.changed_regions = []
 
     def log_and_raise(self, err_class, msg):
         """Log an error and raise an exception."""
@@ -74,7 +193,7 @@ class LinearContextualizer(BaseLinearVisitor):
                 if ops[0].var_name != ops[1].var_name:
                     continue
                 # Append the negative index of the operation to duplicated_assumptions[assumption_name].
-                self.duplicated_assumptions[ops[0].var_name].append(-1 * (len(self.instructions) - ops[-1].idx))
+                self.duplicated_assumptions[ops[0].var_name].append(-1 * (len(self.instructions) - (i + len(template) - 1)))
 
     def is_duplicated_assumption(self, op):
         """Get whether op is in an operation that uses its assumed value twice."""
@@ -89,33 +208,39 @@ class LinearContextualizer(BaseLinearVisitor):
             return True
         return False
 
-    def following_occurrences(self, assumption_name, idx):
-        """Get the indices of occurrences of assumption_name after idx."""
-        branches = list(self.branches)
-        match_any_branch = False
-        if self.is_before_conditionals(idx):
-            match_any_branch = True
+    def following_occurrence_counts(self, assumption_name, idx):
+        """Get the occurrences of assumption_name after idx, and the number of times each is counted.
 
+        An occurrence is counted once for each conditional branch that starts
+        and ends after idx, and once more if it is after the last branch.
+        Returns a list of (occurrence_index, count) tuples whose counts are nonzero.
+        """
         assumptions = self.assumptions[assumption_name]
-        following = []
+        following = assumptions[bisect.bisect_right(assumptions, idx):]
+        if not self.branches:
+            return [(assumption_idx, 1) for assumption_idx in following]
 
-        for assumption_idx in assumptions:
-            if assumption_idx <= idx:
-                continue
-            if not branches:
-                following.append(assumption_idx)
-            else:
-                for branch in branches:
-                    if not match_any_branch and branch.is_in_branch(idx):
-                        continue
-                    if branch.end > idx:
-                        following.append(assumption_idx)
+        branch_count = self.branch_index.count_following(idx)
+        last_end = self.branches[-1].end
+        counts = [(assumption_idx, branch_count + (assumption_idx > last_end)) for assumption_idx in following]
+        return [(assumption_idx, count) for assumption_idx, count in counts if count]
 
-                # Assumption beyond a conditional.
-                if assumption_idx > branches[-1].end:
-                    following.append(assumption_idx)
+    def following_occurrences(self, assumption_name, idx):
+        """Get the indices of occurrences of assumption_name after idx.
 
-        return following
+        Each index is repeated as many times as it is counted (see following_occurrence_counts()).
+        """
+        return [assumption_idx for assumption_idx, count in self.following_occurrence_counts(assumption_name, idx)
+                for _ in range(count)]
+
+    def next_assumption(self, start):
+        """Get the index of the first assumption at or after start, or None if there is none."""
+        following = []
+        for indices in self.assumptions.itervalues():
+            i = bisect.bisect_left(indices, start)
+            if i < len(indices):
+                following.append(indices[i])
+        return min(following) if following else None
 
     def nextop(self, op):
         """Get the operation that follows op."""
@@ -124,6 +249,13 @@ class LinearContextualizer(BaseLinearVisitor):
         except IndexError:
             return None
 
+    def delta_sum(self, start, end):
+        """Get the total delta of script operations from [start : end]."""
+        total = self.deltas.sum(start, end)
+        if total is None:
+            self.log_and_raise(IRError, 'Stack depth cannot be determined after an OP_IFDUP with a non-constant argument')
+        return total
+
     def total_delta(self, idx):
         """Get the total delta of script operations before idx."""
         total = 0
@@ -131,89 +263,201 @@ class LinearContextualizer(BaseLinearVisitor):
         total += len(self.symbol_table.lookup('_stack_names').value)
         branches = self.branches
         if self.is_before_conditionals(idx):
-            total += sum(i.delta for i in self.instructions[:idx])
+            total += self.delta_sum(0, idx)
             return total
 
-        idx_branch = None
         # Find the branch that idx is in.
-        for branch in branches:
-            if branch.is_in_branch(idx):
-                if not idx_branch or idx_branch.nest_level < branch.nest_level:
-                    idx_branch = branch
+        idx_branch = self.branch_index.innermost(idx)
 
         # Add the deltas of instructions before the first branch in the script.
-        total += sum(i.delta for i in self.instructions[:branches[0].start])
-        branch_deltas = {True: [], False: []}
-        for branch in branches:
-            if branch == idx_branch:
-                # Add the deltas of instructions before idx in its branch.
-                total += sum(i.delta for i in self.instructions[branch.start:idx])
-            elif branch.end < idx and (not idx_branch or branch != idx_branch.orelse):
-                # Sum the deltas of conditional branches before idx.
-                branch_deltas[branch.is_truebranch].append(sum(i.delta for i in self.instructions[branch.start:branch.end]))
+        total += self.delta_sum(0, branches[0].start)
+        if idx_branch:
+            # Add the deltas of instructions before idx in its branch.
+            total += self.delta_sum(idx_branch.start, idx)
+
+        # Sum the deltas of conditional branches before idx, other than the
+        # branch that corresponds to the branch idx is in.
+        true_delta, false_delta, unknowns = self.branch_index.ended_before(idx)
+        orelse = idx_branch.orelse if idx_branch else None
+        if orelse is not None and orelse.end < idx:
+            if orelse.delta is None:
+                unknowns -= 1
+            elif orelse.is_truebranch:
+                true_delta -= orelse.delta
+            else:
+                false_delta -= orelse.delta
+        if unknowns:
+            self.log_and_raise(IRError, 'Stack depth cannot be determined after an OP_IFDUP with a non-constant argument')
 
         # If the index is after a conditional branch, check that the
         # branches before it result in the same number of stack items.
-        if not sum(branch_deltas[True]) == sum(branch_deltas[False]):
+        if not true_delta == false_delta:
             self.log_and_raise(IRError, 'Assumption encountered after uneven conditional')
         # Add the deltas from conditional branches before idx.
-        total += sum(branch_deltas[True])
+        total += true_delta
 
         return total
 
     def get_last_branch(self):
         """Get the last conditional branch with the current nest level."""
-        for branch in reversed(self.branches):
-            if branch.nest_level == self.current_nest_level:
-                return branch
+        return self.last_branches.get(self.current_nest_level)
+
+    def add_branch(self, branch):
+        """Add a conditional branch."""
+        self.branches.append(branch)
+        self.last_branches[branch.nest_level] = branch
 
     def contextualize(self, instructions):
         """Perform contextualization on instructions.
 
         Most of these calculations will only succeed if no script execution
         must be done to place the necessary arguments into position on the stack.
+
+        If instructions were the last instructions contextualized, only
+        the instructions that changed since then are examined.
         """
         if not isinstance(instructions, LInstructions):
             raise TypeError('A LInstructions instance is required')
-        self.assumptions.clear()
-        self.branches = []
-        self.instructions = instructions
+        if instructions is not self.instructions:
+            self.detach()
+            self.instructions = instructions
+            self.changed_regions = [(0, len(instructions))]
+            self.assumptions.clear()
+            self.conditionals, self.metadata_ops, self.hash_ops = [], [], []
+            self.deltas = DeltaIndex(op.delta for op in instructions)
+            instructions.add_listener(self.instructions_changed)
+        # Nothing needs to be done if instructions have not changed.
+        if not self.changed_regions:
+            return
 
-        for i, instruction in enumerate(iter(instructions)):
+        try:
+            self.update()
+        except Exception:
+            # Contextualize all instructions next time.
+            self.detach()
+            raise
+
+    def detach(self):
+        """Stop tracking changes to the instructions that were last contextualized."""
+        if self.instructions is not None:
+            self.instructions.remove_listener(self.instructions_changed)
+        self.instructions = None
+
+    def index_lists(self):
+        """Get the sorted lists of instruction indices."""
+        return self.assumptions.values() + [self.conditionals, self.metadata_ops, self.hash_ops]
+
+    def instructions_changed(self, start, end, length):
+        """Update indices after instructions from [start : end] are replaced by length instructions."""
+        delta = length - (end - start)
+        for indices in self.index_lists():
+            shift_indices(indices, start, end, delta)
+        self.deltas.replace(start, end, [op.delta for op in self.instructions[start:start + length]])
+
+        # Merge the replaced range into the ranges that changed.
+        new_end = start + length
+        regions = []
+        for region_start, region_end in self.changed_regions:
+            if region_end < start:
+                regions.append((region_start, region_end))
+            elif region_start > end:
+                regions.append((region_start + delta, region_end + delta))
+            else:
+                start = min(start, region_start)
+                if region_end >= end:
+                    new_end = max(new_end, region_end + delta)
+        regions.append((start, new_end))
+        regions.sort()
+        self.changed_regions = regions
+
+    def index_instruction(self, instruction, idx):
+        """Add idx to the lists of indices that instruction belongs in."""
+        if isinstance(instruction, types.Assumption):
+            bisect.insort(self.assumptions[instruction.var_name], idx)
+        elif isinstance(instruction, self.conditional_classes):
+            bisect.insort(self.conditionals, idx)
+        elif isinstance(instruction, self.metadata_classes):
+            bisect.insort(self.metadata_ops, idx)
+        elif isinstance(instruction, self.hash_classes):
+            bisect.insort(self.hash_ops, idx)
+
+    def update(self):
+        """Contextualize the instructions that changed since they were last contextualized."""
+        regions, self.changed_regions = self.changed_regions, []
+        instructions = self.instructions
+        for start, end in regions:
+            for i in range(start, end):
+                instruction = instructions[i]
+                # Interned nodes are shared, so visitors use current_idx rather than their idx.
+                if not instruction.interned:
+                    instruction.idx = i
+                self.index_instruction(instruction, i)
+        first_change = regions[0][0]
+
+        # Assumptions after the first change may have moved.
+        for indices in self.assumptions.itervalues():
+            for i in indices[bisect.bisect_left(indices, first_change):]:
+                instructions[i].idx = i
+
+        # Metadata depends on the instructions before an instruction, so any
+        # instruction with metadata after the first change is visited again.
+        for i in self.metadata_ops[bisect.bisect_left(self.metadata_ops, first_change):]:
+            self.current_idx = i
+            instruction = instructions[i]
             instruction.idx = i
             self.visit(instruction)
+            # Visitors may determine deltas (e.g. that of OP_IFDUP).
+            self.deltas[i] = instruction.delta
+
+        # Branches are indexed with their deltas, so they are built once deltas are known.
+        self.build_branches()
+
+        # Validate arguments for certain opcodes.
+        # Hash opcodes are validated against the two instructions after them.
+        if not self.options.allow_invalid_comparisons:
+            for start, end in regions:
+                lo = bisect.bisect_left(self.hash_ops, start - 2)
+                hi = bisect.bisect_left(self.hash_ops, end, lo)
+                for i in self.hash_ops[lo:hi]:
+                    instruction = instructions[i]
+                    if isinstance(instruction, (types.Hash160, types.RipeMD160)):
+                        self.check_Hash160(instruction, i)
+                    else:
+                        self.check_Hash256(instruction, i)
+
+    def build_branches(self):
+        """Build the conditional branches of the script from its conditional opcodes."""
+        self.branches = []
+        self.last_branches = {}
+        self.current_nest_level = 0
+        for i in self.conditionals:
+            self.current_idx = i
+            self.visit(self.instructions[i])
 
         # If the current nest level is greater than 0,
         # then the script ended within a conditional branch.
         if self.current_nest_level > 0:
             self.log_and_raise(IRError, 'Script ended without ending all conditionals')
+        self.branch_index = BranchIndex(self.branches, self.deltas.sum)
 
-        # Validate arguments for certain opcodes.
-        if not self.options.allow_invalid_comparisons:
-            for instruction in self.instructions:
-                if isinstance(instruction, (types.Hash160, types.RipeMD160)):
-                    self.check_Hash160(instruction)
-                elif isinstance(instruction, (types.Hash256, types.Sha256)):
-                    self.check_Hash256(instruction)
-
-    def check_Hash160(self, op):
+    def check_Hash160(self, op, idx):
         """Check that 20-byte pushes are used as RIPEMD-160 hashes."""
-        data_push = self.nextop(op)
-        if not isinstance(data_push, types.Push):
+        following = self.instructions[idx + 1:idx + 3]
+        if len(following) < 2 or not isinstance(following[0], types.Push):
             return
-        opcode = self.nextop(data_push)
+        data_push, opcode = following
 
         if not isinstance(opcode, (types.Equal, types.EqualVerify)):
             return
         if len(data_push.data) != 20:
             self.log_and_raise(IRError, 'Non-hash160 compared to the result of %s' % op.name)
 
-    def check_Hash256(self, op):
+    def check_Hash256(self, op, idx):
         """Check that 32-byte pushes are used as SHA256 hashes."""
-        data_push = self.nextop(op)
-        if not isinstance(data_push, types.Push):
+        following = self.instructions[idx + 1:idx + 3]
+        if len(following) < 2 or not isinstance(following[0], types.Push):
             return
-        opcode = self.nextop(data_push)
+        data_push, opcode = following
 
         if not isinstance(opcode, (types.Equal, types.EqualVerify)):
             return
@@ -226,25 +470,22 @@ class LinearContextualizer(BaseLinearVisitor):
             return
         return method(instruction)
 
-    def visit_Assumption(self, op):
-        self.assumptions[op.var_name].append(op.idx)
-
     def visit_If(self, op):
         self.current_nest_level += 1
-        self.branches.append(ConditionalBranch(is_truebranch = True, start = op.idx + 1, nest_level = self.current_nest_level))
+        self.add_branch(ConditionalBranch(is_truebranch = True, start = self.current_idx + 1, nest_level = self.current_nest_level))
 
     def visit_NotIf(self, op):
         self.current_nest_level += 1
-        self.branches.append(ConditionalBranch(is_truebranch = False, start = op.idx + 1, nest_level = self.current_nest_level))
+        self.add_branch(ConditionalBranch(is_truebranch = False, start = self.current_idx + 1, nest_level = self.current_nest_level))
 
     def visit_Else(self, op):
         last_branch = self.get_last_branch()
         if not last_branch:
             self.log_and_raise(IRError, 'Else statement requires a preceding If or NotIf statement')
-        last_branch.end = op.idx - 1
+        last_branch.end = self.current_idx - 1
 
-        new_branch = ConditionalBranch(is_truebranch = not last_branch.is_truebranch, start = op.idx + 1, nest_level = self.current_nest_level, orelse = last_branch)
-        self.branches.append(new_branch)
+        new_branch = ConditionalBranch(is_truebranch = not last_branch.is_truebranch, start = self.current_idx + 1, nest_level = self.current_nest_level, orelse = last_branch)
+        self.add_branch(new_branch)
         # Assign this branch to the orelse attribute of the preceding statement.
         last_branch.orelse = new_branch
 
@@ -252,19 +493,19 @@ class LinearContextualizer(BaseLinearVisitor):
         last_branch = self.get_last_branch()
         if not last_branch:
             self.log_and_raise(IRError, 'EndIf encountered with no preceding conditional')
-        last_branch.end = op.idx - 1
+        last_branch.end = self.current_idx - 1
         self.current_nest_level -= 1
 
     def visit_CheckMultiSig(self, op):
         """Attempt to determine opcode arguments."""
         i = 1
-        num_pubkeys = LInstructions.instruction_to_int(self.instructions[op.idx - i])
+        num_pubkeys = LInstructions.instruction_to_int(self.instructions[self.current_idx - i])
         if num_pubkeys is None:
             return
 
         i += 1
         i += num_pubkeys
-        num_sigs = LInstructions.instruction_to_int(self.instructions[op.idx - i])
+        num_sigs = LInstructions.instruction_to_int(self.instructions[self.current_idx - i])
         if num_sigs is None:
             return
 
@@ -280,7 +521,7 @@ class LinearContextualizer(BaseLinearVisitor):
 
     def visit_IfDup(self, op):
         """Attempt to determine opcode's delta."""
-        arg = LInstructions.instruction_to_int(self.instructions[op.idx - 1])
+        arg = LInstructions.instruction_to_int(self.instructions[self.current_idx - 1])
         if arg is None:
             return
 
@@ -288,7 +529,7 @@ class LinearContextualizer(BaseLinearVisitor):
 
     def visit_Pick(self, op):
         """Attempt to determine opcode argument."""
-        arg = LInstructions.instruction_to_int(self.instructions[op.idx - 1])
+        arg = LInstructions.instruction_to_int(self.instructions[self.current_idx - 1])
         if arg is None:
             return
 
@@ -308,15 +549,14 @@ class LinearInliner(BaseLinearVisitor):
     def inline(self, instructions, peephole_optimizer):
         """Perform inlining of variables in instructions.
 
-        Inlining is performed by iterating through each instruction and
-        calling visitor methods. If no result is returned, the next
-        instruction is visited.
+        Instructions are walked once, from the first to the last. A model
+        of the stack (self.stack) is kept up to date with the instructions
+        before the current index, and each assumption is replaced with the
+        stack operations that bring its value to the top of the stack.
 
-        If there is a result, the instruction is replaced with that result,
-        and the iteration begins again.
-
-        Inlining ends when all instructions have been iterated over without
-        any result.
+        Replacements are contextualized incrementally, and peephole
+        optimization is performed once beforehand. The caller optimizes
+        the inlined instructions afterwards.
         """
         if not isinstance(instructions, LInstructions):
             raise TypeError('A LInstructions instance is required')
@@ -327,29 +567,30 @@ class LinearInliner(BaseLinearVisitor):
         if stack_names:
             self.stack.add_stack_assumptions([types.Assumption(var_name) for var_name in stack_names.value])
 
-        # Find operations that use the same assumed stack item more than once.
         self.contextualizer.contextualize(instructions)
+        peephole_optimizer.optimize(instructions)
+        self.contextualizer.contextualize(instructions)
+        # Find operations that use the same assumed stack item more than once.
+        # Their offsets count back from the end, so this is done after the optimization above.
         self.contextualizer.find_duplicate_assumptions()
 
-        # Loop until no inlining can be done.
-        while 1:
-            self.stack.clear(clear_assumptions=False)
-            peephole_optimizer.optimize(instructions)
+        # Instructions before processed have been applied to the stack model.
+        processed = 0
+        i = self.contextualizer.next_assumption(0)
+        while i is not None:
+            self.stack.process_instructions(instructions[processed:i])
+            processed = i
+            result = self.visit(instructions[i])
+            if result is None:
+                i = self.contextualizer.next_assumption(i + 1)
+                continue
+            if not isinstance(result, list):
+                result = [result]
+            # The replacement is applied to the stack model with the instructions after it.
+            instructions.replace_slice(i, i + 1, result)
             self.contextualizer.contextualize(instructions)
-            inlined = False
-            for i, node in enumerate(instructions):
-                result = self.visit(node)
-                if result is None:
-                    continue
-                if not isinstance(result, list):
-                    result = [result]
-
-                instructions.replace_slice(i, i+1, result)
-                inlined = True
-                break
-
-            if not inlined:
-                break
+            i = self.contextualizer.next_assumption(i)
+        self.contextualizer.detach()
 
     def visit_consecutive_assumptions(self, assumptions):
         """Handle a row of consecutive assumptions."""
@@ -384,14 +625,14 @@ class LinearInliner(BaseLinearVisitor):
         # Use OP_PICK if there are other occurrences after this one,
         # or if the same assumed item is used more than once in an operation.
         opcode = types.Roll
-        following = self.contextualizer.following_occurrences(op.var_name, op.idx)
+        following = self.contextualizer.following_occurrence_counts(op.var_name, op.idx)
         if following:
             # Don't change the opcode if the only following occurrence is a duplicated assumption.
             nextop = self.contextualizer.nextop(op)
             # If more than one occurrence follows, use OP_PICK.
-            if len(following) > 1:
+            if sum(count for _, count in following) > 1:
                 opcode = types.Pick
-            elif nextop.idx not in following or not self.contextualizer.is_duplicated_assumption(nextop):
+            elif following[0][0] != op.idx + 1 or not self.contextualizer.is_duplicated_assumption(nextop):
                 opcode = types.Pick
         if self.contextualizer.is_duplicated_assumption(op):
             opcode = types.Pick
@@ -404,7 +645,6 @@ class LinearInliner(BaseLinearVisitor):
         return method(instruction)
 
     def visit_Assumption(self, op):
-        self.stack.process_instructions(self.instructions[:op.idx])
         # Detect whether there are multiple assumptions in a row.
         assumptions = [op]
         symbols = [self.symbol_table.lookup(op.var_name)]
@@ -2,10 +2,31 @@
 
 Most attributes of these do not need to be supplied by the
 caller. They will be determined automatically during contextualization.
+
+Opcodes that take no arguments are interned: instantiating one of their
+classes always returns the same node, and such nodes compare by identity.
+Interned nodes cannot hold metadata, so visitors must not set attributes
+(e.g. idx) on them. Opcode classes defined outside this module (e.g. by
+plugins) are only interned if they set interned to True themselves.
 """
+import copy
 import inspect
+import operator
 import sys
 
+class NodeType(type):
+    """Metaclass for nodes.
+
+    Precomputes the function that gets the values which nodes of a class
+    are compared by.
+    """
+    def __init__(cls, name, bases, attrs):
+        super(NodeType, cls).__init__(name, bases, attrs)
+        cls.comparison_key = staticmethod(operator.attrgetter(*cls.comparators))
+        # Classes from other modules do not inherit interning from built-in opcodes.
+        if cls.__module__ != __name__ and 'interned' not in attrs:
+            cls.interned = False
+
 class Node(object):
     """Base class for nodes.
 
@@ -15,57 +36,72 @@ class Node(object):
         - idx (int): This node's index in the script.
         - comparators (tuple): Tuple of attributes that should be used when comparing
             two nodes of this type.
+        - interned (bool): Whether there is only one instance of this node type.
 
     """
+    __metaclass__ = NodeType
+    __slots__ = ()
     name = ''
     delta = 0
     idx = -1
     comparators = ('name',)
+    interned = False
     def __init__(self, delta=None):
         if isinstance(delta, int):
             self.delta = delta
 
     def __eq__(self, other):
-        same_values = all(getattr(other, attr) == getattr(self, attr) for attr in self.comparators)
-        return isinstance(other, self.__class__) and same_values
+        if self is other:
+            return True
+        return isinstance(other, self.__class__) and self.comparison_key(other) == self.comparison_key(self)
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
 class InnerScript(Node):
     """A script contained inside a script."""
+    __slots__ = ('ops', 'idx')
     name = 'innerscript'
-    ops = None
+    delta = 1
     comparators = Node.comparators + ('ops',)
     def __init__(self, ops=None, **kwargs):
-        kwargs['delta'] = 1
         super(InnerScript, self).__init__(**kwargs)
         self.ops = ops if ops is not None else []
+        self.idx = -1
 
 class Assumption(Node):
     """Assumption that a stack value exists."""
+    __slots__ = ('var_name', 'idx')
     name = 'assume'
-    var_name = ''
     comparators = Node.comparators + ('var_name',)
     def __init__(self, var_name='', **kwargs):
         super(Assumption, self).__init__(**kwargs)
         self.var_name = var_name
+        self.idx = -1
 
     def __str__(self):
         return 'assume(%s)'%self.var_name
 
 class Push(Node):
+    __slots__ = ('data', 'idx')
     name = 'push'
+    delta = 1
     comparators = Node.comparators + ('data',)
     def __init__(self, data=None, **kwargs):
-        kwargs['delta'] = 1
-
         super(Push, self).__init__(**kwargs)
         self.data = data
+        self.idx = -1
 
     def __str__(self):
         return self.data.encode('hex')
 
+def copy_node(node):
+    """Get a shallow copy of node, or node itself if it is interned."""
+    return node if node.interned else copy.copy(node)
+
+# {opcode_class: instance, ...}
+_interned_opcodes = {}
+
 class OpCode(Node):
     """An opcode.
 
@@ -76,13 +112,29 @@ class OpCode(Node):
         - verifier (bool): Whether this opcode performs verification.
         - args (list): The relative indices of nodes that this opcode affects.
 
+    Opcodes are interned unless their class sets interned to False.
+    Those that are not interned can hold metadata set by visitors.
     """
+    __slots__ = ()
     arithmetic = False
     byte_manipulator = False
     opstr = None
     verifier = False
     args = None
+    interned = True
+    def __new__(cls, **kwargs):
+        if not cls.interned:
+            return super(OpCode, cls).__new__(cls)
+        if kwargs:
+            raise TypeError('%s is interned and cannot be created with arguments' % cls.__name__)
+        instance = _interned_opcodes.get(cls)
+        if instance is None:
+            instance = _interned_opcodes[cls] = super(OpCode, cls).__new__(cls)
+        return instance
+
     def __init__(self, **kwargs):
+        if not kwargs:
+            return
         super(OpCode, self).__init__(**kwargs)
         if kwargs.get('args'):
             self.args = list(kwargs['args'])
@@ -111,6 +163,7 @@ class OpCode(Node):
 
 class SmallIntOpCode(OpCode):
     """Small integer opcode."""
+    __slots__ = ()
     value = 0
     comparators = OpCode.comparators + ('value',)
 
@@ -118,6 +171,7 @@ def _smallint(cls_name, num, **kwargs):
     kwargs['delta'] = 1
     kwargs['name'] = 'OP_%d' % num
     kwargs['value'] = num
+    kwargs['__slots__'] = ()
     return type(cls_name, (SmallIntOpCode,), kwargs)
 
 Zero = _smallint('Zero', 0)
@@ -142,6 +196,9 @@ def _opcode(cls_name, delta, name, **kwargs):
     """Create an OpCode subclass."""
     kwargs['delta'] = delta
     kwargs['name'] = name
+    # Opcodes that are not interned need a __dict__ for their metadata.
+    if kwargs.get('interned', True):
+        kwargs['__slots__'] = ()
     return type(cls_name, (OpCode,), kwargs)
 
 def _unary_opcode(*args, **kwargs):
@@ -163,8 +220,10 @@ def _ternary_opcode(*args, **kwargs):
 
 # TODO.
 class False_(Zero):
+    __slots__ = ()
     name = 'OP_FALSE'
 class True_(One):
+    __slots__ = ()
     name = 'OP_TRUE'
 NegativeOne = _opcode('NegativeOne', 1, 'OP_1NEGATE')
 
@@ -184,7 +243,7 @@ Return = _opcode('Return', 0, 'OP_RETURN')
 # TODO: OP_TOALTSTACK, OP_FROMALTSTACK
 
 # TODO: delta of IfDup can only be guaranteed during execution.
-IfDup = _unary_opcode('IfDup', None, 'OP_IFDUP')
+IfDup = _unary_opcode('IfDup', None, 'OP_IFDUP', interned=False)
 
 Depth = _opcode('Depth', 1, 'OP_DEPTH')
 Drop = _unary_opcode('Drop', -1, 'OP_DROP')
@@ -193,8 +252,8 @@ Nip = _opcode('Nip', -1, 'OP_NIP', args=[2])
 Over = _opcode('Over', 1, 'OP_OVER', args=[2])
 
 # TODO: Relative arg indices of Pick and Roll can only be guaranteed during execution.
-Pick = _opcode('Pick', 0, 'OP_PICK')
-Roll = _opcode('Roll', -1, 'OP_ROLL')
+Pick = _opcode('Pick', 0, 'OP_PICK', interned=False)
+Roll = _opcode('Roll', -1, 'OP_ROLL', interned=False)
 
 Rot = _ternary_opcode('Rot', 0, 'OP_ROT')
 Swap = _binary_opcode('Swap', 0, 'OP_SWAP')
@@ -272,6 +331,7 @@ CheckSigVerify = _binary_opcode('CheckSigVerify', -2, 'OP_CHECKSIGVERIFY', verif
 # TODO: Relative arg indices of CheckMultiSig and CheckMultiSigVerify can only be guaranteed during execution.
 class CheckMultiSig(OpCode):
     name = 'OP_CHECKMULTISIG'
+    interned = False
     num_pubkeys = -1
     num_sigs = -1
 
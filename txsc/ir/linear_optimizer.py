@@ -1,13 +1,20 @@
-"""Script optimizations."""
+"""Script optimizations.
+
+Most peephole rules are declared in rule files (see txsc.ir.peephole_rules).
+"""
 import itertools
+import logging
 
-from txsc.ir import formats
-from txsc.ir.instructions import LInstructions
 from txsc.ir.linear_context import LinearContextualizer, LinearInliner
 from txsc.ir.linear_visitor import BaseLinearVisitor
+from txsc.ir.peephole_matcher import PeepholeMatcher, PeepholeRule
+from txsc.ir.peephole_rules import DEFAULT_RULES_PATH, load_rule_file
+from txsc.ir import stack_superoptimizer
 import txsc.ir.linear_nodes as types
 
 peephole_optimizers = []
+# Peephole optimizers that return rules instead of modifying instructions.
+peephole_rule_sets = []
 
 def get_linear_optimizer_cls():
     """Get the linear optimizer class."""
@@ -23,150 +30,83 @@ def peephole(func):
     peephole_optimizers.append(func)
     return func
 
-def permutations(nodes):
-    """Return permutations of nodes."""
-    return [list(i) for i in itertools.permutations(nodes, len(nodes))]
+def peephole_rules(func):
+    """Decorator for peephole optimizers that consist of template rules.
 
-@peephole
-def merge_op_and_verify(instructions):
-    """Merge opcodes with a corresponding *VERIFY form.
+    func takes no arguments and returns a list of PeepholeRules.
+    The rules of all such optimizers are matched in one scan, with
+    earlier rules taking priority over later ones.
+    """
+    peephole_optimizers.append(func)
+    peephole_rule_sets.append(func)
+    return func
+
+def add_peephole_rule_file(path):
+    """Add the rule sets declared in the rule file at path as peephole optimizers."""
+    for rule_set in load_rule_file(path):
+        peephole_rules(rule_set)
+
+def get_peephole_rules(rule_sets=None):
+    """Get the rules of every rule-based peephole optimizer, in order of priority.
 
-    e.g. OP_EQUAL OP_VERIFY -> OP_EQUALVERIFY
+    If rule_sets is given, the rules of its rule sets are returned instead.
     """
-    optimizations = []
-    for op in types.iter_opcode_classes():
-        if op.name.endswith('VERIFY') and op.name != 'OP_VERIFY':
-            base_op = types.opcode_by_name(op.name[:-6])
-            if not base_op:
-                continue
-            template = [base_op(), types.Verify()]
-            optimizations.append((template, [op()]))
-
-    for template, replacement in optimizations:
-        callback = lambda values, replacement=replacement: replacement
-        instructions.replace_template(template, callback)
+    rules = []
+    for func in peephole_rule_sets if rule_sets is None else rule_sets:
+        rules.extend(func())
+    return rules
 
-@peephole
-def replace_repeated_ops(instructions):
-    """Replace repeated opcodes with single opcodes."""
-    optimizations = [
-        # OP_DROP OP_DROP -> OP_2DROP
-        ([types.Drop(), types.Drop()], [types.TwoDrop()]),
-    ]
-    for template, replacement in optimizations:
-        callback = lambda values, replacement=replacement: replacement
-        instructions.replace_template(template, callback)
+def build_peephole_matcher(rule_sets=None):
+    """Build a PeepholeMatcher for the rules of the current opcode set.
 
-@peephole
-def optimize_stack_ops(instructions):
-    """Optimize stack operations."""
-    for template, replacement in [
-        # OP_1 OP_PICK -> OP_OVER
-        ([types.One(), types.Pick()], [types.Over()]),
-        # OP_1 OP_ROLL OP_DROP -> OP_NIP
-        ([types.One(), types.Roll(), types.Drop()], [types.Nip()]),
-        # OP_0 OP_PICK -> OP_DUP
-        ([types.Zero(), types.Pick()], [types.Dup()]),
-        # OP_0 OP_ROLL -> _
-        ([types.Zero(), types.Roll()], []),
-        # OP_1 OP_ROLL OP_1 OP_ROLL -> _
-        ([types.One(), types.Roll(), types.One(), types.Roll()], []),
-        # OP_1 OP_ROLL -> OP_SWAP
-        ([types.One(), types.Roll()], [types.Swap()]),
-        # OP_NIP OP_DROP -> OP_2DROP
-        ([types.Nip(), types.Drop()], [types.TwoDrop()]),
-        # OP_OVER OP_OVER -> OP_2DUP
-        ([types.Over(), types.Over()], [types.TwoDup()]),
-    ]:
-        callback = lambda values, replacement=replacement: replacement
-        instructions.replace_template(template, callback)
+    If rule_sets is given, the matcher is built for its rule sets instead.
+    """
+    return PeepholeMatcher(get_peephole_rules(rule_sets))
 
-@peephole
-def replace_shortcut_ops(instructions):
-    """Replace opcodes with a corresponding shortcut form."""
-    optimizations = []
-    # Replace division by 2.
-    # OP_2 OP_DIV -> OP_2DIV
-    optimizations.append(([types.Two(), types.Div()], lambda values: [types.Div2()]))
-    # Replace subtraction by 1.
-    # OP_1 OP_SUB -> OP_1SUB
-    optimizations.append(([types.One(), types.Sub()], lambda values: [types.Sub1()]))
-    # Replace 1 * -1 with -1.
-    # OP_1 OP_NEGATE -> OP_1NEGATE
-    optimizations.append(([types.One(), types.Negate()], lambda values: [types.NegativeOne()]))
-    # Replace addition by 1.
-    # OP_1 OP_ADD -> OP_1ADD
-    for permutation in permutations([types.Push(), types.One()]) + permutations([types.SmallIntOpCode(), types.One()]):
-        idx = 0 if not isinstance(permutation[0], types.One) else 1
-        optimizations.append((permutation + [types.Add()], lambda values, idx=idx: [values[idx], types.Add1()]))
-    optimizations.append(([types.Assumption(), types.One(), types.Add()], lambda values: [values[0], types.Add1()]))
-    # Replace multiplication by 2.
-    # OP_2 OP_MUL -> OP_2MUL
-    for permutation in permutations([types.Push(), types.Two()]) + permutations([types.SmallIntOpCode(), types.Two()]):
-        idx = 0 if not isinstance(permutation[0], types.Two) else 1
-        optimizations.append((permutation + [types.Mul()], lambda values, idx=idx: [values[idx], types.Mul2()]))
-    optimizations.append(([types.Assumption(), types.Two(), types.Mul()], lambda values: [values[0], types.Mul2()]))
-
-
-    for template, callback in optimizations:
-        instructions.replace_template(template, callback, strict=False)
+def get_peephole_matcher():
+    """Get the PeepholeMatcher for the current opcode set.
 
-@peephole
-def replace_null_ops(instructions):
-    """Replace operations that do nothing."""
-    # Remove subtraction by 0.
-    # OP_0 OP_SUB -> _
-    optimizations = [([types.Zero(), types.Sub()], lambda values: [])]
-    # Remove addition by 0.
-    # OP_0 OP_ADD -> _
-    for permutation in permutations([None, types.Zero()]):
-        idx = 0 if permutation[0] is None else 1
-        optimizations.append((permutation + [types.Add()], lambda values, idx=idx: [values[idx]]))
-
-    for template, callback in optimizations:
-        instructions.replace_template(template, callback)
+    A matcher is built if the opcode set has changed without
+    set_peephole_matcher() being called.
+    """
+    global _peephole_matcher, _peephole_matcher_opcodes
+    if _peephole_matcher is None or _peephole_matcher_opcodes is not types.opcode_classes:
+        _peephole_matcher = build_peephole_matcher()
+        _peephole_matcher_opcodes = types.opcode_classes
+    return _peephole_matcher
 
-@peephole
-def optimize_dup_and_checksig(instructions):
-    for template, callback in [
-        ([types.Dup(), None, types.CheckSig()], lambda values: values[1:]),
-    ]:
-        instructions.replace_template(template, callback)
+def set_peephole_matcher(matcher):
+    """Set the PeepholeMatcher for the current opcode set.
 
-@peephole
-def optimize_hashes(instructions):
-    for template, replacement in [
-        # OP_SHA256 OP_SHA256 -> OP_HASH256
-        ([types.Sha256(), types.Sha256()], [types.Hash256()]),
-        # OP_SHA256 OP_RIPEMD160 -> OP_HASH160
-        ([types.Sha256(), types.RipeMD160()], [types.Hash160()]),
-    ]:
-        callback = lambda values, replacement=replacement: replacement
-        instructions.replace_template(template, callback)
+    txsc.config calls this with its cached matcher whenever the opcode set changes.
+    """
+    global _peephole_matcher, _peephole_matcher_opcodes
+    _peephole_matcher = matcher
+    _peephole_matcher_opcodes = types.opcode_classes
 
-@peephole
-def use_arithmetic_ops(instructions):
-    """Replace ops with more convenient arithmetic ops."""
-    optimizations = []
-    _two_values = permutations([types.SmallIntOpCode(), types.Push()])
-    _two_values.append([types.SmallIntOpCode()] * 2)
-    _two_values.append([types.Push()] * 2)
+def replace_with(replacement):
+    """Make a callback that replaces a block with copies of the nodes in replacement.
 
-    def all_strict_nums(numbers):
-        """Evaluate whether instances represent strict numbers."""
-        return all(formats.is_strict_num(i) for i in map(LInstructions.instruction_to_int, numbers))
+    Rules are reused by every script that is optimized, so each replacement
+    must consist of new nodes (other than interned opcodes, which are shared).
+    """
+    return lambda values: map(types.copy_node, replacement)
+
+def permutations(nodes):
+    """Return permutations of nodes."""
+    return [list(i) for i in itertools.permutations(nodes, len(nodes))]
 
-    # Use NUMNOTEQUAL if both values are numbers.
-    def numnotequal_callback(values):
-        if not all_strict_nums(values[0:2]):
-            return values
-        return values[0:2] + [types.NumNotEqual()]
+add_peephole_rule_file(DEFAULT_RULES_PATH)
 
-    for permutation in _two_values:
-        optimizations.append((permutation + [types.Equal(), types.Not()], numnotequal_callback))
+@peephole
+def superoptimize_stack_ops(instructions):
+    """Replace sequences of stack operations with the cheapest equivalent sequences.
 
-    for template, callback in optimizations:
-        instructions.replace_template(template, callback, strict=False)
+    See txsc.ir.stack_superoptimizer.
+    """
+    superoptimizer = stack_superoptimizer.get_superoptimizer()
+    if superoptimizer:
+        superoptimizer.optimize(instructions)
 
 @peephole
 def remove_trailing_verifications(instructions):
@@ -185,76 +125,52 @@ def promote_return(instructions):
     occurrences = instructions.find_occurrences(types.Return())
     if not occurrences or occurrences == [0]:
         return
-    map(instructions.pop, reversed(occurrences))
-    instructions.insert(0, types.Return())
-
-@peephole
-def use_small_int_opcodes(instructions):
-    """Convert data pushes to equivalent small integer opcodes."""
-    def convert_push(push):
-        push = push[0]
-        try:
-            i = formats.bytearray_to_int(push.data)
-            return [types.small_int_opcode(i)()]
-        except TypeError:
-            pass
-        return [push]
-    instructions.replace_template([types.Push()], convert_push, strict=False)
-
-@peephole
-def shorten_commutative_operations(instructions):
-    """Remove ops that change the order of commutative operations."""
-    optimizations = []
-    for op in [types.Add(), types.Mul(), types.BoolAnd(), types.BoolOr(),
-               types.NumEqual(), types.NumEqualVerify(), types.NumNotEqual(),
-               types.Min(), types.Max(),
-               types.And(), types.Or(), types.Xor(), types.Equal(), types.EqualVerify(),
-    ]:
-        template = [types.Swap(), op]
-        optimizations.append((template, lambda values: values[1:]))
-
-    for template, callback in optimizations:
-        instructions.replace_template(template, callback)
-
-@peephole
-def remove_null_conditionals(instructions):
-    """Replace empty conditionals with an op that consumes the test value."""
-    # OP_ELSE OP_ENDIF -> OP_ENDIF
-    instructions.replace_template([types.Else(), types.EndIf()], lambda values: [types.EndIf()])
-    # OP_IF OP_ENDIF -> OP_DROP
-    instructions.replace_template([types.If(), types.EndIf()], lambda values: [types.Drop()])
-
-@peephole
-def replace_not_if(instructions):
-    # OP_NOT OP_IF -> OP_NOTIF
-    instructions.replace_template([types.Not(), types.If()], lambda values: [types.NotIf()])
+    # Move instructions in one edit, rather than shifting them once per occurrence.
+    occurrences = set(occurrences)
+    end = max(occurrences) + 1
+    ops = [op for i, op in enumerate(instructions[:end]) if i not in occurrences]
+    instructions.replace_slice(0, end, [types.Return()] + ops)
 
 class PeepholeOptimizer(object):
-    """Performs peephole optimization on the linear IR."""
-    MAX_PASSES = 5
+    """Performs peephole optimization on the linear IR.
+
+    Optimization continues until instructions reach a fixed point. In case
+    rules rewrite each other's output endlessly, at most
+    MAX_REWRITES_PER_OP rewrites per instruction are performed.
+    """
+    MAX_REWRITES_PER_OP = 16
     def __init__(self, enabled=True):
         self.enabled = enabled
+        self.logger = logging.getLogger(__name__)
+
+    def optimize(self, instructions, max_passes=None):
+        """Optimize instructions.
 
-    def optimize(self, instructions, max_passes=-1):
+        Each pass applies the peephole rules until none of them change instructions,
+        then runs the other peephole optimizers. Passes continue until the other
+        optimizers change nothing, or until max_passes passes if it is given.
+        """
         if not self.enabled:
             return
-        if max_passes == -1:
-            max_passes = self.MAX_PASSES
+        matcher = get_peephole_matcher()
+        optimizers = [func for func in peephole_optimizers if func not in peephole_rule_sets]
+        remaining = self.MAX_REWRITES_PER_OP * (len(instructions) + 1)
 
         pass_number = 0
-        while 1:
-            if pass_number > max_passes:
+        while max_passes is None or pass_number < max_passes:
+            remaining -= matcher.apply(instructions, remaining)
+            if remaining <= 0:
+                self.logger.warning('Peephole optimization stopped before reaching a fixed point.')
                 break
 
-            state = str(instructions)
-            for func in peephole_optimizers:
+            state = instructions.modifications
+            for func in optimizers:
                 func(instructions)
-            new = str(instructions)
-
             pass_number += 1
-
-            if state == new:
+            if instructions.modifications == state:
                 break
+            # Optimizers that keep changing instructions also use up the budget.
+            remaining -= 1
 
 class LinearOptimizer(BaseLinearVisitor):
     """Performs optimizations on the linear IR."""
@@ -268,3 +184,6 @@ class LinearOptimizer(BaseLinearVisitor):
         self.peephole_optimizer.optimize(instructions)
 
 _linear_optimizer_cls = LinearOptimizer
+# Peephole matcher of the current opcode set, and the opcodes it was built for.
+_peephole_matcher = None
+_peephole_matcher_opcodes = None
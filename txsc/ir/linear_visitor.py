@@ -1,4 +1,4 @@
-import copy
+from collections import namedtuple
 
 from txsc.ir import formats
 from txsc.transformer import BaseTransformer
@@ -38,16 +38,17 @@ class BaseLinearVisitor(BaseTransformer):
         self.options = options
 
 
-class StackItem(object):
-    """Model of an item on a stack."""
-    def __init__(self, op):
-        self.op = op
+class StackItem(namedtuple('StackItem', ('op',))):
+    """Model of an item on a stack.
 
+    StackItems are immutable, so stack states can share them.
+    """
+    __slots__ = ()
     def __str__(self):
         return str(self.op)
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+        return isinstance(other, self.__class__) and self.op == other.op
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -63,32 +64,109 @@ class StackItem(object):
         return type(self.op) is types.Assumption
 
 class StateScope(object):
+    """Stack state of a scope.
+
+    Items are stored in a persistent linked list of (item, below) pairs,
+    starting at the top of the stack. Edits replace the pairs above the
+    edited item and share the rest, so copying a scope takes constant time
+    and operations near the top of the stack allocate only a few pairs.
+    """
+    __slots__ = ('assumptions_offset', 'top', 'length')
     def __init__(self, assumptions_offset=0, state=None):
         self.assumptions_offset = assumptions_offset
-        self.state = state if state is not None else []
+        self.top = None
+        self.length = 0
+        if state:
+            self.extend(state)
 
     @classmethod
     def copy(cls, other):
-        return cls(assumptions_offset=other.assumptions_offset,
-                   state=copy.deepcopy(other.state))
+        scope = cls(assumptions_offset=other.assumptions_offset)
+        scope.top, scope.length = other.top, other.length
+        return scope
 
     def __len__(self):
-        return len(self.state)
+        return self.length
+
+    def __iter__(self):
+        """Iterate over items from the bottom of the stack to the top."""
+        items = []
+        node = self.top
+        while node is not None:
+            items.append(node[0])
+            node = node[1]
+        return reversed(items)
+
+    def depth(self, key):
+        """Get the number of items above the item at index key."""
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError('stack index out of range')
+        return self.length - key - 1
+
+    def take(self, count):
+        """Remove the top count items and return them, from the deepest to the top."""
+        if count > self.length:
+            raise IndexError('stack index out of range')
+        items = []
+        node = self.top
+        for _ in range(count):
+            items.append(node[0])
+            node = node[1]
+        self.top = node
+        self.length -= count
+        items.reverse()
+        return items
+
+    def extend(self, items):
+        node = self.top
+        for item in items:
+            node = (item, node)
+        self.top = node
+        self.length += len(items)
 
     def __getitem__(self, key):
-        return self.state[key]
+        if isinstance(key, slice):
+            return list(self)[key]
+        node = self.top
+        for _ in range(self.depth(key)):
+            node = node[1]
+        return node[0]
 
     def __setitem__(self, key, value):
-        self.state[key] = value
+        if isinstance(key, slice):
+            items = list(self)
+            items[key] = value
+            self.top, self.length = None, 0
+            return self.extend(items)
+        items = self.take(self.depth(key) + 1)
+        items[0] = value
+        self.extend(items)
+
+    def __delitem__(self, key):
+        self.pop(key)
 
     def append(self, item):
-        return self.state.append(item)
+        self.top = (item, self.top)
+        self.length += 1
+
+    def insert(self, index, item):
+        if index < 0:
+            index += self.length
+        items = self.take(self.length - max(0, min(index, self.length)))
+        self.extend([item] + items)
 
     def pop(self, index):
-        return self.state.pop(index)
+        items = self.take(self.depth(index) + 1)
+        self.extend(items[1:])
+        return items[0]
 
     def index(self, item):
-        return self.state.index(item)
+        for i, value in enumerate(self):
+            if value == item:
+                return i
+        raise ValueError('%s is not in stack' % item)
 
 class StackState(object):
     """Model of a stack's state.
@@ -99,6 +177,8 @@ class StackState(object):
     Primarily, the delta values of instructions are used to determine
     their effects, but there are specific methods for stack manipulation opcodes.
     """
+    # {(type, value): StackItem, ...} of items for ints and strs.
+    _shared_items = {}
     def __init__(self, symbol_table):
         self.symbol_table = symbol_table
         self.assumptions = []
@@ -148,9 +228,9 @@ class StackState(object):
     def copy(cls, other):
         """Instantiate from another instance of StackState."""
         self = StackState(other.symbol_table)
-        self.assumptions = copy.deepcopy(other.assumptions)
-        self.state = copy.deepcopy(other.state)
-        self.scopes = copy.deepcopy(other.scopes)
+        self.assumptions = list(other.assumptions)
+        self.scopes = map(StateScope.copy, other.scopes)
+        self.state = self.scopes[-1]
         return self
 
     def change_depth(self, stack_offset, amount):
@@ -172,8 +252,7 @@ class StackState(object):
     def get_assumptions(self, assumption_name):
         """Get occurrences of assumption_name."""
         state = self.state_after_assumptions()
-        ret_list = copy.deepcopy(filter(lambda i: i.is_assumption() and i.op.var_name == assumption_name, state))
-        return ret_list
+        return filter(lambda i: i.is_assumption() and i.op.var_name == assumption_name, state)
 
     def get_highest_assumption(self, assumption):
         highest, stack_index = None, None
@@ -199,25 +278,31 @@ class StackState(object):
         if clear_assumptions:
             self.assumptions = []
         self.assumptions_offset = len(self.assumptions)
-        self.state[:self.assumptions_offset] = copy.deepcopy(self.assumptions)
+        self.state[:self.assumptions_offset] = self.assumptions
 
     def state_append(self, op):
-        """Append op to the stack state."""
-        if isinstance(op, StackItem):
-            op = copy.deepcopy(op)
-        elif isinstance(op, int):
-            smallint = types.small_int_opcode(op)
-            if smallint:
-                op = smallint()
-            else:
-                op = types.Push(data=op)
+        """Append op to the stack state.
 
-            op = StackItem(op)
-        elif isinstance(op, str):
-            op = StackItem(types.Push(data=op))
+        Items for ints and strs are created once and shared.
+        """
+        if isinstance(op, (int, str)):
+            key = (type(op), op)
+            item = self._shared_items.get(key)
+            if item is None:
+                item = self._shared_items[key] = self.make_item(op)
+            op = item
 
         self.state.append(op)
 
+    @staticmethod
+    def make_item(value):
+        """Create a StackItem for an int or str value."""
+        if isinstance(value, int):
+            smallint = types.small_int_opcode(value)
+            if smallint:
+                return StackItem(smallint())
+        return StackItem(types.Push(data=value))
+
     def state_pop(self, i=-1):
         if i < 0:
             i = len(self.state) - abs(i)
@@ -233,7 +318,7 @@ class StackState(object):
         assumptions = map(StackItem, assumptions)
         self.assumptions = assumptions
         self.assumptions_offset = len(self.assumptions)
-        self.state[:self.assumptions_offset] = copy.deepcopy(assumptions)
+        self.state[:self.assumptions_offset] = assumptions
 
     def index(self, op):
         return self.state.index(op)
@@ -302,29 +387,23 @@ class StackState(object):
         self.state_append(val)
 
     def visit_Rot(self, op):
-        val = self.state[-3]
-        self.state[-3] = self.state[-2]
-        self.state[-2] = val
-
-        val = self.state[-2]
-        self.state[-2] = self.state[-1]
-        self.state[-1] = val
+        val1, val2, val3 = self.state.take(3)
+        self.state.extend([val2, val3, val1])
 
         self.change_depth(-1, -2)
         self.change_depth(-2, 1)
         self.change_depth(-3, 1)
 
     def visit_Swap(self, op):
-        val = self.state[-2]
-        self.state[-2] = self.state[-1]
-        self.state[-1] = val
+        val1, val2 = self.state.take(2)
+        self.state.extend([val2, val1])
 
         self.change_depth(-1, -1)
         self.change_depth(-2, 1)
 
     def visit_Tuck(self, op):
-        val = self.state[-1]
-        self.state.insert(len(self.state) - 2, val)
+        val1, val2 = self.state.take(2)
+        self.state.extend([val2, val1, val2])
 
     def visit_TwoDrop(self, op):
         self.state_pop()
@@ -351,12 +430,8 @@ class StackState(object):
         self.state_append(val2)
 
     def visit_TwoRot(self, op):
-        val1 = self.state[-6]
-        val2 = self.state[-5]
-        del self.state[-6]
-        del self.state[-5]
-        self.state_append(val1)
-        self.state_append(val2)
+        vals = self.state.take(6)
+        self.state.extend(vals[2:] + vals[:2])
 
         self.change_depth(-1, -4)
         self.change_depth(-2, -4)
@@ -366,13 +441,8 @@ class StackState(object):
         self.change_depth(-6, 2)
 
     def visit_TwoSwap(self, op):
-        val = self.state[-4]
-        self.state[-4] = self.state[-2]
-        self.state[-2] = val
-
-        val = self.state[-3]
-        self.state[-3] = self.state[-1]
-        self.state[-1] = val
+        vals = self.state.take(4)
+        self.state.extend(vals[2:] + vals[:2])
 
         self.change_depth(-1, -2)
         self.change_depth(-2, -2)
@@ -0,0 +1,145 @@
+"""Sequence of linear nodes that is stored as an array of codes.
+
+A list of nodes costs a pointer per instruction, plus an object for each
+node that is not interned. A PackedList stores one byte per instruction
+(the code of its node's class) in a bytearray, and one integer per
+instruction in an array of operands. Operands index a side table of payloads:
+    - Push: The data that it pushes.
+    - Assumption: The name of the assumed value.
+    - Other nodes that are not interned: A copy of the node, since visitors
+      store metadata on them (e.g. the arguments of OP_CHECKMULTISIG).
+
+Equal payloads of pushes and assumptions are stored once.
+
+Nodes are created when items are read, so metadata set on a node that is
+read from a PackedList is not stored. Visitors therefore operate on
+instructions in object form (e.g. LInstructions), and a PackedList converts
+losslessly to and from that form.
+
+Since the codes of a script are a byte string, sequences of instructions
+can be found with bytes.find() or regular expressions.
+"""
+from array import array
+import copy
+import itertools
+
+from txsc.ir.sequences import SpliceSequence
+import txsc.ir.linear_nodes as types
+
+class NodeCodec(object):
+    """Assigns a code to each class of linear nodes.
+
+    Codes are assigned in order of class name, so a codec does not
+    depend on the order that opcodes were registered in.
+    """
+    node_classes = (types.Assumption, types.InnerScript, types.Push)
+    def __init__(self, opcode_classes):
+        classes = list(self.node_classes) + sorted(set(opcode_classes.values()), key=lambda cls: cls.__name__)
+        if len(classes) > 256:
+            raise ValueError('Too many node classes to encode as bytes: %d' % len(classes))
+        self.classes = classes
+        self.codes = dict((cls, i) for i, cls in enumerate(classes))
+
+    def code(self, cls):
+        """Get the code of node class cls."""
+        try:
+            return self.codes[cls]
+        except KeyError:
+            raise ValueError('No code for node class %s' % cls.__name__)
+
+    def codes_for(self, predicate):
+        """Get the codes of node classes for which predicate returns True."""
+        return [i for i, cls in enumerate(self.classes) if predicate(cls)]
+
+# Codec of the current opcode set, and the opcodes it was built for.
+_codec = None
+_codec_opcodes = None
+
+def get_codec():
+    """Get the NodeCodec for the current opcode set."""
+    global _codec, _codec_opcodes
+    if _codec is None or _codec_opcodes is not types.opcode_classes:
+        _codec = NodeCodec(types.opcode_classes)
+        _codec_opcodes = types.opcode_classes
+    return _codec
+
+class PackedList(SpliceSequence):
+    """A mutable sequence of linear nodes stored as an array of codes.
+
+    Attributes:
+        - codec (NodeCodec): Codec of the opcode set when this sequence was created.
+        - codes (bytearray): The code of each node's class.
+        - operands (array): The index in payloads of each node's payload (0 if it has none).
+        - payloads (list): Payloads of nodes. The first payload is a placeholder.
+
+    Payloads of removed nodes are kept until set_items() is called.
+    """
+    def __init__(self, iterable=()):
+        self.codec = get_codec()
+        self.set_items(list(iterable))
+
+    def set_items(self, items):
+        """Replace the contents of this sequence with the list items."""
+        self.payloads = [None]
+        # {(code, value): payload_index, ...}
+        self.payload_indices = {}
+        self.codes, self.operands = self.encode(items)
+
+    def add_payload(self, code, value, shared):
+        """Get the index of a payload, adding it to payloads if necessary."""
+        if shared:
+            key = (code, value)
+            index = self.payload_indices.get(key)
+            if index is not None:
+                return index
+            self.payload_indices[key] = len(self.payloads)
+        self.payloads.append(value)
+        return len(self.payloads) - 1
+
+    def encode(self, nodes):
+        """Get the (codes, operands) that encode a list of nodes."""
+        codes = bytearray(len(nodes))
+        operands = array('I', [0]) * len(nodes)
+        code_of = self.codec.code
+        for i, node in enumerate(nodes):
+            code = codes[i] = code_of(node.__class__)
+            if node.interned:
+                continue
+            if isinstance(node, types.Push):
+                operands[i] = self.add_payload(code, node.data, True)
+            elif isinstance(node, types.Assumption):
+                operands[i] = self.add_payload(code, node.var_name, True)
+            else:
+                operands[i] = self.add_payload(code, types.copy_node(node), False)
+        return codes, operands
+
+    def decode(self, code, operand):
+        """Get the node that code and operand encode."""
+        cls = self.codec.classes[code]
+        if cls.interned:
+            return cls()
+        payload = self.payloads[operand]
+        if cls is types.Push:
+            return types.Push(payload)
+        elif cls is types.Assumption:
+            return types.Assumption(payload)
+        return copy.copy(payload)
+
+    def get_item(self, idx):
+        return self.decode(self.codes[idx], self.operands[idx])
+
+    def get_slice(self, start, end):
+        """Get a list of the items from [start : end]."""
+        return map(self.decode, self.codes[start:end], self.operands[start:end])
+
+    def set_slice(self, start, end, values):
+        """Replace the items from [start : end] with the list values."""
+        codes, operands = self.encode(values)
+        self.codes[start:end] = codes
+        self.operands[start:end] = operands
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return itertools.imap(self.decode, self.codes, self.operands)
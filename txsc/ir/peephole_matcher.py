@@ -0,0 +1,271 @@
+"""Matching of peephole optimization templates.
+
+A PeepholeMatcher compiles the templates of peephole rules into a trie,
+so that the rules which match at an index of a script are found in one
+walk, rather than by comparing every template in turn.
+
+Trie edges are labelled with what an instruction must be to match a
+template item: an opcode name, a class of nodes (for non-strict Push,
+SmallIntOpCode, and Assumption items), or anything (for None items).
+Opcodes compare by name (and small ints by value), so labels decide whether
+most templates match. Only templates with items that compare by value
+(strict Push and Assumption items) are confirmed with
+LInstructions.matches_template(), so matching behaves exactly as it does
+for LInstructions.replace_template().
+
+The trie is compiled into a Python module, which walks it without
+computing labels generically. Modules are stored in the txsc cache
+directory (see txsc.cache), keyed by their source.
+"""
+from collections import namedtuple
+import imp
+import os
+import threading
+
+from txsc import cache
+from txsc.ir.instructions import distinct_nodes
+import txsc.ir.linear_nodes as types
+
+# Labels for template items that match more than one opcode name.
+ANY = 'any'
+ANY_PUSH = 'class:Push'
+ANY_SMALL_INT = 'class:SmallIntOpCode'
+ANY_ASSUMPTION = 'class:Assumption'
+
+class PeepholeRule(namedtuple('PeepholeRule', ('template', 'callback', 'strict'))):
+    """A template and the callback that replaces instructions matching it.
+
+    See LInstructions.replace_template() for the meaning of these fields.
+    """
+    __slots__ = ()
+    def __new__(cls, template, callback, strict=True):
+        return super(PeepholeRule, cls).__new__(cls, template, callback, strict)
+
+def template_item_label(item, strict):
+    """Get the label that an instruction must have to match template item."""
+    if item is None:
+        return ANY
+    if not strict:
+        if isinstance(item, types.Push):
+            return ANY_PUSH
+        elif isinstance(item, types.Assumption):
+            return ANY_ASSUMPTION
+        elif item.__class__.__name__ == 'SmallIntOpCode':
+            return ANY_SMALL_INT
+    return item.name
+
+def needs_confirmation(rule):
+    """Get whether the labels of rule's template do not decide whether it matches."""
+    value_classes = (types.Push, types.Assumption, types.InnerScript) if rule.strict else (types.InnerScript,)
+    return any(isinstance(item, value_classes) for item in rule.template)
+
+class TrieNode(object):
+    """Node in a trie of templates."""
+    __slots__ = ('children', 'rules')
+    def __init__(self):
+        # {label: TrieNode, ...}
+        self.children = {}
+        # Priorities of the rules whose templates end at this node.
+        self.rules = []
+
+# Class labels, and the names of the classes whose instances have them.
+_label_classes = [(ANY_PUSH, 'Push'), (ANY_SMALL_INT, 'SmallIntOpCode'), (ANY_ASSUMPTION, 'Assumption')]
+
+def _name_children(node):
+    """Get the (label, child) pairs of node's children whose labels are opcode names."""
+    class_labels = dict(_label_classes)
+    return [(label, child) for label, child in sorted(node.children.items())
+            if label != ANY and label not in class_labels]
+
+def generate_matcher_source(root):
+    """Generate the source of a module that walks the trie at root.
+
+    The module's candidates(instructions, index) function returns the
+    priorities of rules whose template labels match at index.
+    """
+    lines = [
+        '"""Peephole matcher generated by txsc.ir.peephole_matcher. Do not edit."""',
+        'from txsc.ir.linear_nodes import %s' % ', '.join(name for _, name in _label_classes),
+        '',
+        'def candidates(instructions, index):',
+        '    found = []',
+        '    _visit_0(instructions, index, len(instructions), found)',
+        '    return found',
+    ]
+    # Assign a function to each node, in depth-first order.
+    nodes = []
+    def number(node):
+        nodes.append(node)
+        for label in sorted(node.children):
+            number(node.children[label])
+    number(root)
+    ids = dict((id(node), i) for i, node in enumerate(nodes))
+
+    for i, node in enumerate(nodes):
+        lines.extend(['', 'def _visit_%d(instructions, i, end, found):' % i])
+        if node.rules:
+            lines.append('    found.extend(%r)' % (tuple(node.rules),))
+        if not node.children:
+            continue
+        names = _name_children(node)
+        lines.extend([
+            '    if i >= end:',
+            '        return',
+            '    node = instructions[i]',
+        ])
+        # Children without children of their own are looked up as tuples of priorities.
+        if any(not child.children for _, child in names):
+            lines.extend([
+                '    rules = _leaves_%d.get(node.name)' % i,
+                '    if rules is not None:',
+                '        found.extend(rules)',
+            ])
+        if any(child.children for _, child in names):
+            lines.extend([
+                '    visit = _inner_%d.get(node.name)' % i,
+                '    if visit is not None:',
+                '        visit(instructions, i + 1, end, found)',
+            ])
+        for label, cls_name in _label_classes:
+            if label in node.children:
+                lines.extend([
+                    '    if isinstance(node, %s):' % cls_name,
+                    '        _visit_%d(instructions, i + 1, end, found)' % ids[id(node.children[label])],
+                ])
+        if ANY in node.children:
+            lines.append('    _visit_%d(instructions, i + 1, end, found)' % ids[id(node.children[ANY])])
+
+    # Lookup tables are defined after the functions that they refer to.
+    lines.append('')
+    for i, node in enumerate(nodes):
+        names = _name_children(node)
+        leaves = ['%r: %r' % (label, tuple(child.rules)) for label, child in names if not child.children]
+        inner = ['%r: _visit_%d' % (label, ids[id(child)]) for label, child in names if child.children]
+        if leaves:
+            lines.append('_leaves_%d = {%s}' % (i, ', '.join(leaves)))
+        if inner:
+            lines.append('_inner_%d = {%s}' % (i, ', '.join(inner)))
+    return '\n'.join(lines) + '\n'
+
+# {module name: module, ...}
+_matcher_modules = {}
+
+def load_matcher_module(source):
+    """Load a generated matcher module, storing it in the cache directory if possible."""
+    name = 'peephole_matcher_%s' % cache.digest([source])[:16]
+    module = _matcher_modules.get(name)
+    if module is not None:
+        return module
+    path = cache.get_cache_path(name + '.py')
+    if path is not None and not os.path.exists(path):
+        # Write under a temporary name so that other processes never load a partial module.
+        tmppath = '%s_%d_%d_tmp' % (path, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(tmppath, 'w') as f:
+                f.write(source)
+            cache.make_private(tmppath)
+            os.rename(tmppath, path)
+        except (IOError, OSError):
+            path = None
+    if path is not None:
+        module = cache.load_source('txsc_%s' % name, path)
+    if module is None:
+        module = imp.new_module('txsc_%s' % name)
+        exec compile(source, '<%s>' % name, 'exec') in module.__dict__
+    _matcher_modules[name] = module
+    return module
+
+class PeepholeMatcher(object):
+    """Finds the peephole rules that match instructions.
+
+    Rules that come first in rules have priority over those after them.
+    A matcher does not change after it is built, so it can be shared.
+    """
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.root = TrieNode()
+        self.max_length = 0
+        for priority, rule in enumerate(self.rules):
+            node = self.root
+            for item in rule.template:
+                node = node.children.setdefault(template_item_label(item, rule.strict), TrieNode())
+            node.rules.append(priority)
+            self.max_length = max(self.max_length, len(rule.template))
+        # Whether each rule must be confirmed with matches_template().
+        self.confirm = [needs_confirmation(rule) for rule in self.rules]
+        self.module = load_matcher_module(generate_matcher_source(self.root))
+
+    def candidates(self, instructions, index):
+        """Get the priorities of rules whose template labels match at index."""
+        return self.module.candidates(instructions, index)
+
+    def matches(self, instructions, index, priority):
+        """Get whether the rule with priority matches at index."""
+        if not self.confirm[priority]:
+            return True
+        rule = self.rules[priority]
+        return instructions.matches_template(rule.template, index, rule.strict)
+
+    def best_match(self, instructions, index, before=None):
+        """Get the rule with the highest priority that matches at index.
+
+        If before is given, only rules with a priority before it are considered.
+        Returns a (priority, rule) tuple, or None.
+        """
+        for priority in sorted(self.candidates(instructions, index)):
+            if before is not None and priority >= before:
+                break
+            if self.matches(instructions, index, priority):
+                return (priority, self.rules[priority])
+        return None
+
+    def find_rewrite(self, instructions, index, before=None):
+        """Get the rewrite with the highest priority at index.
+
+        Rules whose callbacks return the block unchanged are skipped.
+        If before is given, only rules with a priority before it are considered.
+        Returns a (priority, length, replacement) tuple, or None.
+        """
+        for priority in sorted(self.candidates(instructions, index)):
+            if before is not None and priority >= before:
+                break
+            rule = self.rules[priority]
+            if not self.matches(instructions, index, priority):
+                continue
+            length = len(rule.template)
+            block = instructions[index:index + length]
+            replacement = rule.callback(list(block))
+            if replacement != block:
+                return (priority, length, distinct_nodes(replacement))
+        return None
+
+    def apply(self, instructions, max_rewrites=None):
+        """Rewrite instructions until no rule changes them.
+
+        Instructions are scanned from left to right. At each index, the rewrite
+        with the highest priority is applied, unless a rule with a higher priority
+        rewrites an overlapping block further on. After a rewrite, scanning resumes
+        at the first index whose block could include the replacement, so only the
+        region around the rewrite is examined again.
+
+        Stops after max_rewrites rewrites if it is given.
+        Returns the number of rewrites.
+        """
+        backtrack = max(self.max_length - 1, 0)
+        rewrites = 0
+        idx = 0
+        while idx < len(instructions):
+            if max_rewrites is not None and rewrites >= max_rewrites:
+                break
+            rewrite = self.find_rewrite(instructions, idx)
+            if rewrite is None:
+                idx += 1
+                continue
+            priority, length, replacement = rewrite
+            if any(self.find_rewrite(instructions, i, priority) for i in range(idx + 1, idx + length)):
+                idx += 1
+                continue
+            instructions.replace_slice(idx, idx + length, replacement)
+            rewrites += 1
+            idx = max(idx - backtrack, 0)
+        return rewrites
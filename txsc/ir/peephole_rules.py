@@ -0,0 +1,323 @@
+"""Declarative peephole rules.
+
+Peephole rules can be declared in rule files instead of Python functions.
+The built-in rules are in peephole.rules. A rule file consists of rule sets,
+each of which starts with its name in brackets:
+
+    [merge_op_and_verify]
+    # Merge opcodes with a corresponding *VERIFY form.
+    $op OP_VERIFY -> verify_form($op)
+
+Comments directly after the name describe the rule set. Each other
+non-comment line is a rule of the form:
+
+    PATTERN -> REPLACEMENT [if GUARD(ARGS)[, GUARD(ARGS)...]]
+
+Pattern items are:
+    - OP_NAME: An opcode.
+    - $name: Any instruction.
+    - $name:push, $name:smallint, $name:assumption: Any instruction of that kind.
+
+Replacement items are opcode names, names of pattern items ($name),
+and transforms of pattern items (e.g. small_int($a)). A replacement of
+"_" removes the matching instructions.
+
+Guards and transforms are Python functions that are registered with
+the guard() and transform() decorators. A rule only rewrites
+instructions if all of its guards return True and none of its transforms
+return None.
+
+A rule's cost delta is the number of instructions that it adds, so
+a rule that shortens scripts has a negative cost delta. Rules with a
+positive cost delta are rejected, since they could undo other rules.
+
+Rules whose opcodes are not in the current opcode set are ignored.
+"""
+from collections import namedtuple
+import os
+import re
+
+from txsc.ir import formats
+from txsc.ir.instructions import LInstructions
+from txsc.ir.peephole_matcher import PeepholeRule
+import txsc.ir.linear_nodes as types
+
+# Path of the built-in rule file.
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'peephole.rules')
+
+class PeepholeRuleError(Exception):
+    """Exception raised when a rule file is invalid."""
+    pass
+
+# {name: function, ...}
+guards = {}
+transforms = {}
+
+def guard(func):
+    """Decorator for functions that can be used as guards in rule files."""
+    guards[func.__name__] = func
+    return func
+
+def transform(func):
+    """Decorator for functions that can be used as transforms in rule files."""
+    transforms[func.__name__] = func
+    return func
+
+@guard
+def strict_nums(*nodes):
+    """Evaluate whether nodes represent strict numbers."""
+    return all(formats.is_strict_num(i) for i in map(LInstructions.instruction_to_int, nodes))
+
+@transform
+def verify_form(node):
+    """Get the *VERIFY form of an opcode."""
+    if not types.opcode_by_name(node.name):
+        return None
+    cls = types.opcode_by_name(node.name + 'VERIFY')
+    return cls() if cls else None
+
+@transform
+def small_int(node):
+    """Get the small int opcode that pushes the value that node pushes."""
+    try:
+        cls = types.small_int_opcode(formats.bytearray_to_int(node.data))
+    except TypeError:
+        return None
+    return cls() if cls else None
+
+# Classes of nodes that pattern items of each kind match.
+capture_kinds = {
+    'push': types.Push,
+    'smallint': types.SmallIntOpCode,
+    'assumption': types.Assumption,
+}
+
+class PatternItem(namedtuple('PatternItem', ('name', 'kind'))):
+    """An item in a pattern.
+
+    Attributes:
+        - name (str): The opcode name, or the name of a captured instruction.
+        - kind (str): None for an opcode, 'any' for any instruction, or a key of capture_kinds.
+
+    """
+    __slots__ = ()
+    def __str__(self):
+        if self.kind is None:
+            return self.name
+        return '$%s' % self.name + (':%s' % self.kind if self.kind != 'any' else '')
+
+class ReplacementItem(namedtuple('ReplacementItem', ('name', 'kind', 'args'))):
+    """An item in a replacement.
+
+    Attributes:
+        - name (str): The opcode name, captured instruction name, or transform name.
+        - kind (str): 'opcode', 'capture', or 'transform'.
+        - args (tuple): Names of the captured instructions that a transform is applied to.
+
+    """
+    __slots__ = ()
+    def __str__(self):
+        if self.kind == 'opcode':
+            return self.name
+        elif self.kind == 'capture':
+            return '$%s' % self.name
+        return '%s(%s)' % (self.name, ', '.join('$%s' % i for i in self.args))
+
+class DeclaredRule(namedtuple('DeclaredRule', ('pattern', 'replacement', 'guards', 'filename', 'lineno'))):
+    """A rule declared in a rule file.
+
+    Attributes:
+        - pattern (tuple): PatternItems.
+        - replacement (tuple): ReplacementItems.
+        - guards (tuple): (guard_name, (capture_name, ...)) tuples.
+
+    """
+    __slots__ = ()
+    @property
+    def before(self):
+        return ' '.join(map(str, self.pattern))
+
+    @property
+    def after(self):
+        return ' '.join(map(str, self.replacement)) or '_'
+
+    @property
+    def cost_delta(self):
+        """The number of instructions that this rule adds."""
+        return len(self.replacement) - len(self.pattern)
+
+    @property
+    def strict(self):
+        """Whether this rule only matches exact instructions (see LInstructions.matches_template())."""
+        return not any(item.kind in capture_kinds for item in self.pattern)
+
+    def make_rule(self):
+        """Create a PeepholeRule for the current opcode set, or return None if an opcode is not in it."""
+        template = []
+        captures = {}
+        for i, item in enumerate(self.pattern):
+            if item.kind is None:
+                cls = types.opcode_by_name(item.name)
+                if not cls:
+                    return None
+                template.append(cls())
+            elif item.kind == 'any':
+                template.append(None)
+            else:
+                template.append(capture_kinds[item.kind]())
+            if item.kind is not None:
+                captures[item.name] = i
+
+        # Functions that get each replacement node from the matching instructions.
+        getters = []
+        for item in self.replacement:
+            if item.kind == 'opcode':
+                cls = types.opcode_by_name(item.name)
+                if not cls:
+                    return None
+                getters.append(lambda values, cls=cls: cls())
+            elif item.kind == 'capture':
+                getters.append(lambda values, i=captures[item.name]: values[i])
+            else:
+                func, indices = transforms[item.name], [captures[arg] for arg in item.args]
+                getters.append(lambda values, func=func, indices=indices: func(*[values[i] for i in indices]))
+        checks = [(guards[name], [captures[arg] for arg in args]) for name, args in self.guards]
+
+        def callback(values):
+            for func, indices in checks:
+                if not func(*[values[i] for i in indices]):
+                    return values
+            replacement = [getter(values) for getter in getters]
+            if any(node is None for node in replacement):
+                return values
+            return replacement
+        return PeepholeRule(template, callback, self.strict)
+
+class DeclaredRuleSet(object):
+    """A rule set declared in a rule file.
+
+    Like functions decorated with txsc.ir.linear_optimizer.peephole_rules(),
+    calling a rule set returns its PeepholeRules (for the current opcode set).
+    """
+    def __init__(self, name, doc, rules, filename):
+        self.__name__ = self.name = name
+        self.__doc__ = self.doc = doc
+        self.rules = rules
+        self.filename = filename
+
+    def __call__(self):
+        return filter(None, [rule.make_rule() for rule in self.rules])
+
+    def __repr__(self):
+        return '<DeclaredRuleSet %s (%s)>' % (self.name, self.filename)
+
+_capture_re = re.compile(r'^\$(\w+)(?::(\w+))?$')
+_transform_re = re.compile(r'^(\w+)\(([^)]*)\)$')
+_guard_re = re.compile(r'(\w+)\(([^)]*)\)')
+
+def _parse_args(args):
+    """Parse a comma-separated list of captured instruction names."""
+    names = [arg.strip() for arg in args.split(',') if arg.strip()]
+    if not all(name.startswith('$') for name in names):
+        return None
+    return tuple(name[1:] for name in names)
+
+def parse_rule(line, filename, lineno):
+    """Parse a rule from a line of a rule file."""
+    def error(msg):
+        return PeepholeRuleError('%s:%d: %s' % (filename, lineno, msg))
+    if ' -> ' not in line:
+        raise error('Expected "PATTERN -> REPLACEMENT"')
+    before, after = line.split(' -> ', 1)
+    guard_str = ''
+    if ' if ' in after:
+        after, guard_str = after.split(' if ', 1)
+
+    pattern = []
+    for token in before.split():
+        match = _capture_re.match(token)
+        if match:
+            name, kind = match.group(1), match.group(2) or 'any'
+            if kind != 'any' and kind not in capture_kinds:
+                raise error('Unknown kind of instruction: %s' % kind)
+            if name in [item.name for item in pattern if item.kind is not None]:
+                raise error('Duplicate name: $%s' % name)
+            pattern.append(PatternItem(name, kind))
+        elif token.startswith('OP_'):
+            pattern.append(PatternItem(token, None))
+        else:
+            raise error('Invalid pattern item: %s' % token)
+    if not pattern:
+        raise error('Empty pattern')
+    captured = set(item.name for item in pattern if item.kind is not None)
+
+    def check_args(args, token):
+        if args is None or not set(args) <= captured:
+            raise error('Invalid arguments: %s' % token)
+        return args
+
+    replacement = []
+    tokens = after.split()
+    if tokens != ['_']:
+        for token in tokens:
+            match = _capture_re.match(token)
+            transform_match = _transform_re.match(token)
+            if match and not match.group(2):
+                check_args((match.group(1),), token)
+                replacement.append(ReplacementItem(match.group(1), 'capture', ()))
+            elif transform_match:
+                name = transform_match.group(1)
+                if name not in transforms:
+                    raise error('Unknown transform: %s' % name)
+                args = check_args(_parse_args(transform_match.group(2)), token)
+                replacement.append(ReplacementItem(name, 'transform', args))
+            elif token.startswith('OP_'):
+                replacement.append(ReplacementItem(token, 'opcode', ()))
+            else:
+                raise error('Invalid replacement item: %s' % token)
+
+    rule_guards = []
+    if guard_str:
+        guard_strs = _guard_re.findall(guard_str)
+        if not guard_strs or _guard_re.sub('', guard_str).replace(',', '').strip():
+            raise error('Invalid guards: %s' % guard_str)
+        for name, args in guard_strs:
+            if name not in guards:
+                raise error('Unknown guard: %s' % name)
+            rule_guards.append((name, check_args(_parse_args(args), '%s(%s)' % (name, args))))
+
+    rule = DeclaredRule(tuple(pattern), tuple(replacement), tuple(rule_guards), filename, lineno)
+    if rule.cost_delta > 0:
+        raise error('Rule adds instructions (cost delta %+d)' % rule.cost_delta)
+    return rule
+
+def parse_rules(text, filename='<rules>'):
+    """Parse the rule sets in the text of a rule file."""
+    rule_sets = []
+    # (name, doc_lines, rules) of the current rule set.
+    current = None
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            current = (line[1:-1].strip(), [], [])
+            rule_sets.append(current)
+        elif line.startswith('#'):
+            # Comments before a rule set's first rule describe it.
+            if current and not current[2]:
+                current[1].append(line[1:].strip())
+        elif line:
+            if current is None:
+                raise PeepholeRuleError('%s:%d: Rule outside of a rule set' % (filename, lineno))
+            current[2].append(parse_rule(line, filename, lineno))
+    return [DeclaredRuleSet(name, '\n'.join(doc), rules, filename) for name, doc, rules in rule_sets]
+
+# {path: [DeclaredRuleSet, ...], ...}
+_rule_files = {}
+
+def load_rule_file(path):
+    """Load the rule sets in the rule file at path."""
+    rule_sets = _rule_files.get(path)
+    if rule_sets is None:
+        with open(path) as f:
+            rule_sets = _rule_files[path] = parse_rules(f.read(), path)
+    return list(rule_sets)
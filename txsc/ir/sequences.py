@@ -0,0 +1,146 @@
+"""Base class for sequences that are edited by replacing slices.
+
+Alternative storage types for linear instructions (see chunked_list and
+packed_list) implement a few primitive operations, and SpliceSequence
+provides the rest of the list API in terms of them.
+"""
+
+def slice_bounds(i, j, length):
+    """Get the (start, end) indices of the simple slice [i : j] of length items.
+
+    Python has already added length once to negative indices, so they are clamped
+    to [0, length] as list.__setslice__ would, not wrapped again.
+    """
+    start = max(0, min(i, length))
+    return start, max(start, min(j, length))
+
+class SpliceSequence(object):
+    """A mutable sequence that is edited by replacing slices.
+
+    Subclasses implement:
+        - __len__() and __iter__().
+        - get_item(idx): Get the item at a non-negative index.
+        - get_slice(start, end): Get a list of the items from [start : end].
+        - set_slice(start, end, values): Replace the items from [start : end] with the list values.
+        - set_items(items): Replace every item with the list items.
+
+    """
+    def get_item(self, idx):
+        raise NotImplementedError()
+
+    def get_slice(self, start, end):
+        raise NotImplementedError()
+
+    def set_item(self, idx, value):
+        """Replace the item at a non-negative index with value."""
+        self.set_slice(idx, idx + 1, [value])
+
+    def set_slice(self, start, end, values):
+        raise NotImplementedError()
+
+    def set_items(self, items):
+        raise NotImplementedError()
+
+    def normalize_index(self, idx):
+        """Get the non-negative equivalent of index idx."""
+        length = len(self)
+        if idx < 0:
+            idx += length
+        if not 0 <= idx < length:
+            raise IndexError('list index out of range')
+        return idx
+
+    def __reversed__(self):
+        return reversed(list(self))
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, SpliceSequence)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                return list(self)[key]
+            start, end, _ = key.indices(len(self))
+            return self.get_slice(start, max(start, end))
+        return self.get_item(self.normalize_index(key))
+
+    def __getslice__(self, i, j):
+        return self.get_slice(*slice_bounds(i, j, len(self)))
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError('Extended slices cannot be assigned to')
+            start, end, _ = key.indices(len(self))
+            return self.__setslice__(start, end, value)
+        self.set_item(self.normalize_index(key), value)
+
+    def __setslice__(self, i, j, values):
+        start, end = slice_bounds(i, j, len(self))
+        self.set_slice(start, end, list(values))
+
+    def __delitem__(self, key):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError('Extended slices cannot be deleted')
+            start, end, _ = key.indices(len(self))
+            return self.__delslice__(start, end)
+        idx = self.normalize_index(key)
+        self.set_slice(idx, idx + 1, [])
+
+    def __delslice__(self, i, j):
+        start, end = slice_bounds(i, j, len(self))
+        self.set_slice(start, end, [])
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def append(self, value):
+        self.set_slice(len(self), len(self), [value])
+
+    def extend(self, values):
+        self.set_slice(len(self), len(self), list(values))
+
+    def insert(self, index, value):
+        if index < 0:
+            index += len(self)
+        start, _ = slice_bounds(index, index, len(self))
+        self.set_slice(start, start, [value])
+
+    def pop(self, index=-1):
+        if not len(self):
+            raise IndexError('pop from empty list')
+        idx = self.normalize_index(index)
+        value = self.get_item(idx)
+        self.set_slice(idx, idx + 1, [])
+        return value
+
+    def index(self, value):
+        for i, item in enumerate(self):
+            if item == value:
+                return i
+        raise ValueError('%r is not in list' % (value,))
+
+    def count(self, value):
+        return sum(1 for item in self if item == value)
+
+    def remove(self, value):
+        del self[self.index(value)]
+
+    def reverse(self):
+        self.set_items(list(reversed(self)))
+
+    def sort(self, *args, **kwargs):
+        items = list(self)
+        items.sort(*args, **kwargs)
+        self.set_items(items)
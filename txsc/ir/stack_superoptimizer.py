@@ -0,0 +1,242 @@
+"""Superoptimization of stack manipulation.
+
+A sequence of stack operations (e.g. OP_OVER OP_OVER, or OP_2 OP_ROLL) only
+rearranges, copies, and removes the items at the top of the stack. Its
+effect is described by:
+    - The number of items that the stack must have for it to succeed.
+    - The items that the stack holds afterwards.
+
+Two sequences with the same effect are interchangeable, so any sequence of
+stack operations can be replaced by the cheapest sequence that has its
+effect. A table of the cheapest sequences is generated by searching every
+sequence of stack operations up to a given length (see
+tools/generate-stack-table.py), and is shipped as stack_sequences.json.
+
+Since effects include the number of items required, replacements fail on
+exactly the stacks that the sequences they replace fail on.
+"""
+from collections import namedtuple
+import json
+import os
+
+import txsc.ir.linear_nodes as types
+
+# Path of the table of cheapest sequences.
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stack_sequences.json')
+
+class StackOp(namedtuple('StackOp', ('names', 'required', 'outputs'))):
+    """An operation that manipulates the top of the stack.
+
+    Attributes:
+        - names (tuple): Names of the opcodes of this operation.
+        - required (int): The number of items this operation takes from the stack.
+        - outputs (tuple): Indices of the taken items (from the deepest) that
+            are put back on the stack, from the deepest to the top.
+
+    """
+    __slots__ = ()
+    @property
+    def cost(self):
+        """The number of bytes this operation takes up in a script."""
+        return len(self.names)
+
+    def apply(self, stack):
+        """Get the stack that results from applying this operation to stack (a tuple)."""
+        split = len(stack) - self.required
+        taken = stack[split:]
+        return stack[:split] + tuple(taken[i] for i in self.outputs)
+
+def _stack_op(name, required, outputs):
+    return StackOp((name,), required, tuple(outputs))
+
+# Argument-free stack operations.
+simple_stack_ops = [
+    _stack_op('OP_DROP', 1, ()),
+    _stack_op('OP_DUP', 1, (0, 0)),
+    _stack_op('OP_NIP', 2, (1,)),
+    _stack_op('OP_OVER', 2, (0, 1, 0)),
+    _stack_op('OP_SWAP', 2, (1, 0)),
+    _stack_op('OP_TUCK', 2, (1, 0, 1)),
+    _stack_op('OP_2DROP', 2, ()),
+    _stack_op('OP_2DUP', 2, (0, 1, 0, 1)),
+    _stack_op('OP_ROT', 3, (1, 2, 0)),
+    _stack_op('OP_3DUP', 3, (0, 1, 2, 0, 1, 2)),
+    _stack_op('OP_2OVER', 4, (0, 1, 2, 3, 0, 1)),
+    _stack_op('OP_2SWAP', 4, (2, 3, 0, 1)),
+    _stack_op('OP_2ROT', 6, (2, 3, 4, 5, 0, 1)),
+]
+
+def pick_op(n):
+    """Get the operation that OP_n OP_PICK performs."""
+    return StackOp(('OP_%d' % n, 'OP_PICK'), n + 1, tuple(range(n + 1)) + (0,))
+
+def roll_op(n):
+    """Get the operation that OP_n OP_ROLL performs."""
+    return StackOp(('OP_%d' % n, 'OP_ROLL'), n + 1, tuple(range(1, n + 1)) + (0,))
+
+def get_stack_ops(depth):
+    """Get the stack operations that use at most depth items."""
+    ops = [op for op in simple_stack_ops if op.required <= depth]
+    for n in range(depth):
+        ops.extend([pick_op(n), roll_op(n)])
+    return ops
+
+class Effect(namedtuple('Effect', ('required', 'stack'))):
+    """The effect of a sequence of stack operations on a stack of a fixed depth.
+
+    Attributes:
+        - required (int): The number of items the stack must have.
+        - stack (tuple): The resulting stack, in which the items of the
+            original stack are numbered from the top (0).
+
+    """
+    __slots__ = ()
+    @classmethod
+    def identity(cls, depth):
+        """Get the effect of an empty sequence."""
+        return cls(0, tuple(range(depth - 1, -1, -1)))
+
+    def then(self, op, depth):
+        """Get the effect of applying op after this effect, or None if op uses more than depth items."""
+        # Items below the top len(self.stack) - depth items belong to the original stack.
+        required = max(self.required, op.required - (len(self.stack) - depth))
+        if required > depth:
+            return None
+        return Effect(required, op.apply(self.stack))
+
+    def key(self, depth):
+        """Get the string that identifies this effect in a table.
+
+        The items below the top required items are never changed, so they are omitted.
+        """
+        return '%d:%s' % (self.required, ','.join(map(str, self.stack[depth - self.required:])))
+
+def sequence_cost(ops):
+    """Get the cost of a sequence of operations, as (bytes, operations)."""
+    return (sum(op.cost for op in ops), len(ops))
+
+def search(max_length, depth):
+    """Find the cheapest sequence of stack operations for every effect.
+
+    Every sequence of at most max_length operations on the top depth items
+    is considered. At each length, only the cheapest sequence with a given
+    effect is extended, since extending any other sequence with that effect
+    results in the same effects at a higher cost.
+
+    Returns a dict of {effect: [op, ...], ...}.
+    """
+    ops = get_stack_ops(depth)
+    identity = Effect.identity(depth)
+    best = {identity: []}
+    level = {identity: []}
+    for _ in range(max_length):
+        next_level = {}
+        for effect, sequence in level.iteritems():
+            for op in ops:
+                new_effect = effect.then(op, depth)
+                if new_effect is None:
+                    continue
+                new_sequence = sequence + [op]
+                cost = sequence_cost(new_sequence)
+                current = next_level.get(new_effect)
+                if current is None or cost < sequence_cost(current):
+                    next_level[new_effect] = new_sequence
+                current = best.get(new_effect)
+                if current is None or cost < sequence_cost(current):
+                    best[new_effect] = new_sequence
+        level = next_level
+    return best
+
+def build_table(max_length, depth):
+    """Build a table of the cheapest sequences of stack operations.
+
+    Sequences are stored as space-separated opcode names.
+    """
+    sequences = {}
+    for effect, sequence in search(max_length, depth).iteritems():
+        sequences[effect.key(depth)] = ' '.join(name for op in sequence for name in op.names)
+    return {'max_length': max_length, 'depth': depth, 'sequences': sequences}
+
+def write_table(table, path=TABLE_PATH):
+    with open(path, 'w') as f:
+        json.dump(table, f, indent=0, sort_keys=True, separators=(',', ':'))
+        f.write('\n')
+
+def read_table(path=TABLE_PATH):
+    """Read a table of the cheapest sequences, or return None if it does not exist."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+class StackSuperoptimizer(object):
+    """Replaces sequences of stack operations in linear instructions with the cheapest equivalents."""
+    def __init__(self, table):
+        self.depth = table['depth']
+        self.sequences = table['sequences']
+        ops = get_stack_ops(self.depth)
+        self.simple_ops = dict((op.names[0], op) for op in ops if len(op.names) == 1)
+        self.arg_ops = dict((op.names, op) for op in ops if len(op.names) == 2)
+
+    def stack_op_at(self, instructions, idx):
+        """Get the stack operation that starts at idx, or None."""
+        op = self.simple_ops.get(instructions[idx].name)
+        if op or idx + 1 >= len(instructions):
+            return op
+        return self.arg_ops.get((instructions[idx].name, instructions[idx + 1].name))
+
+    def make_nodes(self, sequence):
+        """Create nodes from a space-separated sequence of opcode names, or return None."""
+        classes = [types.opcode_by_name(name) for name in sequence.split()]
+        if not all(classes):
+            return None
+        return [cls() for cls in classes]
+
+    def best_replacement(self, instructions, idx):
+        """Get the cheapest replacement of a sequence of stack operations that starts at idx.
+
+        Returns an (end, nodes) tuple, or None if no sequence starting at idx can be shortened.
+        """
+        effect = Effect.identity(self.depth)
+        best = None
+        end = idx
+        while end < len(instructions):
+            op = self.stack_op_at(instructions, end)
+            if not op:
+                break
+            effect = effect.then(op, self.depth)
+            if effect is None:
+                break
+            end += len(op.names)
+            sequence = self.sequences.get(effect.key(self.depth))
+            if sequence is None:
+                continue
+            saving = (end - idx) - len(sequence.split())
+            if saving > 0 and (best is None or saving > best[0]):
+                nodes = self.make_nodes(sequence)
+                if nodes is not None:
+                    best = (saving, end, nodes)
+        return best[1:] if best else None
+
+    def optimize(self, instructions):
+        """Replace sequences of stack operations in instructions with cheaper equivalents."""
+        idx = 0
+        while idx < len(instructions):
+            replacement = self.best_replacement(instructions, idx)
+            if replacement is None:
+                idx += 1
+                continue
+            end, nodes = replacement
+            instructions.replace_slice(idx, end, nodes)
+
+# The superoptimizer for the shipped table. False means that the table does not exist.
+_superoptimizer = None
+
+def get_superoptimizer():
+    """Get the StackSuperoptimizer for the shipped table, or None if the table does not exist."""
+    global _superoptimizer
+    if _superoptimizer is None:
+        table = read_table()
+        _superoptimizer = StackSuperoptimizer(table) if table else False
+    return _superoptimizer or None
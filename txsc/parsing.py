@@ -0,0 +1,181 @@
+"""PLY lexer and parser construction and pooling.
+
+Building a PLY lexer means compiling and validating its token rules, and building
+a parser means generating LALR tables. Both are done once and the results are stored
+in the txsc cache directory (see txsc.cache). Later constructions only load them.
+
+Tables are keyed by the contents of the source files that define the grammar,
+so they are regenerated automatically whenever the grammar changes.
+
+Constructed parsers are kept in a pool so that they can be reused by
+later compilations (see ParserPool).
+"""
+from contextlib import contextmanager
+import os
+import threading
+
+from ply import lex, yacc
+
+from txsc import cache
+
+# {name: table key, ...}
+_table_keys = {}
+# {table name: table module, ...}
+_table_modules = {}
+
+def get_table_key(name, modules):
+    """Get the key for the tables of a grammar.
+
+    Args:
+        name (str): Name of the grammar.
+        modules (list): Modules that define the grammar.
+
+    """
+    key = _table_keys.get(name)
+    if key is None:
+        paths = [cache.get_source_file(module) for module in modules]
+        key = '%s_%s' % (name, cache.digest([name, lex.__version__, yacc.__version__], paths)[:16])
+        _table_keys[name] = key
+    return key
+
+def _load_table(tabname, path):
+    """Load the table module tabname from path."""
+    module = _table_modules.get(tabname)
+    if module is None:
+        try:
+            module = cache.load_source('txsc_%s' % tabname, path)
+        except Exception:
+            return None
+        if module is not None:
+            _table_modules[tabname] = module
+    return module
+
+def _write_table(tabname, path, build):
+    """Call build with the name of a temporary table module and move the result to path."""
+    outputdir = os.path.dirname(path)
+    tmpname = '%s_%d_%d_tmp' % (tabname, os.getpid(), threading.current_thread().ident)
+    result = build(tmpname, outputdir)
+    cache.make_private(os.path.join(outputdir, tmpname + '.py'))
+    try:
+        os.rename(os.path.join(outputdir, tmpname + '.py'), path)
+    except OSError:
+        pass
+    return result
+
+def build_lexer(name, modules, **kwargs):
+    """Build a lexer, loading its tables from the cache if possible.
+
+    Keyword arguments are passed to ply.lex.lex().
+    """
+    tabname = 'lextab_%s' % get_table_key(name, modules)
+    path = cache.get_cache_path(tabname + '.py')
+    if path is None:
+        return lex.lex(**kwargs)
+
+    tabmodule = _load_table(tabname, path)
+    if tabmodule is not None:
+        try:
+            return lex.lex(optimize=1, lextab=tabmodule, **kwargs)
+        except Exception:
+            _table_modules.pop(tabname, None)
+
+    # Validate the token rules before writing their tables.
+    lex.lex(**kwargs)
+    return _write_table(tabname, path,
+            lambda tmpname, outputdir: lex.lex(optimize=1, lextab=tmpname, outputdir=outputdir, **kwargs))
+
+def build_parser(name, modules, **kwargs):
+    """Build a parser, loading its LALR tables from the cache if possible.
+
+    Keyword arguments are passed to ply.yacc.yacc().
+    """
+    tabname = 'parsetab_%s' % get_table_key(name, modules)
+    path = cache.get_cache_path(tabname + '.py')
+    if path is None:
+        return yacc.yacc(write_tables=False, **kwargs)
+    # Debugging output is written alongside the tables.
+    kwargs.setdefault('outputdir', os.path.dirname(path))
+
+    tabmodule = _load_table(tabname, path)
+    if tabmodule is not None:
+        try:
+            return yacc.yacc(tabmodule=tabmodule, write_tables=False, **kwargs)
+        except Exception:
+            _table_modules.pop(tabname, None)
+
+    return _write_table(tabname, path,
+            lambda tmpname, outputdir: yacc.yacc(tabmodule=tmpname, **dict(kwargs, outputdir=outputdir)))
+
+
+class ParserPool(object):
+    """Pool of ready parsers, keyed by language name.
+
+    Free parsers are kept per thread, so a parser is never used by
+    two threads at once. A parser's reset() method, if it has one, is
+    called when it is returned to the pool.
+    """
+    def __init__(self):
+        # {language_name: parser_factory, ...}
+        self.factories = {}
+        self._local = threading.local()
+
+    def register(self, name, factory):
+        """Register the callable that creates parsers for language name."""
+        self.factories[name] = factory
+
+    def _free_parsers(self, name):
+        """Get the list of free parsers for name in the current thread."""
+        free = getattr(self._local, 'free', None)
+        if free is None:
+            free = self._local.free = {}
+        return free.setdefault(name, [])
+
+    def acquire(self, name):
+        """Take a parser for name out of the pool, creating one if necessary."""
+        free = self._free_parsers(name)
+        if free:
+            return free.pop()
+        return self.factories[name]()
+
+    def release(self, name, parser):
+        """Reset parser and return it to the pool."""
+        reset = getattr(parser, 'reset', None)
+        if reset is not None:
+            reset()
+        self._free_parsers(name).append(parser)
+
+    @contextmanager
+    def borrow(self, name):
+        """Context manager that borrows a parser for name from the pool."""
+        parser = self.acquire(name)
+        try:
+            yield parser
+        finally:
+            self.release(name, parser)
+
+    def clear(self):
+        """Discard the free parsers of the current thread."""
+        self._local.free = {}
+
+# Process-wide parser pool.
+parser_pool = ParserPool()
+
+def register_parser(name, factory):
+    """Register the callable that creates parsers for language name."""
+    parser_pool.register(name, factory)
+
+def borrow_parser(name):
+    """Borrow a parser for language name from the process-wide pool.
+
+    This is a context manager. The parser is returned to the pool afterward.
+    """
+    return parser_pool.borrow(name)
+
+def preload_parsers():
+    """Create a parser for each registered language in the current thread.
+
+    This is used to prepare a process before it compiles anything.
+    """
+    for name in parser_pool.factories.keys():
+        with parser_pool.borrow(name):
+            pass
@@ -4,7 +4,6 @@ import ast
 import json
 import os
 import sys
-from pkg_resources import iter_entry_points
 import logging
 
 from txsc.symbols import SymbolTable
@@ -16,8 +15,8 @@ from txsc.ir import linear_optimizer, IRError
 from txsc.txscript import ParsingError
 from txsc import config
 
-# Will not reload the entry points if they've already been loaded.
-config.load_entry_points()
+# Format of log messages.
+log_format = '%(levelname)s [%(name)s] %(message)s'
 
 def set_log_level(level):
     """Set the minimum logging level."""
@@ -119,6 +118,8 @@ class ScriptCompiler(object):
         self.outputs = OrderedDict()
         self.symbol_table = None
         self.source_lines = []
+        # Options loaded from configuration files, keyed by (working directory, path).
+        self.config_files = {}
         self.setup_languages()
         # If true, sys.exit() will not be called when failing.
         self.testing_mode = False
@@ -128,16 +129,36 @@ class ScriptCompiler(object):
         self.input_languages = {i.name: i for i in filter(lambda cls: cls.has_source_visitor(), self.langs)}
         self.output_languages = {i.name: i for i in filter(lambda cls: cls.has_target_visitor(), self.langs)}
 
+    def load_plugins(self):
+        """Load languages and opcode sets from entry points.
+
+        Entry points are only loaded when something that is not built-in is requested.
+        """
+        if config.has_loaded():
+            return
+        config.load_entry_points()
+        self.setup_languages()
+
+    def get_config_options(self, config_file):
+        """Get the options in config_file (or in the default configuration file).
+
+        Configuration files are only loaded once per compiler and working directory.
+        """
+        key = (os.getcwd(), config_file)
+        if key not in self.config_files:
+            if config_file:
+                self.config_files[key] = self.load_file(config_file)
+            else:
+                self.config_files[key] = self.load_config_file()
+        return self.config_files[key]
+
     def setup_options(self, options):
         if not isinstance(options, CompilationOptions):
             options = CompilationOptions(options)
         self.options = options
 
         # Load options from config file (if one exists).
-        if self.options.config_file:
-            config_options = self.load_file(self.options.config_file)
-        else:
-            config_options = self.load_config_file()
+        config_options = self.get_config_options(self.options.config_file)
         if config_options:
             for k, v in config_options.items():
                 if k not in self.options.supplied_options:
@@ -149,6 +170,8 @@ class ScriptCompiler(object):
         set_log_level(self.options.log_level)
 
         # Compilation source and target.
+        if self.options.source_lang not in self.input_languages or self.options.target_lang not in self.output_languages:
+            self.load_plugins()
         self.source_lang = self.input_languages[self.options.source_lang]
         self.target_lang = self.output_languages[self.options.target_lang]
 
@@ -195,7 +218,7 @@ class ScriptCompiler(object):
         # Opcode set.
         opcode_set = directives.get('opcode-set')
         if opcode_set:
-            if opcode_set not in config.get_opcode_sets().keys():
+            if not config.has_opcode_set(opcode_set):
                 valid_opcode_sets = ''.join(['\n- %s' % name for name in config.get_opcode_sets().keys()])
                 raise DirectiveError('Invalid choice for opcode set: "%s"\nValid choices are:%s' % (opcode_set, valid_opcode_sets))
             else:
@@ -205,6 +228,8 @@ class ScriptCompiler(object):
         # Target language.
         target = directives.get('target')
         if target:
+            if target not in self.output_languages.keys():
+                self.load_plugins()
             if target not in self.output_languages.keys():
                 valid_targets = ''.join(['\n- %s' % name for name in self.output_languages.keys()])
                 raise DirectiveError('Invalid choice for target: "%s"\nValid choices are:%s' % (target, valid_targets))
@@ -253,7 +278,8 @@ class ScriptCompiler(object):
         """Process intermediate representation."""
         # Convert structural to linear representation.
         if instructions.ir_type == STRUCTURAL:
-            ast.fix_missing_locations(instructions.script)
+            if not instructions.has_locations:
+                ast.fix_missing_locations(instructions.script)
             if self.verbosity.show_structural_ir:
                 self.outputs['Structural Intermediate Representation'] = instructions.dump()
             try:
@@ -0,0 +1,516 @@
+"""Compilation server and client.
+
+`txsc serve` starts a server that keeps compilers (with their languages and
+parser tables) ready in worker processes, so that compiling does not pay for
+interpreter startup and imports each time. `txsc --client ...` sends its
+arguments to the server and outputs exactly what `txsc ...` would.
+
+The server listens on a Unix domain socket, or on a loopback TCP port.
+Messages in both directions are JSON objects, each preceded by its length as
+a 4-byte big-endian unsigned integer. A connection may be used for any number
+of requests. A request is either:
+
+- {"argv": [...], "cwd": "...", "prog": "txsc", "stdin": "..."}: Run the
+  command-line interface with the arguments argv in the directory cwd, reading
+  stdin (if given) as its standard input. The response has "stdout", "stderr",
+  and "status" (the exit status).
+- {"job": {...}}: Compile a batch job (see txsc.batch). The response is the
+  job's result.
+
+Requests can read and write files as the user that runs the server, so only
+that user may connect. The Unix domain socket is only accessible to that user.
+A TCP server only listens on loopback addresses, and requests must include a
+"token" that the server writes to a file that only that user can read (see
+get_token_path()).
+
+Each worker process compiles one request at a time, so the number of workers
+limits how many requests are compiled at once. A worker that takes longer than
+the timeout to compile a request is killed and replaced.
+"""
+import argparse
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import Queue
+import signal
+import socket
+import SocketServer
+import stat
+import struct
+import sys
+import traceback
+from StringIO import StringIO
+
+# The compiler is only imported by servers and workers, so that clients start quickly.
+from txsc import cache
+
+# Environment variable with the address of the server.
+ADDRESS_ENV_VAR = 'TXSC_SERVER'
+# Format of the length that precedes each message.
+LENGTH_FORMAT = '>I'
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+# Maximum size of a message in bytes.
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+# Default number of seconds that a request may take to compile.
+DEFAULT_TIMEOUT = 10.0
+
+class ProtocolError(Exception):
+    """Exception raised when an invalid message is received."""
+    pass
+
+def get_default_address():
+    """Get the address that the server listens on by default."""
+    address = os.environ.get(ADDRESS_ENV_VAR)
+    if address:
+        return address
+    return os.path.join(cache.get_cache_dir() or '.', 'server.sock')
+
+def parse_address(address):
+    """Parse address.
+
+    An address is either a path to a Unix domain socket, or [HOST:]PORT
+    for a TCP socket.
+    """
+    host, _, port = address.rpartition(':')
+    if port.isdigit() and os.sep not in address:
+        return (host or 'localhost', int(port))
+    return address
+
+def is_loopback(host):
+    """Get whether every address that host resolves to is a loopback address."""
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    return bool(infos) and all(info[4][0].startswith('127.') or info[4][0] == '::1' for info in infos)
+
+def get_token_path(address):
+    """Get the path of the file with the token of the TCP server at address (a (host, port) tuple)."""
+    return os.path.join(cache.get_cache_dir() or '.', 'server-%d.token' % address[1])
+
+def read_token(address):
+    """Read the token of the server at address, or return None if it is not a TCP server."""
+    address = parse_address(address)
+    if not isinstance(address, tuple):
+        return None
+    try:
+        with open(get_token_path(address)) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+def connect(address):
+    """Connect to the server at address."""
+    address = parse_address(address)
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+        except socket.error:
+            sock.close()
+            raise
+    return sock
+
+def remove_stale_socket(path):
+    """Remove the Unix domain socket at path if no server is listening on it.
+
+    Raises ValueError if path exists and is not a socket, or if a server is listening on it.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError('%s already exists and is not a socket.' % path)
+    try:
+        connect(path).close()
+    except socket.error:
+        os.remove(path)
+        return
+    raise ValueError('A server is already listening on %s.' % path)
+
+def get_file_id(path):
+    """Get the (device, inode) pair of the file at path, or None if it does not exist."""
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return None
+    return (info.st_dev, info.st_ino)
+
+def encode_message(obj):
+    """Encode obj as a message."""
+    data = json.dumps(obj)
+    return struct.pack(LENGTH_FORMAT, len(data)) + data
+
+def recv_exact(sock, size):
+    """Receive size bytes from sock.
+
+    Returns None if the connection is closed before any bytes are received.
+    """
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 16))
+        if not chunk:
+            if remaining == size:
+                return None
+            raise ProtocolError('Connection closed during a message.')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return ''.join(chunks)
+
+def read_message(sock):
+    """Read a message from sock.
+
+    Returns None if the connection is closed.
+    """
+    header = recv_exact(sock, LENGTH_SIZE)
+    if header is None:
+        return None
+    size, = struct.unpack(LENGTH_FORMAT, header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ProtocolError('Message of %d bytes is too large.' % size)
+    data = recv_exact(sock, size) if size else ''
+    if data is None:
+        raise ProtocolError('Connection closed during a message.')
+    try:
+        return json.loads(data)
+    except ValueError:
+        raise ProtocolError('Message is not valid JSON.')
+
+def write_message(sock, obj):
+    """Write obj to sock as a message."""
+    sock.sendall(encode_message(obj))
+
+def request(sock, obj):
+    """Send request obj over sock and return the response."""
+    write_message(sock, obj)
+    response = read_message(sock)
+    if response is None:
+        raise ProtocolError('Connection closed before a response was received.')
+    return response
+
+
+def reads_stdin(argv):
+    """Get whether the command-line interface reads standard input when it is run with arguments argv."""
+    # Only batches read standard input, so other commands do not need the argument parser.
+    if '--batch' not in argv:
+        return False
+    from txsc import compiler as cli
+    try:
+        args = cli.create_arg_parser().parse_args(argv)
+    except SystemExit:
+        return False
+    return cli.batch_reads_stdin(args)
+
+def run_client(argv, address=None):
+    """Run the command-line interface with arguments argv on a server.
+
+    Returns the exit status.
+    """
+    address = address or get_default_address()
+    req = {'argv': argv, 'cwd': os.getcwd(), 'prog': os.path.basename(sys.argv[0])}
+    if reads_stdin(argv):
+        req['stdin'] = sys.stdin.read()
+    token = read_token(address)
+    if token:
+        req['token'] = token
+    try:
+        sock = connect(address)
+    except socket.error as e:
+        sys.stderr.write('Could not connect to txsc server at %s: %s\n' % (address, e))
+        return 1
+    try:
+        response = request(sock, req)
+    except (socket.error, ProtocolError) as e:
+        sys.stderr.write('Error communicating with txsc server at %s: %s\n' % (address, e))
+        return 1
+    finally:
+        sock.close()
+
+    if 'error' in response:
+        sys.stderr.write('txsc server error: %s\n' % response['error'])
+        return 1
+    sys.stdout.write(response['stdout'].encode('utf-8'))
+    sys.stdout.flush()
+    sys.stderr.write(response['stderr'].encode('utf-8'))
+    return response['status']
+
+
+def exit_status(code):
+    """Get the exit status of a process that called sys.exit(code)."""
+    if code is None:
+        return 0
+    elif isinstance(code, int):
+        return code
+    sys.stderr.write('%s\n' % code)
+    return 1
+
+def run_command(compiler, argv, cwd, prog=None, stdin=''):
+    """Run the command-line interface with compiler and capture its output.
+
+    stdin is the text that the command-line interface reads as its standard input.
+    """
+    from txsc import compiler as cli
+    from txsc.script_compiler import log_format
+    stdout, stderr = StringIO(), StringIO()
+    handler = logging.StreamHandler(stderr)
+    handler.setFormatter(logging.Formatter(log_format))
+    logger = logging.getLogger('txsc')
+
+    saved_streams = sys.stdin, sys.stdout, sys.stderr
+    saved_cwd = os.getcwd()
+    logger.addHandler(handler)
+    sys.stdin, sys.stdout, sys.stderr = StringIO(stdin or ''), stdout, stderr
+    # Batch compilation enables testing mode.
+    compiler.testing_mode = False
+    status = 0
+    try:
+        os.chdir(cwd)
+        cli.run(compiler, argv, prog)
+    except SystemExit as e:
+        status = exit_status(e.code)
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = saved_streams
+        os.chdir(saved_cwd)
+        logger.removeHandler(handler)
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'status': status}
+
+def worker_main(conn):
+    """Compile the requests received over conn until it is closed."""
+    from txsc.batch import BatchCompiler, to_str
+    from txsc.script_compiler import ScriptCompiler
+    from txsc import parsing
+    # The server handles interrupts.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Output is captured per request.
+    logging.getLogger('txsc').handlers = []
+
+    compiler = ScriptCompiler()
+    batch_compiler = BatchCompiler(compiler)
+    parsing.preload_parsers()
+    while True:
+        try:
+            req = conn.recv()
+        except (EOFError, IOError):
+            break
+        req = to_str(req)
+        if 'job' in req:
+            response = batch_compiler.compile_job(req['job'])
+        else:
+            response = run_command(compiler, req['argv'], req['cwd'], req.get('prog'), req.get('stdin'))
+        conn.send(response)
+
+class WorkerError(Exception):
+    """Exception raised when a worker fails to compile a request."""
+    pass
+
+class Worker(object):
+    """Worker process that compiles requests.
+
+    Workers are daemonic, so they cannot start processes of their own.
+    Batches are compiled within them (see BatchCompiler.iter_results()).
+    """
+    def __init__(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_main, args=(child_conn,))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    def compile(self, req, timeout):
+        """Compile req and return the response.
+
+        Raises WorkerError if the worker exits or does not respond within timeout seconds.
+        """
+        try:
+            self.conn.send(req)
+            if not self.conn.poll(timeout):
+                raise WorkerError('Compilation timed out after %s seconds.' % timeout)
+            return self.conn.recv()
+        except (EOFError, IOError):
+            raise WorkerError('Worker process exited unexpectedly.')
+
+    def stop(self):
+        """Stop the worker process."""
+        self.conn.close()
+        self.process.terminate()
+        self.process.join()
+
+class RequestHandler(SocketServer.BaseRequestHandler):
+    """Handles the requests of a connection."""
+    def handle(self):
+        while True:
+            try:
+                req = read_message(self.request)
+            except ProtocolError as e:
+                write_message(self.request, {'error': str(e)})
+                return
+            if req is None:
+                return
+            write_message(self.request, self.server.compile(req))
+
+class UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class CompileServer(object):
+    """Server that compiles requests with a fixed number of worker processes."""
+    def __init__(self, address, processes, timeout=DEFAULT_TIMEOUT):
+        from txsc.script_compiler import ScriptCompiler
+        from txsc import parsing
+        self.logger = logging.getLogger(__name__)
+        self.address = address
+        self.timeout = timeout
+        if isinstance(address, tuple):
+            if not is_loopback(address[0]):
+                raise ValueError('TCP servers may only listen on loopback addresses, not %s.' % address[0])
+        else:
+            remove_stale_socket(address)
+
+        # Workers that are forked after this share the parsers that it creates.
+        ScriptCompiler()
+        parsing.preload_parsers()
+        self.idle_workers = Queue.Queue()
+        for _ in range(processes):
+            self.idle_workers.put(Worker())
+
+        # Token that requests to a TCP server must include.
+        self.token = None
+        try:
+            self.bind(address)
+        except Exception:
+            self.stop_workers()
+            raise
+        self.server.compile = self.compile
+        self.logger.info('Listening on %s with %d workers' % (self.address, processes))
+
+    def bind(self, address):
+        """Create the server that listens on address."""
+        if isinstance(address, tuple):
+            self.token = os.urandom(16).encode('hex')
+            self.server = TCPServer(address, RequestHandler)
+            # The port is chosen by the system if it is 0.
+            self.address = self.server.server_address[:2]
+            self.write_token()
+            self.path = get_token_path(self.address)
+        else:
+            # Only the user that started the server may connect to it.
+            old_umask = os.umask(0o077)
+            try:
+                self.server = UnixServer(address, RequestHandler)
+            finally:
+                os.umask(old_umask)
+            self.path = address
+        # The file is only removed on close if it has not been replaced since.
+        self.file_id = get_file_id(self.path)
+
+    def write_token(self):
+        """Write the token to a file that only the current user can read."""
+        path = get_token_path(self.address)
+        old_umask = os.umask(0o077)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            with open(path, 'w') as f:
+                f.write(self.token)
+        finally:
+            os.umask(old_umask)
+
+    def compile(self, req):
+        """Compile req with the next idle worker and return the response."""
+        if not isinstance(req, dict) or not (isinstance(req.get('job'), dict) or
+                (isinstance(req.get('argv'), list) and isinstance(req.get('cwd'), basestring)
+                 and isinstance(req.get('stdin', ''), basestring))):
+            return {'error': 'Invalid request.'}
+        if self.token is not None:
+            token = req.get('token')
+            if isinstance(token, unicode):
+                token = token.encode('utf-8')
+            if not isinstance(token, str) or not hmac.compare_digest(token, self.token):
+                return {'error': 'Invalid token.'}
+
+        worker = self.idle_workers.get()
+        try:
+            return worker.compile(req, self.timeout)
+        except WorkerError as e:
+            self.logger.warning(str(e))
+            worker.stop()
+            worker = Worker()
+            if 'job' in req:
+                return {'id': req['job'].get('id'), 'success': False, 'error': {'type': 'WorkerError', 'message': str(e)}}
+            return {'stdout': '', 'stderr': '%s\n' % e, 'status': 1}
+        finally:
+            self.idle_workers.put(worker)
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        """Stop serve_forever() (which must be running in another thread)."""
+        self.server.shutdown()
+
+    def close(self):
+        """Stop the server and its workers."""
+        self.server.server_close()
+        if self.file_id is not None and get_file_id(self.path) == self.file_id:
+            os.remove(self.path)
+        self.stop_workers()
+
+    def stop_workers(self):
+        """Stop the idle workers."""
+        while not self.idle_workers.empty():
+            self.idle_workers.get().stop()
+
+
+def create_serve_arg_parser():
+    argparser = argparse.ArgumentParser(prog='txsc serve', description='Run a txsc compilation server.')
+    argparser.add_argument('--address', dest='address', metavar='ADDRESS', default=get_default_address(),
+                           help='Path of a Unix domain socket, or [HOST:]PORT of a loopback TCP socket to listen on (Default: %(default)s). '
+                                'Clients use $' + ADDRESS_ENV_VAR + ', or the default.')
+    argparser.add_argument('-j', '--jobs', dest='jobs', metavar='N', type=int, default=0, help='Number of requests to compile at once (Default: one per CPU).')
+    argparser.add_argument('--timeout', dest='timeout', metavar='SECONDS', type=float, default=DEFAULT_TIMEOUT, help='Maximum time to compile a request (Default: %(default)s).')
+    argparser.add_argument('--log', dest='log_level', metavar='LEVEL', default='info', help='Minimum logging level of the server (Default: %(default)s).')
+    return argparser
+
+def serve_main(argv):
+    """Run the server with command-line arguments argv.
+
+    Returns the exit status.
+    """
+    from txsc.script_compiler import log_format, set_log_level
+    args = create_serve_arg_parser().parse_args(argv)
+    logger = logging.getLogger('txsc')
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(log_format))
+    logger.addHandler(handler)
+    set_log_level(args.log_level)
+
+    processes = args.jobs if args.jobs > 0 else multiprocessing.cpu_count()
+    address = parse_address(args.address)
+    if isinstance(address, tuple) and not is_loopback(address[0]):
+        create_serve_arg_parser().error('argument --address: TCP servers may only listen on loopback addresses')
+    try:
+        server = CompileServer(address, processes, args.timeout)
+    except (ValueError, socket.error) as e:
+        logger.error(str(e))
+        return 1
+    # Stop cleanly when terminated.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
@@ -1,3 +1,4 @@
+import StringIO
 import unittest
 
 from txsc.asm import ASMLanguage
@@ -5,7 +6,7 @@ from txsc.asm import ASMLanguage
 class BaseASMTest(unittest.TestCase):
     def _do_test(self, expected, script):
         expected = str(expected.split(' '))
-        if not isinstance(script, list):
+        if isinstance(script, str):
             script = [script]
         instructions = ASMLanguage().process_source(script)
         self.assertEqual(expected, str(instructions))
@@ -14,3 +15,17 @@ class TestInput(BaseASMTest):
     def test_input(self):
         self._do_test('OP_1 OP_2 OP_ADD', '1 2 ADD')
         self._do_test('70 OP_2 OP_ADD', '0x01 0x70 2 ADD')
+
+    def test_push_data(self):
+        self._do_test('0005 OP_DUP', '0x02 0x0005 DUP')
+        self._do_test('00', '0x01 0x00')
+
+    def test_multiple_lines(self):
+        self._do_test('OP_1 OP_2 OP_ADD', ['1', '2 ADD'])
+
+    def test_file_input(self):
+        self._do_test('70 OP_2 OP_ADD', StringIO.StringIO('0x01 0x70\n2 ADD\n'))
+
+    def test_invalid_input(self):
+        for script in ['0x01', '0x01 ADD', '0x02 0x05', 'FOO', '17']:
+            self.assertRaises(SyntaxError, ASMLanguage().process_source, script)
@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from txsc import batch
+from txsc.script_compiler import ScriptCompiler
+
+class BatchCompilerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.batch_compiler = batch.BatchCompiler(ScriptCompiler(), {'optimization': 1, 'target_lang': 'asm', 'config_file': '-'})
+
+    def _run(self, lines):
+        output = StringIO()
+        failures = self.batch_compiler.run(batch.iter_json_jobs(StringIO('\n'.join(lines))), output)
+        return failures, [json.loads(i) for i in output.getvalue().splitlines()]
+
+    def test_jobs(self):
+        failures, results = self._run([
+            '{"id": "a", "source": "verify 2 + 5 == 7;"}',
+            '{"id": "b", "source": ["assume a;", "verify a == 3;"], "target_lang": "btc"}',
+            '{"id": "c", "source": "5255935788", "source_lang": "btc"}',
+        ])
+        self.assertEqual(0, failures)
+        self.assertEqual(['a', 'b', 'c'], [i['id'] for i in results])
+        self.assertEqual(['2 5 ADD 7 EQUALVERIFY', '5388', '2 5 ADD 7 EQUALVERIFY'], [i['output'] for i in results])
+
+    def test_errors_do_not_abort(self):
+        failures, results = self._run([
+            'not json',
+            '{"id": 1, "source": "verify 2 + ;"}',
+            '{"id": 2, "source": "verify b;"}',
+            '{"id": 3, "source": "5;", "target_lang": "nope"}',
+            '{"id": 4}',
+            '{"id": 5, "source": "5;"}',
+        ])
+        self.assertEqual(5, failures)
+        self.assertEqual([False] * 5 + [True], [i['success'] for i in results])
+        self.assertEqual(['BatchError', 'SyntaxError', 'IRError', 'BatchError', 'BatchError'], [i['error']['type'] for i in results[:-1]])
+        self.assertEqual(1, results[2]['error']['line'])
+        self.assertEqual('5', results[-1]['output'])
+
+    def test_processes(self):
+        jobs = [{'id': i, 'source': 'verify %d + 5 == 7;' % i} for i in range(20)] + ['not json']
+        expected = list(self.batch_compiler.iter_results(jobs))
+        results = list(self.batch_compiler.iter_results(jobs, processes=2, chunksize=3))
+        self.assertEqual(expected, results)
+        self.assertEqual(range(20) + [None], [i['id'] for i in results])
+
+class FileJobsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name, src in [('a.txscript', '2 + 3;'), ('b.asm', '2 3 ADD'), ('c.btc', '525393')]:
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(src)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_expand_paths(self):
+        names = ['a.txscript', 'b.asm', 'c.btc']
+        self.assertEqual(names, map(os.path.basename, batch.expand_paths([self.directory])))
+        self.assertEqual(names[1:], map(os.path.basename, batch.expand_paths([os.path.join(self.directory, '*.[ab]*[mc]')])))
+
+    def test_source_lang_from_extension(self):
+        batch_compiler = batch.BatchCompiler(ScriptCompiler(), {'target_lang': 'asm', 'config_file': '-'})
+        results = [batch_compiler.compile_job(job) for job in batch.iter_file_jobs([self.directory])]
+        self.assertEqual(['5', '2 3 ADD', '2 3 ADD'], [i['output'] for i in results])
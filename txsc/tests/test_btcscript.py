@@ -1,10 +1,11 @@
 import unittest
 
+from txsc import btcscript
 from txsc.script_compiler import ScriptCompiler
 
 class BaseBtcScriptTest(unittest.TestCase):
     @classmethod
-    def setupClass(cls):
+    def setUpClass(cls):
         cls.compiler = ScriptCompiler()
 
     def _do_compile(self, src, input='btc'):
@@ -25,6 +26,25 @@ class TestBtcScript(BaseBtcScriptTest):
     def test_input_with_0x_prefix(self):
         self._do_test('2 5 ADD', '0x525593')
 
+    def test_input_pushdata(self):
+        self._do_test('0x4c ' + '0x' + '46' * 0x4c, '4c4c' + '46' * 0x4c)
+        self._do_test('0x0100 ' + '0x' + '46' * 0x100, '4d0001' + '46' * 0x100)
+        self._do_test('0x01 0x46', '4e0100000046')
+
+    def test_input_small_ints(self):
+        self._do_test('0 1 16 1NEGATE', '0051604f')
+
+    def test_invalid_input(self):
+        for script in ['02aa', '4c', '4d01', 'ba', 'zz']:
+            self.assertRaises(SyntaxError, self._do_compile, script)
+
+    def test_iter_script(self):
+        ops = list(btcscript.iter_script('\x02\xaa\xbb\x93'))
+        self.assertEqual([0x02, 0x93], [op for op, _ in ops])
+        self.assertIsInstance(ops[0][1], memoryview)
+        self.assertEqual('\xaa\xbb', ops[0][1].tobytes())
+        self.assertIsNone(ops[1][1])
+
 class TestBtcOutput(BaseBtcScriptTest):
     def _do_test(self, expected, script):
         super(TestBtcOutput, self)._do_test(expected, script, input='asm', output='btc')
@@ -0,0 +1,116 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from txsc import cache, parsing
+from txsc.txscript import ScriptParser
+
+class BaseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.old_env = os.environ.get('TXSC_CACHE_DIR')
+        os.environ['TXSC_CACHE_DIR'] = self.cache_dir
+        cache.set_cache_dir(None)
+
+    def tearDown(self):
+        if self.old_env is None:
+            del os.environ['TXSC_CACHE_DIR']
+        else:
+            os.environ['TXSC_CACHE_DIR'] = self.old_env
+        cache.set_cache_dir(None)
+        shutil.rmtree(self.directory)
+
+    def mode(self, path):
+        return stat.S_IMODE(os.stat(path).st_mode)
+
+class CacheDirTest(BaseCacheTest):
+    def test_private_dir(self):
+        path = cache.get_cache_dir()
+        self.assertEqual(os.path.join(self.cache_dir, cache.get_version_tag()), path)
+        self.assertEqual(0o700, self.mode(self.cache_dir))
+        self.assertEqual(0o700, self.mode(path))
+
+    def test_existing_dir(self):
+        """An existing directory that other users can write to is made private."""
+        os.mkdir(self.cache_dir)
+        os.chmod(self.cache_dir, 0o777)
+        self.assertIsNotNone(cache.get_cache_dir())
+        self.assertEqual(0o700, self.mode(self.cache_dir))
+
+    def test_load_source(self):
+        path = cache.get_cache_path('cached_module.py')
+        with open(path, 'w') as f:
+            f.write('value = 5\n')
+        cache.make_private(path)
+        self.assertEqual(5, cache.load_source('txsc_test_cached_module', path).value)
+        self.assertIsNone(cache.load_source('txsc_test_missing_module', cache.get_cache_path('missing.py')))
+
+    def test_untrusted_source(self):
+        """Modules that other users can write to are not loaded."""
+        path = cache.get_cache_path('shared_module.py')
+        with open(path, 'w') as f:
+            f.write('value = 5\n')
+        os.chmod(path, 0o666)
+        self.assertFalse(cache.is_trusted(path))
+        self.assertIsNone(cache.load_source('txsc_test_shared_module', path))
+
+        cache.make_private(path)
+        os.chmod(os.path.dirname(path), 0o777)
+        self.assertIsNone(cache.load_source('txsc_test_shared_module', path))
+
+class TableCacheTest(BaseCacheTest):
+    def setUp(self):
+        super(TableCacheTest, self).setUp()
+        self.table_modules = dict(parsing._table_modules)
+        parsing._table_modules.clear()
+
+    def tearDown(self):
+        parsing._table_modules.clear()
+        parsing._table_modules.update(self.table_modules)
+        super(TableCacheTest, self).tearDown()
+
+    def table_files(self):
+        return sorted(i for i in os.listdir(cache.get_cache_dir()) if i.endswith('.py'))
+
+    def test_tables_written(self):
+        ScriptParser()
+        files = self.table_files()
+        self.assertEqual(['lextab', 'parsetab'], sorted(i.split('_')[0] for i in files))
+        for filename in files:
+            self.assertTrue(cache.is_trusted(cache.get_cache_path(filename)))
+
+    def test_tables_loaded(self):
+        ScriptParser()
+        parsing._table_modules.clear()
+        parser = ScriptParser()
+        self.assertEqual(2, len(parsing._table_modules))
+        self.assertEqual(1, len(parser.parse('5;').body))
+
+    def test_untrusted_tables(self):
+        """Tables that other users can write to are regenerated."""
+        ScriptParser()
+        parsing._table_modules.clear()
+        for filename in self.table_files():
+            os.chmod(cache.get_cache_path(filename), 0o666)
+        parser = ScriptParser()
+        self.assertEqual(1, len(parser.parse('5;').body))
+        for filename in self.table_files():
+            self.assertTrue(cache.is_trusted(cache.get_cache_path(filename)))
+
+    def test_invalidation(self):
+        """Table keys change when the files that define a grammar change."""
+        path = os.path.join(self.directory, 'grammar.py')
+        module = type('Module', (object,), {'__file__': path})
+        with open(path, 'w') as f:
+            f.write('tokens = ()\n')
+        key = parsing.get_table_key('test_grammar', [module])
+        self.assertEqual(key, parsing.get_table_key('test_grammar', [module]))
+
+        with open(path, 'w') as f:
+            f.write('tokens = ("NAME",)\n')
+        parsing._table_keys.pop('test_grammar')
+        self.assertNotEqual(key, parsing.get_table_key('test_grammar', [module]))
+        parsing._table_keys.pop('test_grammar')
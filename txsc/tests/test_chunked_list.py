@@ -0,0 +1,91 @@
+import random
+import unittest
+
+from txsc.ir.chunked_list import ChunkedList
+from txsc.ir.instructions import LInstructions, ChunkedLInstructions
+from txsc.ir.linear_optimizer import PeepholeOptimizer
+import txsc.ir.linear_nodes as types
+
+class SmallChunkedList(ChunkedList):
+    CHUNK_SIZE = 4
+
+class ChunkedListTest(unittest.TestCase):
+    def test_edits(self):
+        rng = random.Random(0)
+        expected = range(30)
+        items = SmallChunkedList(expected)
+        for i in range(500):
+            start = rng.randrange(len(expected) + 1)
+            end = rng.randrange(start, min(len(expected), start + 10) + 1)
+            values = [rng.randrange(1000) for _ in range(rng.randrange(12))]
+            if i % 5 == 0 and expected:
+                idx = rng.randrange(-len(expected), len(expected))
+                self.assertEqual(expected.pop(idx), items.pop(idx))
+            elif i % 5 == 1:
+                expected.insert(start, i)
+                items.insert(start, i)
+            else:
+                expected[start:end] = values
+                items[start:end] = values
+            self.assertEqual(len(expected), len(items))
+            self.assertEqual(expected, list(items))
+            if expected:
+                idx = rng.randrange(-len(expected), len(expected))
+                self.assertEqual(expected[idx], items[idx])
+                self.assertEqual(expected[idx:idx + 7], items[idx:idx + 7])
+
+    def test_slices(self):
+        """Slice indices are clamped like those of list slices."""
+        items = SmallChunkedList([1, 2, 3])
+        self.assertEqual([1, 2], items[-5:2])
+        self.assertEqual([1, 2], items[-5:-1])
+        self.assertEqual([2, 3], items[-2:])
+        self.assertEqual([], items[5:])
+        self.assertEqual([], items[2:1])
+        self.assertEqual([1, 2], items[slice(-5, -1, 1)])
+        # The items span several chunks.
+        items = SmallChunkedList(range(10))
+        self.assertEqual([0, 1, 2, 3, 4, 5], items[-15:-4])
+        self.assertEqual([3, 4, 5, 6], items[3:-3])
+        def delete(i, j):
+            def edit(items):
+                del items[i:j]
+            return edit
+        def assign(i, j, values):
+            def edit(items):
+                items[i:j] = values
+            return edit
+        for edit, expected in [
+            (delete(-15, -4), [6, 7, 8, 9]),
+            (delete(-3, None), [0, 1, 2, 3, 4, 5, 6]),
+            (lambda items: items.__delitem__(slice(-15, -4, 1)), [6, 7, 8, 9]),
+            (assign(-15, 1, ['a']), ['a', 1, 2, 3, 4, 5, 6, 7, 8, 9]),
+            (assign(None, -15, ['a']), ['a', 0, 1, 2, 3, 4, 5, 6, 7, 8, 9]),
+            (assign(15, None, ['a']), [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 'a']),
+            (assign(6, 2, ['a', 'b']), [0, 1, 2, 3, 4, 5, 'a', 'b', 6, 7, 8, 9]),
+            (lambda items: items.insert(-15, 'a'), ['a', 0, 1, 2, 3, 4, 5, 6, 7, 8, 9]),
+            (lambda items: items.insert(-2, 'a'), [0, 1, 2, 3, 4, 5, 6, 7, 'a', 8, 9]),
+        ]:
+            items = SmallChunkedList(range(10))
+            edit(items)
+            self.assertEqual(expected, list(items))
+
+    def test_empty(self):
+        items = SmallChunkedList()
+        self.assertRaises(IndexError, items.pop)
+        items.extend([1, 2, 3])
+        del items[:]
+        self.assertEqual([], list(items))
+        items.append(4)
+        self.assertEqual([4], items)
+
+class ChunkedInstructionsTest(unittest.TestCase):
+    def test_optimize(self):
+        ops = [types.Five(), types.Six()] + [types.Swap() for _ in range(10)] + [types.Add(), types.Verify()]
+        script = [op.__class__() for _ in range(60) for op in ops] + [types.Return()]
+        expected = LInstructions(script)
+        instructions = ChunkedLInstructions(LInstructions(script))
+        PeepholeOptimizer().optimize(expected)
+        PeepholeOptimizer().optimize(instructions)
+        self.assertEqual(str(expected), str(instructions))
+        self.assertEqual(expected, instructions)
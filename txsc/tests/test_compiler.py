@@ -32,8 +32,12 @@ class CompileTxScriptTest(BaseCompilerTest):
 
     def test_duplicated_assumptions(self):
         for test in [
-            Test('5 2 ROLL DUP ADD', ['assume a, b;', '5;', 'a + a;']),
+            Test('5 ROT DUP ADD', ['assume a, b;', '5;', 'a + a;']),
             Test('5 SWAP DUP ADD', ['assume a, b;', '5;', 'b + b;']),
+            # The first statement is shortened by the peephole optimizer before duplicates are found.
+            Test('3 PICK DUP DUP ADD 4 PICK 2 SUB SUB 4 ROLL 3 ROLL 1ADD ADD SUB EQUALVERIFY OVER DUP ADD SUB ADD 1 EQUALVERIFY',
+                 ['assume a, b, c, d;', 'verify a == (((a + a) - (b - 2)) - (b + (1 + d)));',
+                  'verify (a + (c - (a + a))) == 1;']),
         ]:
             self._test(test)
 
@@ -71,7 +75,7 @@ class CompileTxScriptTest(BaseCompilerTest):
     def test_stack_state_scope(self):
         for test in [
             Test('SWAP DUP ADD', ['assume a, b;', 'a + a;']),
-            Test('OVER DUP ADD 2 ROLL 2 ROLL ADD', ['assume a, b;', 'a + a;', 'a + b;']),
+            Test('OVER DUP ADD ROT ROT ADD', ['assume a, b;', 'a + a;', 'a + b;']),
         ]:
             self._test(test)
 
@@ -115,8 +119,8 @@ class CompileTxScriptConditionalTest(BaseCompilerTest):
 
     def test_nested_conditional(self):
         for test in [
-            Test('2 ROLL IF IF 5 ENDIF ENDIF', ['assume a, b, c;', 'if a { if c {5;} }'],),
-            Test('2 ROLL IF IF 5 ELSE 6 ENDIF ENDIF', ['assume a, b, c;', 'if a { if c {5;} else {6;} }'],),
+            Test('ROT IF IF 5 ENDIF ENDIF', ['assume a, b, c;', 'if a { if c {5;} }'],),
+            Test('ROT IF IF 5 ELSE 6 ENDIF ENDIF', ['assume a, b, c;', 'if a { if c {5;} else {6;} }'],),
         ]:
             self._test(test)
 
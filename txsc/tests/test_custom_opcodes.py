@@ -1,8 +1,13 @@
+import os
+import tempfile
 import unittest
 
+from txsc import config
 from txsc.ir import linear_nodes as lir
+from txsc.ir import linear_optimizer
 from txsc.ir import structural_nodes as sir
-from txsc.ir.instructions import SInstructions
+from txsc.ir.instructions import LInstructions, SInstructions
+from txsc.ir.linear_optimizer import PeepholeOptimizer
 from txsc.ir.structural_visitor import StructuralVisitor
 
 
@@ -23,6 +28,23 @@ class CustomOpcodeTest(unittest.TestCase):
     def _linearize(self, structural):
         return StructuralVisitor().transform(SInstructions(structural))
 
+    def test_not_interned(self):
+        """Opcodes from other modules are only interned if they opt in."""
+        class Bar(lir.Add):
+            name = 'OP_BAR'
+        class Baz(lir.OpCode):
+            name = 'OP_BAZ'
+            interned = True
+        for cls in [Foo, Bar]:
+            self.assertFalse(cls.interned)
+            op = cls(delta=-2)
+            self.assertEqual(-2, op.delta)
+            op.idx = 1
+            self.assertEqual(-1, cls().idx)
+        self.assertTrue(lir.Add.interned)
+        self.assertIs(Baz(), Baz())
+        self.assertRaises(TypeError, Baz, delta=0)
+
     def test_op(self):
         op = sir.OpCode(name='OP_FOO')
         op.lineno = 0
@@ -32,3 +54,61 @@ class CustomOpcodeTest(unittest.TestCase):
 
         ops = self._linearize(s)
         self.assertEqual("['OP_FOO', 'OP_1']", str(ops))
+
+class FooVerify(lir.OpCode):
+    name = 'OP_FOOVERIFY'
+    delta = -1
+
+class PeepholeRuleTableTest(unittest.TestCase):
+    def setUp(self):
+        ops = lir.get_default_opcodes()
+        ops.update({Foo.name: Foo, FooVerify.name: FooVerify})
+        config.opcode_sets['foo'] = ops
+
+    def tearDown(self):
+        del config.opcode_sets['foo']
+        config.opcode_set_rule_files.pop('foo', None)
+        config.peephole_matchers.pop('foo', None)
+        config.set_opcode_set('default')
+
+    def _optimize(self, ops):
+        instructions = LInstructions(ops)
+        PeepholeOptimizer().optimize(instructions)
+        return str(instructions)
+
+    def test_per_opcode_set(self):
+        config.set_opcode_set('default')
+        default_matcher = linear_optimizer.get_peephole_matcher()
+        self.assertEqual("['OP_FOO', 'OP_VERIFY', 'OP_DUP']", self._optimize([Foo(), lir.Verify(), lir.Dup()]))
+
+        config.set_opcode_set('foo')
+        self.assertIsNot(default_matcher, linear_optimizer.get_peephole_matcher())
+        self.assertEqual("['OP_FOOVERIFY', 'OP_DUP']", self._optimize([Foo(), lir.Verify(), lir.Dup()]))
+
+        # Tables are built once per opcode set.
+        config.set_opcode_set('default')
+        self.assertIs(default_matcher, linear_optimizer.get_peephole_matcher())
+
+    def test_rule_files(self):
+        fd, path = tempfile.mkstemp(suffix='.rules')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w') as f:
+            f.write('[merge_foos]\nOP_FOO OP_FOO -> OP_FOO\n')
+        config.opcode_set_rule_files['foo'] = [path]
+
+        config.set_opcode_set('default')
+        self.assertEqual("['OP_FOO', 'OP_FOO']", self._optimize([Foo(), Foo()]))
+        config.set_opcode_set('foo')
+        self.assertEqual("['OP_FOO']", self._optimize([Foo(), Foo(), Foo()]))
+
+    def test_fresh_replacements(self):
+        config.set_opcode_set('default')
+        first = LInstructions([lir.Drop(), lir.Drop()])
+        second = LInstructions([lir.Drop(), lir.Drop()])
+        for instructions in [first, second]:
+            PeepholeOptimizer().optimize(instructions)
+        self.assertEqual("['OP_2DROP']", str(first))
+        # Interned opcodes are shared, but other replacement nodes are not.
+        self.assertIs(first[0], second[0])
+        callback = linear_optimizer.replace_with([lir.Pick()])
+        self.assertIsNot(callback([])[0], callback([])[0])
@@ -0,0 +1,46 @@
+import random
+import unittest
+
+from txsc.ir.delta_index import DeltaIndex, FenwickTree
+
+class FenwickTreeTest(unittest.TestCase):
+    def test_prefix_sums(self):
+        values = [3, 1, 0, 4, 1, 5, 9, 2, 6]
+        tree = FenwickTree(values)
+        for i in range(len(values) + 1):
+            self.assertEqual(sum(values[:i]), tree.prefix_sum(i))
+        tree.add(2, 7)
+        values[2] += 7
+        self.assertEqual([sum(values[:i]) for i in range(len(values) + 1)],
+                         [tree.prefix_sum(i) for i in range(len(values) + 1)])
+        # search() finds the largest prefix whose sum is at most a value.
+        self.assertEqual(0, tree.search(2))
+        self.assertEqual(1, tree.search(3))
+        self.assertEqual(3, tree.search(11))
+        self.assertEqual(len(values), tree.search(1000))
+
+class SmallDeltaIndex(DeltaIndex):
+    BLOCK_SIZE = 4
+
+class DeltaIndexTest(unittest.TestCase):
+    def test_edits(self):
+        rng = random.Random(0)
+        choices = [-2, -1, -1, 0, 1, 1, None]
+        expected = [rng.choice(choices) for _ in range(100)]
+        index = SmallDeltaIndex(expected)
+        for _ in range(500):
+            start = rng.randrange(len(expected) + 1)
+            end = rng.randrange(start, min(len(expected), start + 12) + 1)
+            values = [rng.choice(choices) for _ in range(rng.randrange(12))]
+            expected[start:end] = values
+            index.replace(start, end, values)
+            if expected and rng.random() < 0.3:
+                idx = rng.randrange(len(expected))
+                expected[idx] = index[idx] = rng.choice(choices)
+
+            self.assertEqual(len(expected), len(index))
+            start = rng.randrange(len(expected) + 1)
+            end = rng.randrange(len(expected) + 2)
+            deltas = expected[start:end]
+            self.assertEqual(None if None in deltas else sum(deltas), index.sum(start, end))
+        self.assertEqual(expected, [index[i] for i in range(len(expected))])
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from txsc import entry_points
+
+class EntryPointTest(unittest.TestCase):
+    def test_load(self):
+        entry_point = entry_points.EntryPoint('linear', 'txsc.ir.linear_optimizer:LinearOptimizer')
+        from txsc.ir.linear_optimizer import LinearOptimizer
+        self.assertIs(LinearOptimizer, entry_point.load())
+
+    def test_load_module(self):
+        entry_point = entry_points.EntryPoint('cache', 'txsc.cache')
+        from txsc import cache
+        self.assertIs(cache, entry_point.load())
+
+class IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, entry_points.INDEX_FILENAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        found = {'txsc.language': [['foo', 'foo.lang:FooLanguage']]}
+        entry_points.save_index(self.path, 'abc', found)
+        self.assertEqual(found, entry_points.load_index(self.path, 'abc'))
+
+    def test_stale_fingerprint(self):
+        entry_points.save_index(self.path, 'abc', {})
+        self.assertIsNone(entry_points.load_index(self.path, 'def'))
+
+    def test_missing_or_corrupt(self):
+        self.assertIsNone(entry_points.load_index(self.path, 'abc'))
+        with open(self.path, 'w') as f:
+            f.write('{')
+        self.assertIsNone(entry_points.load_index(self.path, 'abc'))
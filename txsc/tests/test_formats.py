@@ -0,0 +1,57 @@
+import unittest
+
+from txsc.ir import formats
+
+class IntFormatTest(unittest.TestCase):
+    def test_int_to_bytearray(self):
+        for value, expected in [
+            (0, ''),
+            (1, '51'),
+            (16, '60'),
+            (17, '11'),
+            (-1, '81'),
+            (127, '7f'),
+            (128, '0080'),
+            (-128, '8080'),
+            (255, '00ff'),
+            (256, '0100'),
+            (0x7fffffff, '7fffffff'),
+        ]:
+            self.assertEqual(expected, formats.int_to_bytearray(value).encode('hex'))
+
+    def test_int_to_bytearray_not_opcode(self):
+        self.assertEqual('', formats.int_to_bytearray(0, as_opcode=False))
+        self.assertEqual('01', formats.int_to_bytearray(1, as_opcode=False).encode('hex'))
+        self.assertEqual('10', formats.int_to_bytearray(16, as_opcode=False).encode('hex'))
+
+    def test_bytearray_to_int(self):
+        for data, expected in [
+            ('', 0),
+            ('00', 0),
+            ('51', 1),
+            ('60', 16),
+            ('61', 97),
+            ('81', -1),
+            ('0080', 128),
+            ('8080', -128),
+            ('0100', 256),
+        ]:
+            self.assertEqual(expected, formats.bytearray_to_int(data.decode('hex')))
+        self.assertEqual(0x51, formats.bytearray_to_int('\x51', decode_small_int=False))
+
+    def test_round_trip(self):
+        for value in range(-1000, 1000) + [2 ** 31 - 1, -2 ** 31, 2 ** 40]:
+            data = formats.int_to_bytearray(value, as_opcode=False)
+            self.assertEqual(value, formats.bytearray_to_int(data, decode_small_int=False))
+
+    def test_bytearray_to_bool(self):
+        for data, expected in [
+            ('', False),
+            ('00', False),
+            ('0000', False),
+            ('80', False),
+            ('0080', False),
+            ('8000', True),
+            ('01', True),
+        ]:
+            self.assertEqual(expected, formats.bytearray_to_bool(data.decode('hex')))
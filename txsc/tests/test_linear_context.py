@@ -1,3 +1,4 @@
+import random
 import unittest
 
 from txsc.symbols import SymbolTable
@@ -35,6 +36,19 @@ class TestIfDup(BaseContextTest):
             self.assertIsInstance(ifdup, types.IfDup)
             self.assertEqual(expected_delta, ifdup.delta)
 
+    def test_unknown_delta(self):
+        symbol_table = SymbolTable()
+        symbol_table.add_stack_assumptions(['a'])
+        self.contextualizer = LinearContextualizer(symbol_table)
+        script = LInstructions([types.Assumption('a'), types.IfDup(), types.Five(), types.Assumption('a')])
+        self._do_context(script)
+        self.assertEqual(1, self.contextualizer.total_delta(1))
+        self.assertRaises(IRError, self.contextualizer.total_delta, 3)
+        # Deltas are known once the argument is.
+        script.replace_slice(0, 1, [types.Two()])
+        self._do_context(script)
+        self.assertEqual(4, self.contextualizer.total_delta(3))
+
     def test_push(self):
         script = LInstructions([types.One(), types.Push(formats.int_to_bytearray(20)), types.IfDup()])
         self._do_context(script)
@@ -91,3 +105,189 @@ class TestValidate(BaseContextTest):
         ]:
             script = LInstructions(script)
             self.assertRaises(IRError, self._do_context, script)
+
+class ChangeTrackingTest(BaseContextTest):
+    def test_dirty_range(self):
+        script = LInstructions([types.One(), types.Two(), types.Three(), types.Four()])
+        self.assertEqual((0, None), (script.modifications, script.dirty))
+        script.replace_slice(1, 2, [types.Five(), types.Six()])
+        self.assertEqual((1, (1, 3)), (script.modifications, script.dirty))
+        # Changes after the range shift it; changes before it extend it.
+        script.pop(-1)
+        self.assertEqual((1, 4), script.dirty)
+        script.insert(0, types.Seven())
+        self.assertEqual((0, 5), script.dirty)
+        script.mark_clean()
+        script[2] = types.Eight()
+        del script[3:]
+        self.assertEqual((5, (2, 3)), (script.modifications, script.dirty))
+        self.assertEqual("['OP_7', 'OP_1', 'OP_8']", str(script))
+
+    def _edit(self, edit):
+        script = LInstructions([types.One(), types.Two(), types.Three()])
+        edit(script)
+        return str(script), script.dirty
+
+    def test_slices(self):
+        """Slice indices are clamped like those of list slices."""
+        def delete(i, j):
+            def edit(script):
+                del script[i:j]
+            return edit
+        def assign(i, j):
+            def edit(script):
+                script[i:j] = [types.Dup()]
+            return edit
+        for edit, expected, dirty in [
+            (delete(-5, -1), ['OP_3'], (0, 0)),
+            (delete(-2, None), ['OP_1'], (1, 1)),
+            (delete(1, -1), ['OP_1', 'OP_3'], (1, 1)),
+            (delete(2, 1), ['OP_1', 'OP_2', 'OP_3'], None),
+            (assign(-5, 1), ['OP_DUP', 'OP_2', 'OP_3'], (0, 1)),
+            (assign(None, -5), ['OP_DUP', 'OP_1', 'OP_2', 'OP_3'], (0, 1)),
+            (assign(5, None), ['OP_1', 'OP_2', 'OP_3', 'OP_DUP'], (3, 4)),
+            (assign(2, 1), ['OP_1', 'OP_2', 'OP_DUP', 'OP_3'], (2, 3)),
+            (lambda script: script.__delitem__(slice(-5, -1, 1)), ['OP_3'], (0, 0)),
+            (lambda script: script.insert(-5, types.Dup()), ['OP_DUP', 'OP_1', 'OP_2', 'OP_3'], (0, 1)),
+            (lambda script: script.insert(-1, types.Dup()), ['OP_1', 'OP_2', 'OP_DUP', 'OP_3'], (2, 3)),
+        ]:
+            self.assertEqual((str(expected), dirty), self._edit(edit))
+
+    def test_unchanged(self):
+        script = LInstructions([types.Five(), types.Six(), types.Seven(), types.Two(), types.Pick()])
+        self._do_context(script)
+        script[4].args = None
+        self._do_context(script)
+        self.assertIsNone(script[4].args)
+        # Contextualization is done again once instructions change.
+        script.insert(0, types.One())
+        self._do_context(script)
+        self.assertEqual([1, 4], script[5].args)
+        self.assertEqual(5, script[5].idx)
+
+    def _state(self, contextualizer, script):
+        assumptions = dict((name, list(indices)) for name, indices in contextualizer.assumptions.items() if indices)
+        metadata = [(i, op.idx, getattr(op, 'args', None)) for i, op in enumerate(script) if isinstance(op, (types.Pick, types.Assumption))]
+        deltas = [contextualizer.deltas.sum(0, i) for i in range(len(script) + 1)]
+        return (assumptions, str(contextualizer.branches), metadata, deltas)
+
+    def test_incremental(self):
+        rng = random.Random(0)
+        hash_push = types.Push(b'\x01' * 20)
+        blocks = [[types.Assumption('a')], [types.Assumption('b')], [types.Two(), types.Pick()], [types.One(), types.IfDup()],
+                  [types.Five()], [types.Add()], [types.If(), types.Five(), types.Else(), types.Assumption('a'), types.EndIf()],
+                  [types.NotIf(), types.Assumption('b'), types.EndIf()], [types.EndIf()],
+                  [types.Hash160(), hash_push, types.EqualVerify()], [types.Push(b'\x01\x02')]]
+        make_ops = lambda: [op.__class__() if op.interned else types.copy_node(op) for block in rng.sample(blocks, 3) for op in block]
+        script = LInstructions(make_ops())
+        for _ in range(300):
+            start = rng.randrange(len(script) + 1)
+            end = rng.randrange(start, min(len(script), start + 4) + 1)
+            if rng.random() < 0.5:
+                script.replace_slice(start, end, make_ops()[:rng.randrange(4)])
+            else:
+                # Several edits between contextualizations.
+                script.insert(start, types.Assumption('b'))
+                del script[end:end + 2]
+                script.append(types.Four())
+
+            results = []
+            for contextualizer in [self.contextualizer, LinearContextualizer(SymbolTable())]:
+                try:
+                    contextualizer.contextualize(script)
+                    results.append(self._state(contextualizer, script))
+                except IRError:
+                    results.append(IRError)
+            self.assertEqual(results[1], results[0])
+
+class BranchIndexTest(BaseContextTest):
+    def setUp(self):
+        symbol_table = SymbolTable()
+        symbol_table.add_stack_assumptions(['a', 'b'])
+        self.contextualizer = LinearContextualizer(symbol_table)
+
+    def _random_ops(self, rng, depth=0):
+        ops = []
+        for _ in range(rng.randrange(1, 5)):
+            choice = rng.random()
+            if choice < 0.2 and depth < 4:
+                ops.append(rng.choice([types.If, types.NotIf])())
+                ops.extend(self._random_ops(rng, depth + 1))
+                if rng.random() < 0.5:
+                    ops.append(types.Else())
+                    ops.extend(self._random_ops(rng, depth + 1))
+                ops.append(types.EndIf())
+            elif choice < 0.5:
+                ops.append(types.Assumption(rng.choice('ab')))
+            else:
+                ops.append(rng.choice([types.Five(), types.Drop(), types.Add(), types.Verify()]))
+        return ops
+
+    def _total_delta(self, idx):
+        """Get the total delta before idx by summing the deltas of every branch."""
+        contextualizer = self.contextualizer
+        instructions, branches = contextualizer.instructions, contextualizer.branches
+        total = 2
+        if contextualizer.is_before_conditionals(idx):
+            return total + sum(i.delta for i in instructions[:idx])
+        idx_branch = None
+        for branch in branches:
+            if branch.is_in_branch(idx) and (not idx_branch or idx_branch.nest_level < branch.nest_level):
+                idx_branch = branch
+        total += sum(i.delta for i in instructions[:branches[0].start])
+        branch_deltas = {True: 0, False: 0}
+        for branch in branches:
+            if branch is idx_branch:
+                total += sum(i.delta for i in instructions[branch.start:idx])
+            elif branch.end < idx and (not idx_branch or branch is not idx_branch.orelse):
+                branch_deltas[branch.is_truebranch] += sum(i.delta for i in instructions[branch.start:branch.end])
+        if branch_deltas[True] != branch_deltas[False]:
+            return IRError
+        return total + branch_deltas[True]
+
+    def _following_occurrences(self, name, idx):
+        """Get the following occurrences of name by checking every branch."""
+        contextualizer = self.contextualizer
+        branches = contextualizer.branches
+        match_any_branch = contextualizer.is_before_conditionals(idx)
+        following = []
+        for assumption_idx in [i for i, op in enumerate(contextualizer.instructions) if isinstance(op, types.Assumption) and op.var_name == name]:
+            if assumption_idx <= idx:
+                continue
+            if not branches:
+                following.append(assumption_idx)
+                continue
+            for branch in branches:
+                if not match_any_branch and branch.is_in_branch(idx):
+                    continue
+                if branch.end > idx:
+                    following.append(assumption_idx)
+            if assumption_idx > branches[-1].end:
+                following.append(assumption_idx)
+        return following
+
+    def test_queries(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            script = LInstructions(self._random_ops(rng))
+            self._do_context(script)
+            for idx in range(len(script) + 1):
+                try:
+                    total_delta = self.contextualizer.total_delta(idx)
+                except IRError:
+                    total_delta = IRError
+                self.assertEqual(self._total_delta(idx), total_delta)
+                for name in 'ab':
+                    self.assertEqual(self._following_occurrences(name, idx), self.contextualizer.following_occurrences(name, idx))
+
+    def test_innermost_branch(self):
+        script = LInstructions([types.If(), types.Five(), types.If(), types.Six(), types.EndIf(),
+                                types.Else(), types.NotIf(), types.Seven(), types.EndIf(), types.EndIf()])
+        self._do_context(script)
+        outer, inner, orelse, nested = self.contextualizer.branches
+        self.assertEqual([inner], outer.children)
+        self.assertIs(orelse, outer.orelse)
+        self.assertEqual([outer, orelse], self.contextualizer.branch_index.roots)
+        index = self.contextualizer.branch_index
+        self.assertEqual([None, outer, outer, inner, outer, None, orelse, nested, orelse, None],
+                         [index.innermost(i) for i in range(len(script))])
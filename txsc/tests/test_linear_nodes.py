@@ -0,0 +1,31 @@
+import copy
+import unittest
+
+import txsc.ir.linear_nodes as types
+
+class InterningTest(unittest.TestCase):
+    def test_interned(self):
+        self.assertIs(types.Dup(), types.Dup())
+        self.assertIs(types.Five(), types.small_int_opcode(5)())
+        self.assertIs(types.Add(), copy.copy(types.Add()))
+        self.assertIs(types.Add(), copy.deepcopy(types.Add()))
+        self.assertRaises(TypeError, types.Add, delta=0)
+        self.assertRaises(AttributeError, setattr, types.Add(), 'idx', 0)
+
+    def test_not_interned(self):
+        # These opcodes hold metadata that contextualization determines.
+        for cls in [types.Pick, types.Roll, types.IfDup, types.CheckMultiSig, types.CheckMultiSigVerify]:
+            self.assertIsNot(cls(), cls())
+            self.assertEqual(cls(), cls())
+        push = types.Push(b'\x01')
+        self.assertIsNot(push, types.Push(b'\x01'))
+        self.assertRaises(AttributeError, setattr, push, 'foo', 0)
+
+    def test_equality(self):
+        self.assertEqual(types.Push(b'\x01'), types.Push(b'\x01'))
+        self.assertNotEqual(types.Push(b'\x01'), types.Push(b'\x02'))
+        self.assertEqual(types.Assumption('a'), types.Assumption('a'))
+        self.assertNotEqual(types.Assumption('a'), types.Assumption('b'))
+        self.assertNotEqual(types.Zero(), types.False_())
+        self.assertNotEqual(types.Add(), types.Push(b'\x01'))
+        self.assertNotEqual(types.Add(), None)
@@ -3,6 +3,10 @@ import unittest
 from txsc.symbols import SymbolTable
 from txsc.ir.instructions import LInstructions
 from txsc.ir.linear_optimizer import LinearOptimizer
+from txsc.ir.linear_visitor import StackState
+from txsc.ir.peephole_matcher import PeepholeMatcher, PeepholeRule
+from txsc.ir.peephole_rules import PeepholeRuleError, parse_rules
+from txsc.ir import stack_superoptimizer
 import txsc.ir.linear_nodes as types
 
 class BaseOptimizationTest(unittest.TestCase):
@@ -121,6 +125,11 @@ class OptimizationTest(BaseOptimizationTest):
         script = [types.Push(b'\x05')]
         self._do_test('OP_5', script)
 
+    def test_fixed_point(self):
+        # Each OP_SWAP is only removable once the one after it is removed.
+        script = [types.Five(), types.Six()] + [types.Swap() for _ in range(10)] + [types.Add()]
+        self._do_test('OP_5 OP_6 OP_ADD', script)
+
 class InlineTest(BaseOptimizationTest):
     def setUp(self):
         super(InlineTest, self).setUp()
@@ -141,9 +150,183 @@ class InlineTest(BaseOptimizationTest):
 
         self._reset_table(['testItem'])
         script = [types.Five(), types.Five(), types.Assumption('testItem'), types.Add()]
-        self._do_test('OP_5 OP_5 OP_2 OP_ROLL OP_ADD', script)
+        self._do_test('OP_5 OP_5 OP_ROT OP_ADD', script)
 
         self._reset_table(['testItem'])
         script = [types.Five(), types.Five(), types.Assumption('testItem'), types.Add(), types.Assumption('testItem')]
-        self._do_test('OP_5 OP_5 OP_2 OP_PICK OP_ADD OP_2 OP_ROLL', script)
+        self._do_test('OP_5 OP_5 OP_2 OP_PICK OP_ADD OP_ROT', script)
+
+    def test_assume_after_stack_ops(self):
+        """Assumptions are inlined after opcodes that the stack superoptimizer emits."""
+        script = [types.Five(), types.Six(), types.Tuck(), types.Assumption('testItem'), types.Add()]
+        self._do_test('OP_5 OP_6 OP_TUCK OP_3 OP_ROLL OP_ADD', script)
 
+        self._reset_table(['testItem'])
+        script = [types.One(), types.Two(), types.Three(), types.Four(), types.Five(), types.Six(), types.TwoRot(),
+                  types.Assumption('testItem'), types.Add()]
+        self._do_test('OP_1 OP_2 OP_3 OP_4 OP_5 OP_6 OP_2ROT OP_6 OP_ROLL OP_ADD', script)
+
+    def test_single_pass(self):
+        """Each instruction is applied to the stack model once."""
+        names = ['item%d' % i for i in range(20)]
+        self._reset_table(names)
+        script = []
+        for a, b in zip(names[::2], names[1::2]):
+            script.extend([types.Assumption(a), types.Assumption(b), types.Add(), types.Five(), types.EqualVerify()])
+        processed = []
+        original = StackState.process_instruction
+        def process_instruction(stack, op):
+            processed.append(op)
+            return original(stack, op)
+        StackState.process_instruction = process_instruction
+        try:
+            instructions = LInstructions(script)
+            LinearOptimizer(self.symbol_table).optimize(instructions)
+        finally:
+            StackState.process_instruction = original
+        self.assertFalse(any(isinstance(op, types.Assumption) for op in instructions))
+        self.assertLessEqual(len(processed), 2 * len(script))
+
+
+class PeepholeMatcherTest(unittest.TestCase):
+    def test_priority(self):
+        rules = [
+            PeepholeRule([types.One(), types.Roll(), types.One(), types.Roll()], lambda values: []),
+            PeepholeRule([types.One(), types.Roll()], lambda values: [types.Swap()]),
+        ]
+        matcher = PeepholeMatcher(rules)
+        script = LInstructions([types.One(), types.Roll(), types.One(), types.Roll(), types.One(), types.Roll()])
+        self.assertEqual((0, rules[0]), matcher.best_match(script, 0))
+        self.assertEqual((1, rules[1]), matcher.best_match(script, 4))
+        matcher.apply(script)
+        self.assertEqual("['OP_SWAP']", str(script))
+
+    def test_overlapping_priority(self):
+        # OP_2 OP_DIV is replaced before OP_5 OP_2 is, since its rule comes first.
+        rules = [
+            PeepholeRule([types.Two(), types.Div()], lambda values: [types.Div2()]),
+            PeepholeRule([types.Five(), types.Two()], lambda values: [types.Seven()]),
+        ]
+        script = LInstructions([types.Five(), types.Two(), types.Div()])
+        PeepholeMatcher(rules).apply(script)
+        self.assertEqual("['OP_5', 'OP_2DIV']", str(script))
+
+    def test_wildcards(self):
+        rules = [
+            PeepholeRule([types.Dup(), None, types.CheckSig()], lambda values: values[1:]),
+            PeepholeRule([types.Push(), types.SmallIntOpCode(), types.Add()], lambda values: [values[1]], strict=False),
+        ]
+        matcher = PeepholeMatcher(rules)
+        script = LInstructions([types.Dup(), types.Assumption('a'), types.CheckSig(), types.Push(b'\x11'), types.Three(), types.Add()])
+        matcher.apply(script)
+        self.assertEqual("['assume(a)', 'OP_CHECKSIG', 'OP_3']", str(script))
+        # Strict templates compare values.
+        matcher = PeepholeMatcher([PeepholeRule([types.Push(b'\x11')], lambda values: [])])
+        script = LInstructions([types.Push(b'\x12'), types.Push(b'\x11')])
+        matcher.apply(script)
+        self.assertEqual("['12']", str(script))
+
+    def test_cycle(self):
+        rules = [
+            PeepholeRule([types.Dup()], lambda values: [types.Over()]),
+            PeepholeRule([types.Over()], lambda values: [types.Dup()]),
+        ]
+        script = LInstructions([types.Dup()])
+        self.assertEqual(10, PeepholeMatcher(rules).apply(script, max_rewrites=10))
+
+    def test_unchanged_blocks(self):
+        # A rule that leaves its block unchanged does not prevent others from applying.
+        rules = [
+            PeepholeRule([types.Push(), types.Add()], lambda values: values, strict=False),
+            PeepholeRule([types.Push(), types.Add()], lambda values: [types.Add1()], strict=False),
+        ]
+        script = LInstructions([types.Push(b'\x01'), types.Add()])
+        self.assertEqual(1, PeepholeMatcher(rules).apply(script))
+        self.assertEqual("['OP_1ADD']", str(script))
+
+    def test_original_nodes(self):
+        # Callbacks get the matching nodes themselves, and repeated nodes are copied.
+        push = types.Push(b'\x01' * 100)
+        rules = [PeepholeRule([types.Push(), types.Dup()], lambda values: [values[0], values[0]], strict=False)]
+        script = LInstructions([push, types.Dup()])
+        PeepholeMatcher(rules).apply(script)
+        self.assertIs(push, script[0])
+        self.assertIsNot(push, script[1])
+        self.assertIs(push.data, script[1].data)
+
+    def test_value_templates(self):
+        # Templates with items that compare by value are confirmed.
+        rules = [PeepholeRule([types.Push(b'\x01'), types.Add()], lambda values: [types.Add1()])]
+        script = LInstructions([types.Push(b'\x02'), types.Add(), types.Push(b'\x01'), types.Add()])
+        self.assertEqual(1, PeepholeMatcher(rules).apply(script))
+        self.assertEqual("['02', 'OP_ADD', 'OP_1ADD']", str(script))
+
+class PeepholeRuleFileTest(unittest.TestCase):
+    def _apply(self, text, ops):
+        rules = []
+        for rule_set in parse_rules(text):
+            rules.extend(rule_set())
+        script = LInstructions(ops)
+        PeepholeMatcher(rules).apply(script)
+        return str(script)
+
+    def test_parse(self):
+        rule_set, = parse_rules('[foo]\n# Does foo.\n$a:push OP_SWAP $b OP_ADD -> $b $a OP_ADD if strict_nums($a)\n')
+        self.assertEqual('foo', rule_set.__name__)
+        self.assertEqual('Does foo.', rule_set.__doc__)
+        rule, = rule_set.rules
+        self.assertEqual('$a:push OP_SWAP $b OP_ADD', rule.before)
+        self.assertEqual('$b $a OP_ADD', rule.after)
+        self.assertEqual(-1, rule.cost_delta)
+        self.assertFalse(rule.strict)
+
+    def test_errors(self):
+        for text in [
+            'OP_DUP -> OP_DUP',
+            '[foo]\nOP_DUP OP_DROP',
+            '[foo]\nOP_DUP -> OP_DUP OP_DUP',
+            '[foo]\nOP_DUP -> $a',
+            '[foo]\n$a $a OP_ADD -> $a',
+            '[foo]\n$a:foo OP_ADD -> $a',
+            '[foo]\n$a OP_ADD -> foo($a)',
+            '[foo]\n$a OP_ADD -> $a if foo($a)',
+        ]:
+            self.assertRaises(PeepholeRuleError, parse_rules, text)
+
+    def test_rules(self):
+        text = '\n'.join([
+            '[foo]',
+            '$a OP_0 OP_ADD -> $a',
+            '$a:push $b:push OP_EQUAL OP_NOT -> $a $b OP_NUMNOTEQUAL if strict_nums($a, $b)',
+            '$a:push -> small_int($a)',
+            'OP_DROP OP_FOO -> _',
+        ])
+        self.assertEqual("['OP_5']", self._apply(text, [types.Push(b'\x05'), types.Zero(), types.Add()]))
+        self.assertEqual("['11', '12', 'OP_NUMNOTEQUAL']", self._apply(text, [types.Push(b'\x11'), types.Push(b'\x12'), types.Equal(), types.Not()]))
+        # Guards and transforms can prevent rewrites.
+        self.assertEqual("['1111', 'OP_DUP', 'OP_EQUAL', 'OP_NOT']", self._apply(text, [types.Push(b'\x11' * 2), types.Dup(), types.Equal(), types.Not()]))
+        # Rules with opcodes that are not in the opcode set are ignored.
+        self.assertEqual("['OP_DROP']", self._apply(text, [types.Drop()]))
+
+class StackSuperoptimizerTest(unittest.TestCase):
+    def _do_test(self, expected, ops_list):
+        script = LInstructions(ops_list)
+        stack_superoptimizer.get_superoptimizer().optimize(script)
+        self.assertEqual(str(expected.split(' ')), str(script))
+
+    def test_search(self):
+        table = stack_superoptimizer.build_table(2, 4)
+        # OP_OVER OP_OVER -> OP_2DUP
+        self.assertEqual('OP_2DUP', table['sequences']['2:1,0,1,0'])
+        # OP_SWAP OP_DROP -> OP_NIP
+        self.assertEqual('OP_NIP', table['sequences']['2:0'])
+
+    def test_optimize(self):
+        self._do_test('OP_5 OP_NIP OP_ADD', [types.Five(), types.Swap(), types.Drop(), types.Add()])
+        self._do_test('OP_ROT OP_DUP', [types.Two(), types.Roll(), types.Dup()])
+        self._do_test('OP_2DUP OP_2DUP', [types.Over(), types.Over(), types.Over(), types.Over()])
+        self._do_test('OP_2DROP', [types.Swap(), types.Drop(), types.Drop()])
+
+    def test_required_items(self):
+        # Sequences are not replaced by sequences that require fewer items.
+        self._do_test('OP_DUP OP_DROP', [types.Dup(), types.Drop()])
@@ -0,0 +1,67 @@
+import random
+import unittest
+
+from txsc.symbols import SymbolTable
+from txsc.ir.linear_visitor import StackItem, StackState, StateScope
+import txsc.ir.linear_nodes as types
+
+class StateScopeTest(unittest.TestCase):
+    def test_edits(self):
+        rng = random.Random(0)
+        items = [StackItem(types.Push(chr(i))) for i in range(10)]
+        expected = [rng.choice(items) for _ in range(20)]
+        scope = StateScope(state=expected)
+        for i in range(300):
+            edit = rng.randrange(5)
+            if edit == 0 or not expected:
+                item = rng.choice(items)
+                expected.append(item)
+                scope.append(item)
+            elif edit == 1:
+                idx = rng.randrange(-len(expected), len(expected))
+                self.assertEqual(expected.pop(idx), scope.pop(idx))
+            elif edit == 2:
+                idx = rng.randrange(-len(expected), len(expected))
+                item = rng.choice(items)
+                expected[idx] = item
+                scope[idx] = item
+            elif edit == 3:
+                idx = rng.randrange(len(expected) + 1)
+                item = rng.choice(items)
+                expected.insert(idx, item)
+                scope.insert(idx, item)
+            else:
+                count = rng.randrange(len(expected) + 1)
+                taken = scope.take(count)
+                self.assertEqual(expected[len(expected) - count:], taken)
+                scope.extend(taken)
+            self.assertEqual(expected, list(scope))
+            self.assertEqual(len(expected), len(scope))
+            if expected:
+                idx = rng.randrange(-len(expected), len(expected))
+                self.assertEqual(expected[idx], scope[idx])
+                self.assertEqual(expected.index(expected[idx]), scope.index(expected[idx]))
+
+    def test_copy(self):
+        scope = StateScope(state=[StackItem(types.Push(b'\x01')), StackItem(types.Push(b'\x02'))])
+        other = StateScope.copy(scope)
+        self.assertIs(scope.top, other.top)
+        other.append(StackItem(types.Push(b'\x03')))
+        other[0] = StackItem(types.Push(b'\x04'))
+        self.assertEqual([b'\x01', b'\x02'], [item.op.data for item in scope])
+        self.assertEqual([b'\x04', b'\x02', b'\x03'], [item.op.data for item in other])
+
+class StackStateTest(unittest.TestCase):
+    def test_scopes(self):
+        symbol_table = SymbolTable()
+        symbol_table.add_stack_assumptions(['a', 'b'])
+        stack = StackState(symbol_table)
+        stack.add_stack_assumptions([types.Assumption('a'), types.Assumption('b')])
+        stack.process_instructions([types.Five(), types.If(), types.Swap(), types.Six()])
+        self.assertEqual(['assume(a)', 'OP_5', 'assume(b)', 'OP_6'], map(str, stack.state))
+        # The scope before the conditional is unchanged.
+        stack.process_instruction(types.Else())
+        self.assertEqual(['assume(a)', 'assume(b)', 'OP_5'], map(str, stack.state))
+        stack.process_instruction(types.EndIf())
+        self.assertEqual(['assume(a)', 'assume(b)', 'OP_5'], map(str, stack.state))
+        self.assertEqual(1, symbol_table.lookup('a').value.depth)
@@ -0,0 +1,77 @@
+import random
+import unittest
+
+from txsc.ir.instructions import LInstructions, PackedLInstructions
+from txsc.ir.linear_optimizer import PeepholeOptimizer
+from txsc.ir.packed_list import PackedList
+import txsc.ir.linear_nodes as types
+
+class PackedListTest(unittest.TestCase):
+    def test_conversion(self):
+        multisig = types.CheckMultiSig()
+        multisig.num_pubkeys = 2
+        script = [types.Push(b'\x01\x02'), types.Assumption('a'), types.Pick(), types.Five(),
+                  types.Push(b'\x01\x02'), multisig, types.InnerScript([types.Add()]), types.Verify()]
+        items = PackedList(script)
+        self.assertEqual(script, list(items))
+        self.assertEqual(script, LInstructions(PackedLInstructions(LInstructions(script))))
+        self.assertEqual(2, items[5].num_pubkeys)
+        self.assertIsNot(items[5], multisig)
+        # Equal payloads are stored once.
+        self.assertEqual(items.operands[0], items.operands[4])
+
+    def test_edits(self):
+        rng = random.Random(0)
+        nodes = [types.Add(), types.Swap(), types.Push(b'\x01'), types.Push(b'\x02'), types.Assumption('b')]
+        expected = [rng.choice(nodes) for _ in range(30)]
+        items = PackedList(expected)
+        for i in range(300):
+            start = rng.randrange(len(expected) + 1)
+            end = rng.randrange(start, min(len(expected), start + 10) + 1)
+            values = [rng.choice(nodes) for _ in range(rng.randrange(12))]
+            expected[start:end] = values
+            items[start:end] = values
+            self.assertEqual(expected, list(items))
+            if expected:
+                idx = rng.randrange(-len(expected), len(expected))
+                self.assertEqual(expected[idx], items[idx])
+
+    def test_slices(self):
+        """Slice indices are clamped like those of list slices."""
+        script = [types.Add(), types.Swap(), types.Push(b'\x01')]
+        items = PackedList(script)
+        self.assertEqual(script[:2], items[-5:2])
+        self.assertEqual(script[1:], items[-2:])
+        del items[-5:-1]
+        self.assertEqual([types.Push(b'\x01')], list(items))
+        items[-5:0] = [types.Five()]
+        self.assertEqual([types.Five(), types.Push(b'\x01')], list(items))
+        items[5:] = [types.Six()]
+        self.assertEqual([types.Five(), types.Push(b'\x01'), types.Six()], list(items))
+
+class PackedInstructionsTest(unittest.TestCase):
+    def test_find_occurrences(self):
+        script = [types.Push(b'\x05'), types.Return(), types.Five(), types.Push(b'\x06'), types.Return()]
+        instructions = PackedLInstructions(script)
+        self.assertEqual([1, 4], instructions.find_occurrences(types.Return()))
+        self.assertEqual([3], instructions.find_occurrences(types.Push(b'\x06')))
+        self.assertEqual(LInstructions(script).find_occurrences(types.Five()), instructions.find_occurrences(types.Five()))
+
+    def test_replace_template(self):
+        script = [types.Push(b'\x05'), types.Five(), types.Add(), types.Six(), types.Assumption('a'), types.Add()]
+        template = [types.SmallIntOpCode(), types.Assumption(), types.Add()]
+        callback = lambda values: [types.Sub()]
+        expected = LInstructions(script)
+        instructions = PackedLInstructions(script)
+        expected.replace_template(template, callback, strict=False)
+        instructions.replace_template(template, callback, strict=False)
+        self.assertEqual(expected, instructions)
+
+    def test_optimize(self):
+        ops = [types.Five(), types.Six()] + [types.Swap() for _ in range(10)] + [types.Add(), types.Verify()]
+        script = [op.__class__() for _ in range(60) for op in ops] + [types.Push(b'\x07'), types.Return()]
+        expected = LInstructions(script)
+        instructions = PackedLInstructions(script)
+        PeepholeOptimizer().optimize(expected)
+        PeepholeOptimizer().optimize(instructions)
+        self.assertEqual(expected, instructions)
@@ -0,0 +1,26 @@
+import unittest
+
+from txsc import parsing
+from txsc.txscript import ScriptParser
+
+class ParserPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = parsing.ParserPool()
+        self.pool.register('txscript', ScriptParser)
+
+    def test_reuse(self):
+        with self.pool.borrow('txscript') as parser:
+            first = parser
+        with self.pool.borrow('txscript') as parser:
+            self.assertIs(first, parser)
+
+    def test_nested_borrows(self):
+        with self.pool.borrow('txscript') as parser:
+            with self.pool.borrow('txscript') as other:
+                self.assertIsNot(parser, other)
+
+    def test_reset_line_numbers(self):
+        for _ in range(2):
+            with self.pool.borrow('txscript') as parser:
+                module = parser.parse('5;\n6;\n')
+                self.assertEqual([1, 2], [i.lineno for i in module.body])
@@ -0,0 +1,224 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from txsc import cache, server
+from txsc.script_compiler import ScriptCompiler
+
+class ProtocolTest(unittest.TestCase):
+    def setUp(self):
+        self.a, self.b = socket.socketpair()
+
+    def tearDown(self):
+        self.a.close()
+        self.b.close()
+
+    def test_round_trip(self):
+        for obj in [{'argv': ['5;', '-t', 'asm'], 'cwd': '/'}, {}, [1, 2], 'x' * 100000]:
+            server.write_message(self.a, obj)
+            self.assertEqual(obj, server.read_message(self.b))
+
+    def test_closed(self):
+        self.a.close()
+        self.assertIsNone(server.read_message(self.b))
+
+    def test_invalid(self):
+        self.a.sendall(server.encode_message({})[:2])
+        self.a.close()
+        self.assertRaises(server.ProtocolError, server.read_message, self.b)
+
+    def test_too_large(self):
+        self.a.sendall('\xff\xff\xff\xff')
+        self.assertRaises(server.ProtocolError, server.read_message, self.b)
+
+    def test_parse_address(self):
+        self.assertEqual(('localhost', 8000), server.parse_address('8000'))
+        self.assertEqual(('127.0.0.1', 8000), server.parse_address('127.0.0.1:8000'))
+        self.assertEqual('/tmp/txsc.sock', server.parse_address('/tmp/txsc.sock'))
+
+    def test_is_loopback(self):
+        self.assertTrue(server.is_loopback('localhost'))
+        self.assertTrue(server.is_loopback('127.0.0.1'))
+        self.assertFalse(server.is_loopback('0.0.0.0'))
+        self.assertFalse(server.is_loopback('8.8.8.8'))
+
+    def test_reads_stdin(self):
+        self.assertTrue(server.reads_stdin(['--batch']))
+        self.assertTrue(server.reads_stdin(['--batch', '-', '-t', 'asm']))
+        self.assertFalse(server.reads_stdin(['--batch', 'scripts']))
+        self.assertFalse(server.reads_stdin(['5;', '-t', 'asm']))
+
+class RunCommandTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.compiler = ScriptCompiler()
+
+    def test_output(self):
+        response = server.run_command(self.compiler, ['2 + 5;', '-t', 'asm', '-c', '-'], os.getcwd())
+        self.assertEqual({'stdout': '7\n', 'status': 0}, {k: response[k] for k in ['stdout', 'status']})
+        self.assertIn('Implicit push', response['stderr'])
+
+    def test_errors(self):
+        response = server.run_command(self.compiler, ['verify b;', '-c', '-'], os.getcwd())
+        self.assertEqual(1, response['status'])
+        self.assertIn('Symbol "b" was not declared.', response['stdout'])
+
+        response = server.run_command(self.compiler, ['5;', '-t', 'nope'], os.getcwd(), prog='txsc')
+        self.assertEqual(2, response['status'])
+        self.assertIn('txsc: error: argument -t/--target', response['stderr'])
+
+    def test_stdin(self):
+        response = server.run_command(self.compiler, ['--batch', '-t', 'asm', '-O', '1'], os.getcwd(),
+                                      stdin='{"id": 1, "source": "2 + 5;"}\n')
+        self.assertEqual(0, response['status'])
+        self.assertEqual('{"id": 1, "output": "2 5 ADD", "success": true}\n', response['stdout'])
+
+class CompileServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        cache.set_cache_dir(self.directory)
+        self.address = os.path.join(self.directory, 'server.sock')
+        self.server = server.CompileServer(self.address, 1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.sock = server.connect(self.address)
+
+    def tearDown(self):
+        self.sock.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.close()
+        cache.set_cache_dir(None)
+        shutil.rmtree(self.directory)
+
+    def test_requests(self):
+        response = server.request(self.sock, {'argv': ['2 + 5;', '-t', 'asm', '-c', '-'], 'cwd': self.directory})
+        self.assertEqual((0, '7\n'), (response['status'], response['stdout']))
+        response = server.request(self.sock, {'job': {'id': 1, 'source': '2 + 5;', 'target_lang': 'asm', 'optimization': 1}})
+        self.assertEqual({'id': 1, 'success': True, 'output': '2 5 ADD'}, response)
+        self.assertEqual({'error': 'Invalid request.'}, server.request(self.sock, {'foo': 1}))
+
+    def test_shared_compiler(self):
+        """Commands and jobs share the worker's compiler, but errors in jobs are still reported as results."""
+        response = server.request(self.sock, {'argv': ['2 + 5;', '-t', 'asm', '-c', '-'], 'cwd': self.directory})
+        self.assertEqual(0, response['status'])
+        response = server.request(self.sock, {'job': {'id': 1, 'source': 'verify b;'}})
+        self.assertEqual((1, False), (response['id'], response['success']))
+        self.assertEqual('IRError', response['error']['type'])
+
+    def test_timeout(self):
+        self.server.timeout = 1e-9
+        response = server.request(self.sock, {'argv': ['2 + 5;'], 'cwd': self.directory})
+        self.assertEqual(1, response['status'])
+        self.assertIn('timed out', response['stderr'])
+        # The worker is replaced.
+        self.server.timeout = server.DEFAULT_TIMEOUT
+        response = server.request(self.sock, {'argv': ['2 + 5;', '-t', 'asm', '-c', '-'], 'cwd': self.directory})
+        self.assertEqual((0, '7\n'), (response['status'], response['stdout']))
+
+    def test_batch(self):
+        """Batches with more than one process are compiled in the worker."""
+        os.mkdir(os.path.join(self.directory, 'scripts'))
+        for name in ['a', 'b']:
+            with open(os.path.join(self.directory, 'scripts', name + '.txscript'), 'w') as f:
+                f.write('2 + 5;')
+        response = server.request(self.sock, {'argv': ['--batch', 'scripts', '-j', '2', '-t', 'asm', '-O', '1'], 'cwd': self.directory})
+        self.assertEqual(0, response['status'], response['stderr'])
+        self.assertEqual(2, response['stdout'].count('"output": "2 5 ADD"'))
+
+    def test_stdin(self):
+        response = server.request(self.sock, {'argv': ['--batch', '-t', 'asm', '-O', '1'], 'cwd': self.directory,
+                                              'stdin': '{"id": 1, "source": "2 + 5;"}\n'})
+        self.assertEqual((0, '{"id": 1, "output": "2 5 ADD", "success": true}\n'), (response['status'], response['stdout']))
+
+class SocketFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        cache.set_cache_dir(self.directory)
+        self.address = os.path.join(self.directory, 'server.sock')
+
+    def tearDown(self):
+        cache.set_cache_dir(None)
+        shutil.rmtree(self.directory)
+
+    def bind_socket(self, path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        return sock
+
+    def test_existing_file(self):
+        """Files that are not sockets are not replaced."""
+        with open(self.address, 'w') as f:
+            f.write('notes')
+        self.assertRaises(ValueError, server.CompileServer, self.address, 1)
+        with open(self.address) as f:
+            self.assertEqual('notes', f.read())
+
+    def test_existing_server(self):
+        """Sockets that a server listens on are not replaced."""
+        sock = self.bind_socket(self.address)
+        sock.listen(1)
+        try:
+            file_id = server.get_file_id(self.address)
+            self.assertRaises(ValueError, server.CompileServer, self.address, 1)
+            self.assertEqual(file_id, server.get_file_id(self.address))
+        finally:
+            sock.close()
+
+    def test_stale_socket(self):
+        """Sockets that no server listens on are replaced."""
+        self.bind_socket(self.address).close()
+        self.assertRaises(socket.error, server.connect, self.address)
+        compile_server = server.CompileServer(self.address, 1)
+        try:
+            server.connect(self.address).close()
+        finally:
+            compile_server.close()
+        self.assertFalse(os.path.exists(self.address))
+
+    def test_replaced_socket(self):
+        """The socket is not removed on close if it has been replaced."""
+        compile_server = server.CompileServer(self.address, 1)
+        os.remove(self.address)
+        sock = self.bind_socket(self.address)
+        try:
+            compile_server.close()
+            self.assertTrue(os.path.exists(self.address))
+        finally:
+            sock.close()
+
+class TCPServerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        cache.set_cache_dir(self.directory)
+
+    def tearDown(self):
+        cache.set_cache_dir(None)
+        shutil.rmtree(self.directory)
+
+    def test_loopback_only(self):
+        self.assertRaises(ValueError, server.CompileServer, ('0.0.0.0', 0), 1)
+
+    def test_token(self):
+        compile_server = server.CompileServer(('127.0.0.1', 0), 1)
+        thread = threading.Thread(target=compile_server.serve_forever)
+        thread.start()
+        address = '127.0.0.1:%d' % compile_server.address[1]
+        sock = server.connect(address)
+        try:
+            token_path = server.get_token_path(compile_server.address)
+            self.assertEqual(0o600, os.stat(token_path).st_mode & 0o777)
+            req = {'argv': ['2 + 5;', '-t', 'asm', '-c', '-'], 'cwd': self.directory}
+            self.assertEqual({'error': 'Invalid token.'}, server.request(sock, req))
+            self.assertEqual({'error': 'Invalid token.'}, server.request(sock, dict(req, token='0' * 32)))
+            response = server.request(sock, dict(req, token=server.read_token(address)))
+            self.assertEqual((0, '7\n'), (response['status'], response['stdout']))
+        finally:
+            sock.close()
+            compile_server.shutdown()
+            thread.join()
+            compile_server.close()
+        self.assertFalse(os.path.exists(token_path))
@@ -0,0 +1,54 @@
+import unittest
+import ast
+
+from txsc.symbols import SymbolTable, SymbolType
+from txsc.txscript import ScriptParser, ScriptTransformer, StructuralScriptParser
+
+
+class StructuralParserTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.script_parser = ScriptParser(debug=False)
+        cls.parser = StructuralScriptParser(debug=False)
+
+    def _transform(self, s):
+        """Parse s with the two-pass front end."""
+        t = self.script_parser.parse(s)
+        if not isinstance(t, ast.Module):
+            t = ast.Module(body=t)
+        ast.fix_missing_locations(t)
+        transformer = ScriptTransformer(SymbolTable())
+        return transformer, transformer.visit(t)
+
+    def _test_equivalent(self, s):
+        transformer, expected = self._transform(s)
+        node = self.parser.parse(s, SymbolTable())
+        self.assertEqual(transformer.dump(expected), transformer.dump(node))
+        return node
+
+    def test_equivalent(self):
+        for s in [
+            'verify 5 + 2 == 7;',
+            'let a = 5; let mutable b = a * 2; b += 1; verify b > a;',
+            'func int foo(x, y) { return x + y; } verify foo(1, 2) == 3;',
+            'if 1 { verify 2; } else { verify 3; }',
+            'assume a; verify min(a, 0x05) == -2;',
+        ]:
+            self._test_equivalent(s)
+
+    def test_line_numbers(self):
+        node = self._test_equivalent('let a = 5;\nverify\n  a + 1 == 6;')
+        verify = node.statements[1]
+        self.assertEqual(2, verify.lineno)
+        self.assertEqual(3, verify.test.lineno)
+
+    def test_value_types(self):
+        src = ['let h = address_to_hash160("1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2");',
+               'let a = 5;', 'let b = \'05\';', 'let c = "abc";', 'let d = a;',
+               'let e = 2 + 3;', 'let f = -4;', 'let g = min(a, 2);']
+        expected = [SymbolType.Expr, SymbolType.Integer, SymbolType.ByteArray, SymbolType.ByteArray,
+                    SymbolType.Symbol, SymbolType.Expr, SymbolType.Expr, SymbolType.Expr]
+        # Literals are marked on their nodes, so freed nodes cannot affect the types of later nodes.
+        for _ in range(20):
+            node = self._test_equivalent(' '.join(src))
+            self.assertEqual(expected, [i.type_ for i in node.statements])
@@ -1,3 +1,4 @@
 from script_parser import ScriptParser
 from script_transformer import ScriptTransformer, ParsingError
+from structural_parser import StructuralScriptParser
 from txscript_language import TxScriptLanguage
@@ -1,23 +1,43 @@
 import ast
+import sys
 
-from ply import lex, yacc
-
+from txsc import parsing
 import lexer
 
-class ScriptParser(object):
+class BaseScriptParser(object):
+    """TxScript grammar.
+
+    Each production's action is delegated to the subclass method named
+    after it, with "build_" in place of "p_". Like a PLY action, that
+    method sets p[0] to the node for the production.
+    """
     tokens = lexer.tokens
     precedence = lexer.precedence
+    start = 'module'
+    # Name of the parser tables. Subclasses that change grammar actions must use their own name.
+    table_name = None
 
     def __init__(self, **kwargs):
         self.debug = False
         for k, v in kwargs.items():
             setattr(self, k, v)
-        self.lexer = lex.lex(module=lexer)
-        self.parser = yacc.yacc(module=self, debug=self.debug)
+        lexer_modules = [lexer, sys.modules[__name__]]
+        self.lexer = parsing.build_lexer('txscript', lexer_modules, module=lexer)
+        # The modules that define grammar actions.
+        grammar_modules = [lexer] + [sys.modules[cls.__module__] for cls in type(self).__mro__[:-1]]
+        self.parser = parsing.build_parser(self.table_name, grammar_modules, module=self, debug=self.debug)
 
     def parse(self, s):
         return self.parser.parse(s, lexer=self.lexer, tracking=True)
 
+    def reset(self):
+        """Reset the state of the lexer so that it can be reused.
+
+        The parser resets its own state at the start of each parse.
+        """
+        self.lexer.input('')
+        self.lexer.lineno = 1
+
     def get_bin_op(self, s):
         """Get the BinOp class for s."""
         op = None
@@ -52,6 +72,153 @@ class ScriptParser(object):
         '''module : statement
                   | module statement
         '''
+        self.build_module(p)
+
+    def p_ifbody(self, p):
+        '''ifbody : module
+                  |
+        '''
+        self.build_ifbody(p)
+
+    def p_conditional(self, p):
+        '''statement : IF expr LBRACE ifbody RBRACE
+                     | IF expr LBRACE ifbody RBRACE ELSE LBRACE ifbody RBRACE
+        '''
+        self.build_conditional(p)
+
+    def p_declaration(self, p):
+        '''statement : LET NAME EQUALS expr SEMICOLON
+                     | LET MUTABLE NAME EQUALS expr SEMICOLON
+        '''
+        self.build_declaration(p)
+
+    def p_aug_assignment_op(self, p):
+        '''augassign : PLUSEQUALS
+                     | MINUSEQUALS
+                     | TIMESEQUALS
+                     | DIVIDEEQUALS
+                     | MODEQUALS
+                     | LSHIFTEQUALS
+                     | RSHIFTEQUALS
+                     | AMPERSANDEQUALS
+                     | CARETEQUALS
+                     | PIPEEQUALS
+        '''
+        self.build_aug_assignment_op(p)
+
+    def p_unary_aug_assignment_op(self, p):
+        '''unaryaugassign : INCREMENT
+                          | DECREMENT
+        '''
+        self.build_unary_aug_assignment_op(p)
+
+    def p_statement_unary_aug_assign(self, p):
+        '''statement : NAME unaryaugassign SEMICOLON'''
+        self.build_statement_unary_aug_assign(p)
+
+    def p_statement_assign(self, p):
+        '''statement : NAME EQUALS expr SEMICOLON
+                     | NAME augassign expr SEMICOLON
+        '''
+        self.build_statement_assign(p)
+
+    def p_function_args(self, p):
+        '''args : expr
+                | args COMMA expr
+                |
+        '''
+        self.build_function_args(p)
+
+    def p_function_define(self, p):
+        '''statement : FUNC TYPENAME NAME LPAREN args RPAREN LBRACE module RBRACE'''
+        self.build_function_define(p)
+
+    def p_assume(self, p):
+        '''statement : ASSUME args SEMICOLON'''
+        self.build_assume(p)
+
+    def p_return(self, p):
+        '''statement : RETURN expr SEMICOLON'''
+        self.build_return(p)
+
+    def p_function_call(self, p):
+        '''expr : NAME LPAREN args RPAREN
+                | TYPENAME LPAREN args RPAREN
+        '''
+        self.build_function_call(p)
+
+    def p_boolop(self, p):
+        '''expr : expr AND expr
+                | expr OR expr
+        '''
+        self.build_boolop(p)
+
+    def p_expr_unaryop(self, p):
+        '''expr : MINUS expr %prec UNARYOP
+                | TILDE expr %prec UNARYOP
+                | NOT expr %prec UNARYOP
+        '''
+        self.build_expr_unaryop(p)
+
+    def p_verify(self, p):
+        '''expr : VERIFY expr'''
+        self.build_verify(p)
+
+    def p_expr_binop(self, p):
+        '''expr : expr PLUS expr
+                | expr MINUS expr
+                | expr TIMES expr
+                | expr DIVIDE expr
+                | expr MOD expr
+                | expr LSHIFT expr
+                | expr RSHIFT expr
+                | expr AMPERSAND expr
+                | expr CARET expr
+                | expr PIPE expr
+        '''
+        self.build_expr_binop(p)
+
+    def p_expr_compare(self, p):
+        '''expr : expr EQUALITY expr
+                | expr INEQUALITY expr
+                | expr LESSTHAN expr
+                | expr GREATERTHAN expr
+                | expr LESSTHANOREQUAL expr
+                | expr GREATERTHANOREQUAL expr
+        '''
+        self.build_expr_compare(p)
+
+    def p_expr_hexstr(self, p):
+        '''expr : HEXSTR'''
+        self.build_expr_hexstr(p)
+
+    def p_expr_str(self, p):
+        '''expr : STR'''
+        self.build_expr_str(p)
+
+    def p_expr_name(self, p):
+        '''expr : NAME'''
+        self.build_expr_name(p)
+
+    def p_expr_group(self, p):
+        '''expr : LPAREN expr RPAREN'''
+        p[0] = p[2]
+
+    def p_expr_number(self, p):
+        '''expr : NUMBER'''
+        self.build_expr_number(p)
+
+    def p_statement_expr(self, p):
+        '''statement : expr SEMICOLON
+                     | PUSH expr SEMICOLON
+        '''
+        self.build_statement_expr(p)
+
+class ScriptParser(BaseScriptParser):
+    """Parser that produces a Python AST."""
+    table_name = 'txscript'
+
+    def build_module(self, p):
         p[1].lineno = p.lineno(1)
         if isinstance(p[1], ast.Module):
             p[0] = p[1]
@@ -63,20 +230,14 @@ class ScriptParser(object):
             p[2].lineno = p.lineno(2)
             p[0].body.append(p[2])
 
-    def p_ifbody(self, p):
-        '''ifbody : module
-                  |
-        '''
+    def build_ifbody(self, p):
         if len(p) == 1:
             module = ast.Module(body=[])
         else:
             module = p[1]
         p[0] = module
 
-    def p_conditional(self, p):
-        '''statement : IF expr LBRACE ifbody RBRACE
-                     | IF expr LBRACE ifbody RBRACE ELSE LBRACE ifbody RBRACE
-        '''
+    def build_conditional(self, p):
         test = p[2]
         iftrue = p[4]
         iftrue.lineno = p.lineno(4)
@@ -87,10 +248,7 @@ class ScriptParser(object):
 
         p[0] = ast.If(test=test, body=iftrue, orelse=iffalse)
 
-    def p_declaration(self, p):
-        '''statement : LET NAME EQUALS expr SEMICOLON
-                     | LET MUTABLE NAME EQUALS expr SEMICOLON
-        '''
+    def build_declaration(self, p):
         if p[2] == 'mutable':
             name = p[3]
             value = p[5]
@@ -105,27 +263,13 @@ class ScriptParser(object):
         p[0].mutable = mutable
         p[0].declaration = True
 
-    def p_aug_assignment_op(self, p):
-        '''augassign : PLUSEQUALS
-                     | MINUSEQUALS
-                     | TIMESEQUALS
-                     | DIVIDEEQUALS
-                     | MODEQUALS
-                     | LSHIFTEQUALS
-                     | RSHIFTEQUALS
-                     | AMPERSANDEQUALS
-                     | CARETEQUALS
-                     | PIPEEQUALS
-        '''
+    def build_aug_assignment_op(self, p):
         op = p[1]
         base_op = op[:-1]
         bin_op = self.get_bin_op(base_op)
         p[0] = bin_op
 
-    def p_unary_aug_assignment_op(self, p):
-        '''unaryaugassign : INCREMENT
-                          | DECREMENT
-        '''
+    def build_unary_aug_assignment_op(self, p):
         op = p[1]
         bin_op = ast.BinOp()
         bin_op.right = ast.Num(1)
@@ -135,18 +279,14 @@ class ScriptParser(object):
             bin_op.op = ast.Sub()
         p[0] = bin_op
 
-    def p_statement_unary_aug_assign(self, p):
-        '''statement : NAME unaryaugassign SEMICOLON'''
+    def build_statement_unary_aug_assign(self, p):
         bin_op = p[2]
         bin_op.left = ast.Name(id=p[1], ctx=ast.Load())
         p[0] = ast.AugAssign(target=ast.Name(id=p[1], ctx=ast.Store()),
             op=bin_op.op,
             value=bin_op.right)
 
-    def p_statement_assign(self, p):
-        '''statement : NAME EQUALS expr SEMICOLON
-                     | NAME augassign expr SEMICOLON
-        '''
+    def build_statement_assign(self, p):
         name = p[1]
         value = p[3]
         target = ast.Name(id=name, ctx=ast.Store())
@@ -160,11 +300,7 @@ class ScriptParser(object):
                 value=value)
         p[0].declaration = False
 
-    def p_function_args(self, p):
-        '''args : expr
-                | args COMMA expr
-                |
-        '''
+    def build_function_args(self, p):
         args = []
         if len(p) > 1:
             args = [p[1]]
@@ -175,46 +311,33 @@ class ScriptParser(object):
         p[0] = ast.List(elts=args, ctx=ast.Store())
         p[0].is_arguments = True
 
-    def p_function_define(self, p):
-        '''statement : FUNC TYPENAME NAME LPAREN args RPAREN LBRACE module RBRACE'''
+    def build_function_define(self, p):
         func_name = p[3]
         args = p[5]
         body = p[8].body
         p[0] = ast.FunctionDef(name=func_name, args=ast.arguments(args=args), body=body)
         p[0].type_name = p[2]
 
-    def p_assume(self, p):
-        '''statement : ASSUME args SEMICOLON'''
+    def build_assume(self, p):
         if not all(isinstance(i, ast.Name) for i in p[2].elts):
             raise Exception('Assumptions can only be assigned to names.')
         p[0] = ast.Assign(targets=[ast.Name(id='_stack', ctx=ast.Store())], value=p[2])
         p[0].mutable = False
         p[0].declaration = True
 
-    def p_return(self, p):
-        '''statement : RETURN expr SEMICOLON'''
+    def build_return(self, p):
         p[0] = ast.Return(p[2])
 
-    def p_function_call(self, p):
-        '''expr : NAME LPAREN args RPAREN
-                | TYPENAME LPAREN args RPAREN
-        '''
+    def build_function_call(self, p):
         p[0] = ast.Call(func=ast.Name(id=p[1], ctx=ast.Load()),
                 args=p[3].elts,
                 keywords=[])
 
-    def p_boolop(self, p):
-        '''expr : expr AND expr
-                | expr OR expr
-        '''
+    def build_boolop(self, p):
         op = ast.And() if p[2] == 'and' else ast.Or()
         p[0] = ast.BoolOp(op=op, values=[p[1], p[3]])
 
-    def p_expr_unaryop(self, p):
-        '''expr : MINUS expr %prec UNARYOP
-                | TILDE expr %prec UNARYOP
-                | NOT expr %prec UNARYOP
-        '''
+    def build_expr_unaryop(self, p):
         op = None
         if p[1] == '-':
             op = ast.USub()
@@ -225,33 +348,14 @@ class ScriptParser(object):
 
         p[0] = ast.UnaryOp(op=op, operand=p[2])
 
-    def p_verify(self, p):
-        '''expr : VERIFY expr'''
+    def build_verify(self, p):
         p[0] = ast.Assert(test=p[2], msg=None)
 
-    def p_expr_binop(self, p):
-        '''expr : expr PLUS expr
-                | expr MINUS expr
-                | expr TIMES expr
-                | expr DIVIDE expr
-                | expr MOD expr
-                | expr LSHIFT expr
-                | expr RSHIFT expr
-                | expr AMPERSAND expr
-                | expr CARET expr
-                | expr PIPE expr
-        '''
+    def build_expr_binop(self, p):
         op = self.get_bin_op(p[2])
         p[0] = ast.BinOp(left=p[1], op=op, right=p[3])
 
-    def p_expr_compare(self, p):
-        '''expr : expr EQUALITY expr
-                | expr INEQUALITY expr
-                | expr LESSTHAN expr
-                | expr GREATERTHAN expr
-                | expr LESSTHANOREQUAL expr
-                | expr GREATERTHANOREQUAL expr
-        '''
+    def build_expr_compare(self, p):
         op = None
         if p[2] == '==':
             op = ast.Eq()
@@ -268,8 +372,7 @@ class ScriptParser(object):
 
         p[0] = ast.Compare(left=p[1], ops=[op], comparators=[p[3]])
 
-    def p_expr_hexstr(self, p):
-        '''expr : HEXSTR'''
+    def build_expr_hexstr(self, p):
         s = p[1].replace('\'','')
         try:
             _ = int(s, 16)
@@ -278,29 +381,21 @@ class ScriptParser(object):
         byte_arr = [s[i:i+2] for i in range(0, len(s), 2)]
         p[0] = ast.List(elts=byte_arr, ctx=ast.Store())
 
-    def p_expr_str(self, p):
-        '''expr : STR'''
+    def build_expr_str(self, p):
         p[0] = ast.Str(p[1][1:-1])
 
-    def p_expr_name(self, p):
-        '''expr : NAME'''
+    def build_expr_name(self, p):
         p[0] = ast.Name(id=p[1], ctx=ast.Load())
 
-    def p_expr_group(self, p):
-        '''expr : LPAREN expr RPAREN'''
-        p[0] = p[2]
-
-    def p_expr_number(self, p):
-        '''expr : NUMBER'''
+    def build_expr_number(self, p):
         p[0] = ast.Num(n=p[1])
 
-    def p_statement_expr(self, p):
-        '''statement : expr SEMICOLON
-                     | PUSH expr SEMICOLON
-        '''
+    def build_statement_expr(self, p):
         if len(p) == 3:
             p[0] = p[1]
         else:
             p[0] = ast.Call(func=ast.Name(id='_push', ctx=ast.Load()),
                     args=[p[2]],
                     keywords=[])
+
+parsing.register_parser('txscript', ScriptParser)
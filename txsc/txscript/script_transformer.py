@@ -120,6 +120,31 @@ class ParsingCheckError(ParsingError):
     """Exception raised when a builtin check_*() function fails."""
     pass
 
+def op_function_call(name, args):
+    """Create the OpCode for a call to the opcode function name.
+
+    args must be structural nodes.
+    """
+    op_func = get_op_func(name)
+    if not op_func:
+        raise ParsingNameError('No function "%s" exists.' % name)
+    # Ensure the number of args is correct.
+    if op_func.nargs != -1 and len(args) != op_func.nargs:
+        raise ParsingError('%s() requires %d arguments (got %d)' % (op_func.name, op_func.nargs, len(args)))
+
+    # Unary opcode.
+    if op_func.nargs == 1:
+        return types.UnaryOpCode(name = op_func.op_name,
+                operand = args[0])
+    # Binary opcode.
+    elif op_func.nargs == 2:
+        return types.BinOpCode(name = op_func.op_name,
+                left = args[0], right = args[1])
+    # Variable arguments.
+    else:
+        return types.VariableArgsOpCode(name = op_func.op_name,
+                operands = list(args))
+
 class ScriptTransformer(BaseTransformer):
     """Transforms input into a structural intermediate representation."""
     @staticmethod
@@ -279,27 +304,11 @@ class ScriptTransformer(BaseTransformer):
 
     def visit_op_function_call(self, node):
         """Transform a function call into its corresponding OpCode."""
-        op_func = get_op_func(node.func.id)
-        if not op_func:
+        if not get_op_func(node.func.id):
             raise ParsingNameError('No function "%s" exists.' % node.func.id)
         # Ensure args have been visited.
         node.args = self.map_visit(node.args)
-        # Ensure the number of args is correct.
-        if op_func.nargs != -1 and len(node.args) != op_func.nargs:
-            raise ParsingError('%s() requires %d arguments (got %d)' % (op_func.name, op_func.nargs, len(node.args)))
-
-        # Unary opcode.
-        if op_func.nargs == 1:
-            return types.UnaryOpCode(name = op_func.op_name,
-                    operand = node.args[0])
-        # Binary opcode.
-        elif op_func.nargs == 2:
-            return types.BinOpCode(name = op_func.op_name,
-                    left = node.args[0], right = node.args[1])
-        # Variable arguments.
-        else:
-            return types.VariableArgsOpCode(name = op_func.op_name,
-                    operands = list(node.args))
+        return op_function_call(node.func.id, node.args)
 
     def visit_Call(self, node):
         # User-defined function.
@@ -0,0 +1,273 @@
+"""TxScript parser that produces the structural intermediate representation.
+
+StructuralScriptParser has the same grammar as ScriptParser (see BaseScriptParser),
+but its grammar actions build txsc.ir.structural_nodes directly instead of Python AST nodes.
+This skips the intermediate AST and the ScriptTransformer pass over it.
+
+Every node is given the line number of the first token it was parsed from.
+"""
+import ast
+
+import hexs
+
+from txsc.symbols import SymbolType
+import txsc.ir.structural_nodes as types
+from txsc import parsing
+from script_parser import BaseScriptParser
+from script_transformer import (BuiltinFunctions, ParsingError, ParsingCheckError,
+        ScriptTransformer, binary_ops, unary_ops, op_function_call)
+from txsc.ir import formats
+
+# Unary operators and the names of their AST classes.
+unary_operators = {
+    '-': 'USub',
+    '~': 'Invert',
+    'not': 'Not',
+}
+
+# Comparison operators and the names of their AST classes.
+comparison_operators = {
+    '==': 'Eq',
+    '<': 'Lt',
+    '>': 'Gt',
+    '<=': 'LtE',
+    '>=': 'GtE',
+}
+
+class StructuralBuiltinFunctions(BuiltinFunctions):
+    """Handler for "built-in" functions whose arguments are structural nodes."""
+    def __init__(self):
+        super(StructuralBuiltinFunctions, self).__init__(None)
+
+    def visit(self, node):
+        return node
+
+    def map_visit(self, nodes):
+        return list(nodes)
+
+    def builtin_address_to_hash160(self, arg):
+        """Check that arg is an address and convert it to bytes."""
+        # String literals keep their original value in "s".
+        if not isinstance(arg, types.Bytes) or getattr(arg, 's', None) is None:
+            raise ParsingCheckError('address_to_hash_160 failed: A string is required')
+        try:
+            data = formats.address_to_bytearray(arg.s)
+        except Exception:
+            raise ParsingCheckError('address_to_hash_160 failed: Invalid address (%s)' % arg.s)
+
+        return self._check_hash160(types.Bytes(data.encode('hex')), 'address_to_hash160')
+
+class StructuralScriptParser(BaseScriptParser):
+    """Parser that produces the structural intermediate representation."""
+    table_name = 'txscript_structural'
+
+    def __init__(self, **kwargs):
+        super(StructuralScriptParser, self).__init__(**kwargs)
+        self.builtins = StructuralBuiltinFunctions()
+        self.symbol_table = None
+
+    def parse(self, s, symbol_table=None):
+        """Parse s into a Script node.
+
+        Function definitions are added to symbol_table.
+        """
+        self.symbol_table = symbol_table
+        try:
+            return super(StructuralScriptParser, self).parse(s)
+        finally:
+            self.symbol_table = None
+
+    def reset(self):
+        super(StructuralScriptParser, self).reset()
+        self.symbol_table = None
+
+    def make_node(self, p, cls, *args, **kwargs):
+        """Create a node located at the first symbol of production p."""
+        node = cls(*args, **kwargs)
+        node.lineno = p.lineno(1)
+        return node
+
+    def make_literal(self, p, cls, *args, **kwargs):
+        """Create a node for a literal value.
+
+        Literal nodes have a "literal" attribute, which get_value_type() checks.
+        """
+        node = self.make_node(p, cls, *args, **kwargs)
+        node.literal = True
+        return node
+
+    def get_value_type(self, value):
+        """Get the SymbolType of a value that is assigned to a symbol."""
+        if getattr(value, 'literal', False):
+            return SymbolType.Integer if isinstance(value, types.Int) else SymbolType.ByteArray
+        elif isinstance(value, types.Symbol):
+            return SymbolType.Symbol
+        return SymbolType.Expr
+
+    def get_bin_op_name(self, s):
+        """Get the opcode name for the binary operator s."""
+        return binary_ops[self.get_bin_op(s).__class__.__name__]
+
+    def call(self, name, args):
+        """Create the node for a call to the function name."""
+        # User-defined function.
+        if self.symbol_table and self.symbol_table.lookup(name):
+            symbol = self.symbol_table.lookup(name)
+            if symbol.type_ != SymbolType.Func:
+                raise ParsingError('Cannot call "%s" of type %s' % (name, symbol.type_))
+            return types.FunctionCall(name, args)
+
+        # Handle "built-in" functions.
+        if self.builtins.is_builtin(name):
+            return self.builtins._call_builtin(name, args)
+        # Handle function calls that correspond to opcodes.
+        return op_function_call(name, args)
+
+    def build_module(self, p):
+        p[1].lineno = p.lineno(1)
+        if isinstance(p[1], types.Script):
+            p[0] = p[1]
+        else:
+            p[0] = self.make_node(p, types.Script, statements=[p[1]])
+
+        if len(p) == 3:
+            p[2].lineno = p.lineno(2)
+            p[0].statements.append(p[2])
+
+    def build_ifbody(self, p):
+        if len(p) == 1:
+            p[0] = types.Script(statements=[])
+        else:
+            p[0] = p[1]
+
+    def build_conditional(self, p):
+        iftrue = p[4]
+        iftrue.lineno = p.lineno(4)
+        iffalse = []
+        if len(p) > 6:
+            iffalse = p[8]
+            iffalse.lineno = p.lineno(8)
+
+        p[0] = self.make_node(p, types.If, test=p[2], truebranch=iftrue, falsebranch=iffalse)
+
+    def build_declaration(self, p):
+        if p[2] == 'mutable':
+            name, value, mutable = p[3], p[5], True
+        else:
+            name, value, mutable = p[2], p[4], False
+        p[0] = self.make_node(p, types.Declaration, name=name, value=value,
+                type_=self.get_value_type(value), mutable=mutable)
+
+    def build_aug_assignment_op(self, p):
+        p[0] = self.get_bin_op_name(p[1][:-1])
+
+    def build_unary_aug_assignment_op(self, p):
+        p[0] = self.get_bin_op_name(p[1][0])
+
+    def build_statement_unary_aug_assign(self, p):
+        value = self.make_node(p, types.BinOpCode, name=p[2],
+                left=self.make_node(p, types.Symbol, name=p[1]),
+                right=self.make_node(p, types.Int, 1))
+        p[0] = self.make_node(p, types.Assignment, name=p[1], value=value, type_=SymbolType.Expr)
+
+    def build_statement_assign(self, p):
+        name = p[1]
+        value = p[3]
+        if p[2] == '=':
+            type_ = self.get_value_type(value)
+        else:
+            value = self.make_node(p, types.BinOpCode, name=p[2],
+                    left=self.make_node(p, types.Symbol, name=name), right=value)
+            type_ = SymbolType.Expr
+        p[0] = self.make_node(p, types.Assignment, name=name, value=value, type_=type_)
+
+    def build_function_args(self, p):
+        if len(p) == 1:
+            p[0] = []
+        elif len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[0] = p[1]
+            p[0].append(p[3])
+
+    def build_function_define(self, p):
+        if not self.symbol_table:
+            raise Exception('Cannot define function. Parser was started without a symbol table.')
+        if not all(isinstance(i, types.Symbol) for i in p[5]):
+            raise Exception('Function parameters must be names.')
+        args = [ast.Name(id=i.name, ctx=ast.Load(), lineno=i.lineno) for i in p[5]]
+
+        type_name = ScriptTransformer.get_symbol_type(p[2])
+        func_def = self.make_node(p, types.Function, p[3], type_name, args, p[8].statements)
+        self.symbol_table.add_function_def(func_def)
+        p[0] = func_def
+
+    def build_assume(self, p):
+        if not all(isinstance(i, types.Symbol) for i in p[2]):
+            raise Exception('Assumptions can only be assigned to names.')
+        # '_stack' is an invalid variable name that signifies stack assumptions.
+        p[0] = self.make_node(p, types.Declaration, name='_stack', value=[i.name for i in p[2]],
+                type_=SymbolType.Expr, mutable=False)
+
+    def build_return(self, p):
+        p[0] = self.make_node(p, types.Return, p[2])
+
+    def build_function_call(self, p):
+        try:
+            node = self.call(p[1], p[3])
+        except ParsingError as e:
+            raise e.__class__(e.args[0], p.lineno(1), 0)
+        node.lineno = p.lineno(1)
+        # Built-in functions may return their argument, which is no longer a literal.
+        node.literal = False
+        p[0] = node
+
+    def build_boolop(self, p):
+        name = binary_ops['And'] if p[2] == 'and' else binary_ops['Or']
+        p[0] = self.make_node(p, types.BinOpCode, name=name, left=p[1], right=p[3])
+
+    def build_expr_unaryop(self, p):
+        name = unary_ops[unary_operators[p[1]]]
+        p[0] = self.make_node(p, types.UnaryOpCode, name=name, operand=p[2])
+
+    def build_verify(self, p):
+        p[0] = self.make_node(p, types.VerifyOpCode, name='OP_VERIFY', test=p[2])
+
+    def build_expr_binop(self, p):
+        p[0] = self.make_node(p, types.BinOpCode, name=self.get_bin_op_name(p[2]), left=p[1], right=p[3])
+
+    def build_expr_compare(self, p):
+        # Special case for NotEq (!=).
+        if p[2] == '!=':
+            binop = self.make_node(p, types.BinOpCode, name=binary_ops['Eq'], left=p[1], right=p[3])
+            p[0] = self.make_node(p, types.UnaryOpCode, name=unary_ops['Not'], operand=binop)
+        else:
+            name = binary_ops[comparison_operators[p[2]]]
+            p[0] = self.make_node(p, types.BinOpCode, name=name, left=p[1], right=p[3])
+
+    def build_expr_hexstr(self, p):
+        s = p[1].replace('\'','')
+        try:
+            _ = int(s, 16)
+        except ValueError:
+            raise Exception('Invalid hex literal.')
+        p[0] = self.make_literal(p, types.Bytes, hexs.format_hex(s))
+
+    def build_expr_str(self, p):
+        s = p[1][1:-1]
+        p[0] = self.make_literal(p, types.Bytes, s.encode('hex'))
+        p[0].s = s
+
+    def build_expr_name(self, p):
+        p[0] = self.make_node(p, types.Symbol, name=p[1])
+
+    def build_expr_number(self, p):
+        p[0] = self.make_literal(p, types.Int, p[1])
+
+    def build_statement_expr(self, p):
+        if len(p) == 3:
+            p[0] = p[1]
+        else:
+            p[0] = self.make_node(p, types.Push, p[2])
+
+parsing.register_parser('txscript_structural', StructuralScriptParser)
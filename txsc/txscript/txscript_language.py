@@ -1,10 +1,8 @@
-import ast
-from ply import yacc
-
 from txsc.ir.instructions import STRUCTURAL, SInstructions
 from txsc.language import Language
+from txsc import parsing
 from txsc.transformer import SourceVisitor
-from txsc.txscript import ScriptParser, ScriptTransformer, ParsingError
+from txsc.txscript import ParsingError
 from txsc.symbols import SymbolTable
 
 def get_lang():
@@ -13,23 +11,15 @@ def get_lang():
 class TxScriptSourceVisitor(SourceVisitor):
     """Wrapper around txscript classes."""
     ir_type = STRUCTURAL
-    def __init__(self, *args, **kwargs):
-        super(TxScriptSourceVisitor, self).__init__(*args, **kwargs)
-        # Set up yacc.
-        self.parser = ScriptParser()
 
     def transform(self, source, symbol_table):
         if isinstance(source, list):
             source = ''.join(source)
 
-        node = self.parser.parse(source)
-        if not isinstance(node, ast.Module):
-            node = ast.Module(body=node)
-        ast.fix_missing_locations(node)
-
-        # Convert AST to structural representation.
+        # Parse source directly into the structural representation.
         try:
-            node = ScriptTransformer(symbol_table).visit(node)
+            with parsing.borrow_parser('txscript_structural') as parser:
+                node = parser.parse(source, symbol_table)
         except ParsingError as e:
             lineno = e.args[1]
             msg = 'On line %d:\n\t' % lineno
@@ -37,7 +27,7 @@ class TxScriptSourceVisitor(SourceVisitor):
             msg += '\n' + e.args[0]
             raise e.__class__(msg)
 
-        return SInstructions(node)
+        return SInstructions(node, has_locations=True)
 
 
 class TxScriptLanguage(Language):